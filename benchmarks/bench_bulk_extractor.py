@@ -0,0 +1,39 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.bulk_extractor.parsers import BulkExtractorFileParser
+from corpus import write_email_features
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bulk_extractor feature file parser.')
+    parser.add_argument('-n', type=int, help='Number of lines in email.txt', default=1000000)
+    parser.add_argument('-u', type=int, help='Number of distinct email addresses', default=100000)
+    parser.add_argument('-r', type=int, help='Number of repetitions, the best is reported', default=3)
+    parser.add_argument('--seed', type=int, help='Seed for the email corpus', default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='tff_bench_')
+
+    try:
+        size = write_email_features(os.path.join(workdir, 'email.txt'), args.n, args.u, args.seed)
+        best = None
+
+        for _ in range(args.r):
+            start = time.perf_counter()
+            features = BulkExtractorFileParser(workdir).parse_email_features()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print('{} lines, {} features in {:.3f}s, {:,.0f} lines/s, {:.1f} MiB/s'.format(args.n,
+            len(features), best, args.n / best, size / float(1 << 20) / best))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tff.tcp_flow import parse_flow_name
+from corpus import flow_names
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the tcpflow file name parser.')
+    parser.add_argument('-n', type=int, help='Number of file names', default=1000000)
+    parser.add_argument('-r', type=int, help='Number of repetitions, the best is reported', default=3)
+    parser.add_argument('--seed', type=int, help='Seed for the name corpus', default=0)
+    parser.add_argument('--hosts', type=int, help='Number of distinct addresses', default=1000)
+    args = parser.parse_args()
+
+    names = flow_names(args.n, args.seed, args.hosts)
+    best = None
+
+    for _ in range(args.r):
+        start = time.perf_counter()
+        for name in names:
+            parse_flow_name(name)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print('{} names in {:.3f}s, {:,.0f} names/s'.format(len(names), best, len(names) / best))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tff.patterns import PatternMatcher, TYPED_PATTERNS, typed_pattern
+
+WORDS = ('the', 'data', 'request', 'server', 'value', 'index', 'session', 'token', 'user',
+         'file', 'version', 'host', 'length', 'content', 'type', 'accept', 'cookie', 'path')
+
+def write_text(size, density, seed):
+    '''
+    Returns size bytes of text made of random words and separators, with
+    density values of each typed pattern planted per MiB.
+
+    '''
+
+    rng = random.Random(seed)
+    samples = (lambda: '{}.{}@{}.com'.format(rng.choice(WORDS), rng.randrange(1000), rng.choice(WORDS)),
+               lambda: '4111 1111 1111 1111',
+               lambda: '.'.join(str(rng.randrange(256)) for _ in range(4)),
+               lambda: 'fe80::{:x}:{:x}'.format(rng.randrange(1 << 16), rng.randrange(1 << 16)),
+               lambda: 'www.{}.org'.format(rng.choice(WORDS)))
+    planted = max(1, size * density * len(samples) // (1 << 20))
+    parts = []
+    length = 0
+
+    while length < size:
+        if rng.randrange(size // 6 // planted + 1) == 0:
+            part = rng.choice(samples)()
+        else:
+            part = rng.choice(WORDS)
+
+        part += rng.choice((' ', ' ', ' ', ', ', '\n', '=', '/', ': '))
+        parts.append(part)
+        length += len(part)
+
+    return ''.join(parts).encode('utf-8')[:size]
+
+def finditer_search(compiled, buffer):
+    hits = 0
+
+    for (regex, validate) in compiled:
+        for match in regex.finditer(buffer):
+            if validate is None or validate(match.group().decode('utf-8', 'surrogateescape')):
+                hits += 1
+
+    return hits
+
+def matcher_search(matcher, buffer):
+    return sum(1 for _ in matcher.find_offsets(buffer))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the single pass pattern matcher '
+                'against a separate re.finditer per typed pattern.')
+    parser.add_argument('-s', '--size', type=int, help='Size of the searched text in MiB', default=16)
+    parser.add_argument('--hit-density', type=int, help='Values planted per pattern per MiB',
+                default=200)
+    parser.add_argument('-r', type=int, help='Number of repetitions, the best is reported', default=3)
+    parser.add_argument('--seed', type=int, help='Seed for the text', default=0)
+    args = parser.parse_args()
+
+    names = sorted(TYPED_PATTERNS)
+    buffer = write_text(args.size << 20, args.hit_density, args.seed)
+    matcher = PatternMatcher([typed_pattern(name) for name in names], binary=True)
+    compiled = [(re.compile(regex.encode('utf-8')), validate)
+                    for (regex, validate) in (TYPED_PATTERNS[name] for name in names)]
+
+    counts = {}
+
+    for (label, search, arg) in (('finditer', finditer_search, compiled),
+                                 ('matcher', matcher_search, matcher)):
+        best = None
+
+        for _ in range(args.r):
+            start = time.perf_counter()
+            hits = search(arg, buffer)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        counts[label] = hits
+        print('{}: {} patterns, {} hits in {:.3f}s, {:.1f} MiB/s'.format(label, len(names), hits,
+                best, args.size / best))
+
+    if counts['matcher'] != counts['finditer']:
+        sys.exit('[-] The single pass pattern matcher found {} hits, re.finditer found {}'.format(
+                    counts['matcher'], counts['finditer']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tff.matcher import TOKEN_DELIMITERS, build_matcher
+from tff.tcp_flow import iter_tcp_flows
+from corpus import generate_corpus
+
+def whole_tokens(tcp_flow, found_features, delimiter_re):
+    '''
+    Returns the hits of found_features that are delimited on both sides, the
+    hits the token engine is expected to find.  Features containing a
+    delimiter are never whole tokens.
+
+    '''
+
+    tokens = {}
+
+    with tcp_flow.open_bytes() as data:
+        for feature, positions in found_features.items():
+            if delimiter_re.search(feature.encode('utf-8')):
+                continue
+
+            length = len(feature.encode('utf-8'))
+
+            for position in positions:
+                end = position + length
+
+                if (position == 0 or delimiter_re.match(data[position - 1:position])) and \
+                        (end == len(data) or delimiter_re.match(data[end:end + 1])):
+                    tokens.setdefault(feature, []).append(position)
+
+    return tokens
+
+def scan(tcp_flows, features, matcher):
+    '''
+    Returns the found features of every flow, and the time taken to find them.
+
+    '''
+
+    results = {}
+    start = time.perf_counter()
+
+    for tcp_flow in tcp_flows:
+        tcp_flow.find_features('list', features, matcher)
+        results[tcp_flow.filename] = tcp_flow.get_found_features()['list']
+
+    return (results, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate the token engine against '
+                'TcpFlow.find_features with substring matching, and time both for growing '
+                'numbers of features.')
+    parser.add_argument('--features', type=str, help='Comma separated numbers of features',
+                default='1000,10000,100000')
+    parser.add_argument('--flows', type=int, help='Number of flows', default=200)
+    parser.add_argument('--median-size', type=int, help='Median flow size in bytes', default=32768)
+    parser.add_argument('--hit-density', type=float, help='Planted features per MiB', default=200.0)
+    parser.add_argument('--engine', type=str, help='Engine the token engine is validated against',
+                default='aho_corasick')
+    parser.add_argument('--seed', type=int, help='Random seed', default=0)
+    args = parser.parse_args()
+
+    delimiter_re = re.compile('[{}]'.format(TOKEN_DELIMITERS).encode('utf-8'))
+    failed = False
+
+    for count in [int(count) for count in args.features.split(',')]:
+        workdir = tempfile.mkdtemp(prefix='tff_bench_')
+
+        try:
+            corpus = generate_corpus(workdir, flows=args.flows, median_size=args.median_size,
+                        hit_density=args.hit_density, features=count, seed=args.seed,
+                        delimited=True)
+
+            with open(os.path.join(corpus['features_dir'], 'list.txt')) as f:
+                features = [line.strip() for line in f]
+
+            tcp_flows = list(iter_tcp_flows(corpus['tcpflows']))
+            mib = corpus['bytes'] / float(1 << 20)
+
+            (expected, expected_time) = scan(tcp_flows, features,
+                                            build_matcher(features, args.engine, True))
+            (found, found_time) = scan(tcp_flows, features,
+                                    build_matcher(features, 'token', True))
+
+            hits = 0
+            mismatches = 0
+
+            for tcp_flow in tcp_flows:
+                tokens = whole_tokens(tcp_flow, expected[tcp_flow.filename], delimiter_re)
+                hits += sum(len(positions) for positions in tokens.values())
+
+                if tokens != found[tcp_flow.filename]:
+                    mismatches += 1
+                    print('[-] Mismatch in {}'.format(tcp_flow.filename))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        failed = failed or mismatches > 0
+        print('{} features, {:.1f} MiB, {} hits: {} {:.1f} MiB/s, token {:.1f} MiB/s, '
+              '{} mismatched flows'.format(count, mib, hits, args.engine, mib / expected_time,
+              mib / found_time, mismatches))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import struct
+import sys
+
+WORDS = ['GET', 'POST', 'HTTP/1.1', 'Host:', 'User-Agent:', 'Mozilla/5.0', 'Accept:',
+         'text/html', 'Content-Length:', 'Connection:', 'keep-alive', 'Cookie:',
+         'session', 'index.html', 'the', 'of', 'and', 'to', 'data', 'value', 'user',
+         'login', 'password', 'json', 'null', 'true', 'false', '200', 'OK', '404']
+
+TLDS = ['com', 'net', 'org', 'info', 'io']
+
+def ipv4(rand):
+    return '.'.join('{:03d}'.format(rand.randrange(256)) for _ in range(4))
+
+def ipv6(rand):
+    return ':'.join('{:04x}'.format(rand.randrange(1 << 16)) for _ in range(8))
+
+def flow_names(count, seed=0, hosts=1000):
+    '''
+    Generate a deterministic corpus of tcpflow file names mixing IPv4 and IPv6
+    addresses, VLAN tags, connection counters and timestamp prefixes.
+
+    Arguments:
+        count - number of names to generate
+        seed - seed for the random number generator
+        hosts - number of distinct addresses the flows are drawn between
+
+    Returns:
+        list of file names
+
+    '''
+
+    rand = random.Random(seed)
+    addresses = [ipv6(rand) if rand.random() < 0.2 else ipv4(rand) for _ in range(hosts)]
+    names = []
+
+    for _ in range(count):
+        name = '{}.{:05d}-{}.{:05d}'.format(rand.choice(addresses), rand.randrange(65536),
+                    rand.choice(addresses), rand.randrange(65536))
+
+        if rand.random() < 0.1:
+            name += '--{}'.format(rand.randrange(4096))
+        if rand.random() < 0.2:
+            name += 'c{}'.format(rand.randrange(1, 100))
+        if rand.random() < 0.2:
+            name = '{}T{}'.format(rand.randrange(1400000000, 1500000000), name)
+
+        names.append(name)
+
+    return names
+
+def feature_list(count, seed=0):
+    '''
+    Generate a deterministic list of distinct domain, email and keyword features.
+
+    '''
+
+    rand = random.Random(seed)
+    features = []
+
+    for i in range(count):
+        word = rand.choice(WORDS).lower().strip(':/.')
+        kind = i % 3
+
+        if kind == 0:
+            features.append('{}{}.example.{}'.format(word, i, rand.choice(TLDS)))
+        elif kind == 1:
+            features.append('user{}@{}.{}'.format(i, word, rand.choice(TLDS)))
+        else:
+            features.append('secret-{}-{}'.format(word, i))
+
+    return features
+
+def write_email_features(path, lines=1000000, unique=100000, seed=0):
+    '''
+    Write a deterministic bulk_extractor email.txt feature file, with lines of
+    offset, email address and context drawn from a pool of unique addresses.
+
+    Returns:
+        number of bytes written
+    '''
+
+    rand = random.Random(seed)
+    emails = ['user{}@{}{}.{}'.format(i, rand.choice(WORDS).lower().strip(':/.'), i % 997,
+                rand.choice(TLDS)) for i in range(unique)]
+    offset = 0
+
+    with open(path, 'w') as f:
+        f.write('# BANNER FILE NOT PROVIDED (-b option)\n')
+        f.write('# BULK_EXTRACTOR-Version: 1.6.0\n')
+        f.write('# Feature-Recorder: email\n')
+
+        for _ in range(lines):
+            offset += rand.randrange(1, 1 << 16)
+            email = rand.choice(emails)
+            f.write('{}\t{}\tFrom: {}\\x0D\\x0A\n'.format(offset, email, email))
+
+        return f.tell()
+
+def flow_size(rand, median_size, size_sigma, max_size):
+    '''
+    Draw a flow size from a log-normal distribution around median_size.
+
+    '''
+
+    return min(max_size, int(rand.lognormvariate(math.log(median_size), size_sigma)))
+
+def flow_payload(rand, size, binary, hit_density, features, delimited=False):
+    '''
+    Generate the contents of one flow, with features planted at random offsets.
+
+    Arguments:
+        rand - random.Random to draw from
+        size - number of bytes to generate
+        binary - generate random bytes rather than text lines
+        hit_density - expected number of planted features per MiB
+        features - list of features to plant
+        delimited - plant each feature between spaces, so it is a whole token
+
+    Returns:
+        (payload bytes, number of planted features)
+
+    '''
+
+    if binary:
+        data = bytearray(rand.getrandbits(8 * size).to_bytes(size, 'little')) if size else bytearray()
+    else:
+        data = bytearray()
+
+        while len(data) < size:
+            line = ' '.join(rand.choice(WORDS) for _ in range(rand.randrange(4, 16)))
+            data += line.encode('ascii') + b'\r\n'
+
+        del data[size:]
+
+    expected = hit_density * size / float(1 << 20)
+    hits = int(expected) + (rand.random() < expected - int(expected))
+    planted = 0
+
+    for _ in range(hits):
+        feature = rand.choice(features).encode('utf-8')
+
+        if delimited:
+            feature = b' ' + feature + b' '
+
+        if len(feature) > size:
+            continue
+
+        offset = rand.randrange(size - len(feature) + 1)
+        data[offset:offset + len(feature)] = feature
+        planted += 1
+
+    return (bytes(data), planted)
+
+def generate_corpus(directory, flows=1000, median_size=8192, size_sigma=1.0,
+        max_size=16 << 20, binary_ratio=0.3, hit_density=20.0, features=1000, seed=0,
+        delimited=False):
+    '''
+    Write a synthetic tcpflow output directory and a matching feature list.
+
+    The corpus only depends on the arguments, so the same arguments always give
+    the same files.  Flows are written to <directory>/tcpflow_out and the
+    features to <directory>/features/list.txt, the layout read by the list.txt
+    plugin.
+
+    Arguments:
+        directory - directory to create the corpus in
+        flows - number of flows
+        median_size, size_sigma - parameters of the log-normal flow size
+            distribution, in bytes
+        max_size - largest flow size in bytes
+        binary_ratio - fraction of flows with random binary contents rather than text
+        hit_density - expected number of planted features per MiB of flow data
+        features - number of features in the feature list
+        seed - seed for the random number generator
+        delimited - plant features between spaces, as whole tokens
+
+    Returns:
+        dictionary describing the corpus
+
+    '''
+
+    rand = random.Random(seed)
+    feature_strings = feature_list(features, seed)
+
+    tcpflow_dir = os.path.join(directory, 'tcpflow_out')
+    features_dir = os.path.join(directory, 'features')
+
+    for path in (tcpflow_dir, features_dir):
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    with open(os.path.join(features_dir, 'list.txt'), 'w') as f:
+        f.write('\n'.join(feature_strings) + '\n')
+
+    total_bytes = 0
+    total_hits = 0
+
+    for name in flow_names(flows, seed):
+        size = flow_size(rand, median_size, size_sigma, max_size)
+        binary = rand.random() < binary_ratio
+        (payload, hits) = flow_payload(rand, size, binary, hit_density, feature_strings,
+                                delimited)
+
+        with open(os.path.join(tcpflow_dir, name), 'wb') as f:
+            f.write(payload)
+
+        total_bytes += size
+        total_hits += hits
+
+    return {
+        'directory' : os.path.abspath(directory),
+        'tcpflows' : os.path.abspath(tcpflow_dir),
+        'features_dir' : os.path.abspath(features_dir),
+        'flows' : flows,
+        'features' : features,
+        'bytes' : total_bytes,
+        'planted_hits' : total_hits,
+        'median_size' : median_size,
+        'size_sigma' : size_sigma,
+        'binary_ratio' : binary_ratio,
+        'hit_density' : hit_density,
+        'seed' : seed,
+        'delimited' : delimited,
+    }
+
+def tcp_frame(src, dst, sport, dport, seq, flags, payload=b''):
+    '''
+    Build an Ethernet frame holding an IPv4 TCP segment.  Checksums are left zero.
+
+    '''
+
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, seq & 0xffffffff, 0, 5 << 4, flags,
+                65535, 0, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0,
+                socket.inet_aton(src), socket.inet_aton(dst))
+
+    return b'\x00' * 12 + b'\x08\x00' + ip + tcp
+
+def generate_pcap(path, flows=100, median_size=8192, size_sigma=1.0, max_size=16 << 20,
+        binary_ratio=0.3, hit_density=20.0, features=1000, seed=0, mss=1460):
+    '''
+    Write a synthetic Ethernet pcap holding interleaved IPv4 TCP connections,
+    with the same payload model as generate_corpus.
+
+    Returns:
+        dictionary describing the capture
+
+    '''
+
+    rand = random.Random(seed)
+    feature_strings = feature_list(features, seed)
+    connections = []
+    total_bytes = 0
+    total_hits = 0
+
+    for _ in range(flows):
+        src = '10.{}.{}.{}'.format(rand.randrange(256), rand.randrange(256), rand.randrange(1, 255))
+        dst = '172.16.{}.{}'.format(rand.randrange(256), rand.randrange(1, 255))
+        sport = rand.randrange(1024, 65536)
+        dport = rand.choice([25, 80, 443, 8080])
+        isn = rand.getrandbits(32)
+
+        size = flow_size(rand, median_size, size_sigma, max_size)
+        (payload, hits) = flow_payload(rand, size, rand.random() < binary_ratio,
+                                hit_density, feature_strings)
+        total_bytes += size
+        total_hits += hits
+
+        frames = [tcp_frame(src, dst, sport, dport, isn, 0x02)]
+        for offset in range(0, len(payload), mss):
+            frames.append(tcp_frame(src, dst, sport, dport, isn + 1 + offset, 0x18,
+                            payload[offset:offset + mss]))
+        frames.append(tcp_frame(src, dst, sport, dport, isn + 1 + len(payload), 0x11))
+
+        connections.append(frames)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 262144, 1))
+        timestamp = 1500000000.0
+
+        # interleave the connections like a real capture would
+        while connections:
+            index = rand.randrange(len(connections))
+            frame = connections[index].pop(0)
+            if not connections[index]:
+                connections.pop(index)
+
+            timestamp += 0.0001
+            f.write(struct.pack('<IIII', int(timestamp), int(timestamp % 1 * 1000000),
+                        len(frame), len(frame)))
+            f.write(frame)
+
+    return {
+        'path' : os.path.abspath(path),
+        'flows' : flows,
+        'bytes' : total_bytes,
+        'planted_hits' : total_hits,
+        'seed' : seed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic tcpflow corpus.')
+    parser.add_argument('directory', type=str, help='Directory to create the corpus in')
+    parser.add_argument('--flows', type=int, help='Number of flows', default=1000)
+    parser.add_argument('--median-size', type=int, help='Median flow size in bytes', default=8192)
+    parser.add_argument('--size-sigma', type=float, help='Spread of the log-normal flow size distribution', default=1.0)
+    parser.add_argument('--binary-ratio', type=float, help='Fraction of binary flows', default=0.3)
+    parser.add_argument('--hit-density', type=float, help='Planted features per MiB', default=20.0)
+    parser.add_argument('--features', type=int, help='Number of features in the feature list', default=1000)
+    parser.add_argument('--seed', type=int, help='Random seed', default=0)
+    parser.add_argument('--pcap', type=str, help='Also write the flows as a pcap to this path', default=None)
+    parser.add_argument('--delimited', action='store_true', help='Plant features between spaces, as whole tokens')
+    args = parser.parse_args()
+
+    options = dict(flows=args.flows, median_size=args.median_size, size_sigma=args.size_sigma,
+                binary_ratio=args.binary_ratio, hit_density=args.hit_density,
+                features=args.features, seed=args.seed)
+
+    print(json.dumps(generate_corpus(args.directory, delimited=args.delimited, **options),
+            indent=4))
+
+    if args.pcap:
+        print(json.dumps(generate_pcap(args.pcap, **options), indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import collections
+import configparser
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from tff.cache import FeatureCache
+from tff.database_builder import DatabaseController
+from tff.matcher import build_matcher
+from tff.pcap import iter_pcap_flows
+from tff.report_builder import ReportBuilder
+from tff.run import Driver
+from tff.scanner import FeatureScanner
+from tff.tcp_flow import iter_tcp_flows, parse_flow_name
+from corpus import generate_corpus, generate_pcap
+
+class Benchmark:
+    '''
+    Shared state of a benchmark run.
+
+    Holds the generated corpus and a scratch directory, and prepares the working
+    directory Driver expects: a config.ini and the plugins directory, with only
+    the list.txt plugin active.
+
+    '''
+
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.corpus = generate_corpus(os.path.join(workdir, 'corpus'), **corpus_options(args))
+        self.pcap = None
+
+        with open(os.path.join(self.corpus['features_dir'], 'list.txt')) as f:
+            self.features = [line.strip() for line in f]
+
+        self.config = configparser.ConfigParser()
+        self.config.read(os.path.join(REPO_DIR, 'config.ini'))
+        self.config['active_plugins'] = {'plugins' : '\nlist.txt'}
+        # keep the cache of driver runs in the scratch directory, not the user's
+        self.config.set('cache', 'directory', os.path.join(workdir, 'cache'))
+
+        self.run_dir = os.path.join(workdir, 'run')
+        os.makedirs(self.run_dir)
+        os.symlink(os.path.join(REPO_DIR, 'plugins'), os.path.join(self.run_dir, 'plugins'))
+
+        with open(os.path.join(self.run_dir, 'config.ini'), 'w') as f:
+            self.config.write(f)
+
+        self.outputs = 0
+
+    def output_dir(self):
+        '''
+        Returns a new, empty output directory.
+
+        '''
+
+        self.outputs += 1
+        return os.path.join(self.workdir, 'out{}'.format(self.outputs))
+
+    def run_driver(self, workers=1):
+        '''
+        Run Tcp Feature Finder over the corpus.
+
+        Returns:
+            the Driver that was run
+
+        '''
+
+        cwd = os.getcwd()
+        os.chdir(self.run_dir)
+
+        try:
+            driver = Driver('tff.db', self.corpus['features_dir'], self.corpus['tcpflows'],
+                        self.output_dir(), workers)
+            driver.run()
+        finally:
+            os.chdir(cwd)
+
+        return driver
+
+def corpus_options(args):
+    return dict(flows=args.flows, median_size=args.median_size, size_sigma=args.size_sigma,
+                binary_ratio=args.binary_ratio, hit_density=args.hit_density,
+                features=args.features, seed=args.seed)
+
+def bench_parse_flow_name(bench):
+    names = os.listdir(bench.corpus['tcpflows'])
+
+    def run():
+        for name in names:
+            parse_flow_name(name)
+
+    return (run, {'items' : len(names)})
+
+def bench_find_features(bench):
+    binary = bench.args.read_mode == 'mmap'
+    matcher = build_matcher(bench.features, bench.args.engine, binary)
+
+    def run():
+        for tcp_flow in iter_tcp_flows(bench.corpus['tcpflows']):
+            tcp_flow.find_features('list.txt', bench.features, matcher)
+
+    return (run, {'items' : bench.corpus['flows'], 'bytes' : bench.corpus['bytes']})
+
+def bench_build_matcher(bench):
+    feature_sets = {'list.txt' : bench.features}
+
+    def run():
+        FeatureScanner(feature_sets, bench.args.engine, bench.args.read_mode == 'mmap')
+
+    return (run, {'items' : len(bench.features)})
+
+def bench_load_matcher(bench):
+    feature_sets = {'list.txt' : bench.features}
+    cache = FeatureCache(os.path.join(bench.workdir, 'cache'))
+    binary = bench.args.read_mode == 'mmap'
+
+    # warm the cache so only loading is timed
+    FeatureScanner(feature_sets, bench.args.engine, binary, cache)
+
+    def run():
+        FeatureScanner(feature_sets, bench.args.engine, binary, cache)
+
+    return (run, {'items' : len(bench.features)})
+
+def bench_pcap_reassembly(bench):
+    if bench.pcap is None:
+        path = os.path.join(bench.workdir, 'corpus.pcap')
+        bench.pcap = generate_pcap(path, **corpus_options(bench.args))
+
+    def run():
+        for tcp_flow in iter_pcap_flows(bench.pcap['path']):
+            pass
+
+    return (run, {'items' : bench.pcap['flows'], 'bytes' : bench.pcap['bytes']})
+
+def bench_database_insert(bench):
+    # search once up front so only the inserts are timed
+    matcher = build_matcher(bench.features, binary=True)
+    tcp_flows = list(iter_tcp_flows(bench.corpus['tcpflows']))
+    rows = 0
+
+    for tcp_flow in tcp_flows:
+        tcp_flow.find_features('list.txt', bench.features, matcher)
+        rows += 1 + sum(len(positions) for positions in tcp_flow.found_features['list.txt'].values())
+
+    pragmas = dict(bench.config.items('database')) if bench.config.has_section('database') else {}
+    batch_size = int(pragmas.pop('batch_size', 10000))
+
+    def run():
+        db_controller = DatabaseController(os.path.join(bench.output_dir() + '.db'),
+                            batch_size, pragmas)
+
+        for tcp_flow in tcp_flows:
+            db_controller.add_tcp_flow_to_batch(tcp_flow)
+
+            for feature, positions in tcp_flow.found_features['list.txt'].items():
+                for position in positions:
+                    db_controller.add_feature_to_batch(tcp_flow.filename, 'list.txt',
+                        feature, position)
+
+        db_controller.flush_batches()
+        db_controller.create_indexes()
+
+    return (run, {'items' : rows})
+
+def bench_driver_run(bench):
+    def run():
+        bench.run_driver(bench.args.workers)
+
+    return (run, {'items' : bench.corpus['flows'], 'bytes' : bench.corpus['bytes']})
+
+def bench_generate_reports(bench):
+    driver = bench.run_driver(bench.args.workers)
+    db_controller = DatabaseController(driver.db_controller.db_path, read_only=True,
+                        pragmas=driver.db_controller.pragmas)
+    rows = db_controller.session.execute('SELECT count(*) FROM features').scalar()
+
+    def run():
+        outdir = bench.output_dir()
+        os.makedirs(outdir)
+        ReportBuilder(bench.config, db_controller, outdir, bench.args.workers).generate_reports()
+
+    return (run, {'items' : rows})
+
+SCENARIOS = collections.OrderedDict([
+    ('parse_flow_name', bench_parse_flow_name),
+    ('find_features', bench_find_features),
+    ('build_matcher', bench_build_matcher),
+    ('load_matcher', bench_load_matcher),
+    ('pcap_reassembly', bench_pcap_reassembly),
+    ('database_insert', bench_database_insert),
+    ('driver_run', bench_driver_run),
+    ('generate_reports', bench_generate_reports),
+])
+
+def time_scenario(bench, setup, repeat):
+    '''
+    Set up a scenario and time it repeat times.
+
+    Returns:
+        dictionary of timings and throughput, using the best run
+
+    '''
+
+    (run, sizes) = setup(bench)
+    runs = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        runs.append(time.perf_counter() - start)
+
+    best = min(runs)
+    result = {'best' : best, 'mean' : sum(runs) / len(runs), 'runs' : runs}
+
+    if 'items' in sizes:
+        result['items'] = sizes['items']
+        result['items_per_s'] = sizes['items'] / best if best else None
+
+    if 'bytes' in sizes:
+        result['bytes'] = sizes['bytes']
+        result['mib_per_s'] = sizes['bytes'] / float(1 << 20) / best if best else None
+
+    return result
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                    stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    '''
+    Print how each scenario's best time changed against an earlier results file.
+
+    '''
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = result['best'] / baseline[name]['best']
+        print('{:<20} {:8.3f}s -> {:8.3f}s  {:+.1%}'.format(name, baseline[name]['best'],
+                result['best'], ratio - 1))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the TcpFeatureFinder benchmarks.')
+    parser.add_argument('-o', type=str, help='Path to write the JSON results to', default='benchmark_results.json')
+    parser.add_argument('-s', '--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run, may be repeated (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, help='Runs per scenario, the best is reported', default=3)
+    parser.add_argument('-j', '--workers', type=int, help='Workers for driver_run and generate_reports', default=1)
+    parser.add_argument('--compare', type=str, help='Earlier results file to compare against', default=None)
+    parser.add_argument('--engine', type=str, help='Matching engine for find_features', default='aho_corasick')
+    parser.add_argument('--read-mode', type=str, choices=['mmap', 'text'], help='Read mode for find_features', default='mmap')
+    parser.add_argument('--flows', type=int, help='Number of flows', default=1000)
+    parser.add_argument('--median-size', type=int, help='Median flow size in bytes', default=8192)
+    parser.add_argument('--size-sigma', type=float, help='Spread of the log-normal flow size distribution', default=1.0)
+    parser.add_argument('--binary-ratio', type=float, help='Fraction of binary flows', default=0.3)
+    parser.add_argument('--hit-density', type=float, help='Planted features per MiB', default=20.0)
+    parser.add_argument('--features', type=int, help='Number of features in the feature list', default=1000)
+    parser.add_argument('--seed', type=int, help='Random seed', default=0)
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='tff_bench_')
+    results = collections.OrderedDict()
+
+    try:
+        bench = Benchmark(args, workdir)
+
+        for name in args.scenario or SCENARIOS:
+            results[name] = time_scenario(bench, SCENARIOS[name], args.repeat)
+            print('{:<20} {:8.3f}s'.format(name, results[name]['best']))
+    finally:
+        if args.keep:
+            print('Scratch directory kept at {}'.format(workdir))
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        'date' : datetime.datetime.utcnow().isoformat() + 'Z',
+        'revision' : git_revision(),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'cpus' : os.cpu_count(),
+        'options' : vars(args),
+        'corpus' : bench.corpus,
+        'results' : results,
+    }
+
+    with open(args.o, 'w') as f:
+        json.dump(output, f, indent=4)
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,16 @@ import sys
 import urllib.request
 
 from plugins import list as list_plugin
+from tff.endpoints import Endpoint
 
 class BlacklistFeaturePlugin(list_plugin.ListFeatureFilePlugin):
     '''
-    Downloads malware blacklist and uses the domains as features.
+    Downloads malware blacklist and uses the entries as features.  The IPs are
+    matched against the endpoints of each flow instead of searched for in its
+    data, so a flow is neither read for them nor counted twice when it both
+    involves and mentions a blacklisted IP.  List the plugin under
+    payload_search in the [endpoints] section of config.ini to also search the
+    data of each flow for the IPs.
 
     Blacklist courtesy of http://www.dshield.org/ipsascii.html.
 
@@ -41,9 +47,20 @@ class BlacklistFeaturePlugin(list_plugin.ListFeatureFilePlugin):
     def get_features(self, basedir):
         super(BlacklistFeaturePlugin, self).get_features(basedir)
 
+        features = []
+
+        # flows to or from a blacklisted IP are hits even if the IP never
+        # appears in their data
         for feature in self.features:
             if not feature:
-                self.features.remove(feature)
+                continue
+
+            try:
+                features.append(Endpoint(feature))
+            except ValueError:
+                features.append(feature)
+
+        self.features = features
 
     def filter_features(self, tcpflow_path, found_features):
         return found_features
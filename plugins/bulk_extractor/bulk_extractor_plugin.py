@@ -3,7 +3,7 @@ import sys
 
 from tff import plugin
 
-from plugins.bulk_extractor.parsers import BulkExtractorFileParser
+from plugins.bulk_extractor.parsers import FILES, BulkExtractorFileParser
 
 class BulkExtractorPlugin(plugin.AbstractPlugin):
     '''
@@ -20,19 +20,5 @@ class BulkExtractorPlugin(plugin.AbstractPlugin):
         self.parser = BulkExtractorFileParser(file_path)
         self.features = self.parser.parse_all_features()
 
-
-    def filter_features(self, tcpflow_path, found_features):
-        if not found_features:
-            return found_features
-
-        with open(tcpflow_path, 'r') as f:
-            for feature, positions in found_features.items():
-                for position in positions:
-                    f.seek(int(position))
-
-                    try:
-                        f.readline()
-                    except UnicodeDecodeError as e:
-                        continue
-                
-        return found_features
+    def feature_sources(self, basedir):
+        return [os.path.join(basedir, 'bulk_out', name) for name in FILES.values()]
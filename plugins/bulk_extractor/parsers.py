@@ -1,10 +1,44 @@
+import collections
+import multiprocessing
 import os
 import sys
 
+# bulk_extractor output file of each kind of feature
+FILES = collections.OrderedDict([
+    ('email', 'email.txt'),
+    ('ccn', 'ccn_histogram.txt'),
+    ('domain', 'domain_histogram.txt'),
+    ('url_searches', 'url_searches.txt'),
+])
+
+# parse method of each file, in the order their features are returned
+PARSERS = ('parse_email_features', 'parse_ccn_features', 'parse_domain_features',
+           'parse_url_searches')
+
+# combined size of the files, in bytes, from which they are parsed in parallel
+PARALLEL_MIN_SIZE = 4 << 20
+
 class BulkExtractorFileParser:
+    '''
+    Parses features out of the output files of bulk_extractor.
+
+    Each file is streamed line by line and its features are deduplicated with a
+    set as they are read, keeping the order in which they first occur, so
+    parsing takes time linear in the size of the file and memory proportional
+    to the number of distinct features.  Once the files add up to
+    PARALLEL_MIN_SIZE bytes, parse_all_features parses each file on its own
+    worker process.
+
+    Arguments:
+        basedir - path to the bulk_extractor output directory
+        workers - number of processes parsing files in parse_all_features,
+            defaults to one per file up to the number of CPUs
 
-    def __init__(self, basedir):
+    '''
+
+    def __init__(self, basedir, workers=None):
         self.basedir = basedir
+        self.workers = workers
 
     def __check_valid_file(self, file_path):
         try:
@@ -18,63 +52,83 @@ class BulkExtractorFileParser:
         return True
 
     def parse_all_features(self):
-        features = []
-        features += self.parse_email_features()
-        features += self.parse_ccn_features()
-        features += self.parse_domain_features()
-        features += self.parse_url_searches()
-
+        workers = self.workers or min(len(PARSERS), os.cpu_count() or 1)
+
+        # starting worker processes costs more than parsing small files
+        if workers <= 1 or self.total_size() < PARALLEL_MIN_SIZE:
+            results = [getattr(self, name)() for name in PARSERS]
+        else:
+            pool = multiprocessing.Pool(workers)
+
+            try:
+                results = pool.map(_parse_file, [(self.basedir, name) for name in PARSERS],
+                            chunksize=1)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+
+        seen = set()
         out_features = []
 
-        for feature in features:
-            if len(feature) <=3:
-                continue
-            out_features.append(feature)
+        for features in results:
+            for feature in features:
+                if len(feature) <= 3 or feature in seen:
+                    continue
+
+                seen.add(feature)
+                out_features.append(feature)
 
         return out_features
-        
-    def parse_email_features(self):
-        path = os.path.join(self.basedir, 'email.txt')
-        features = []
-        
-        if not self.__check_valid_file(path):
-            return features
 
-        with open(path, 'r') as f:
-            f.readline()
+    def total_size(self):
+        '''
+        Returns the combined size of the files that exist, in bytes.
 
-            for line in f.readlines():
+        '''
 
-                if line[0] == '#':
-                    continue
+        total = 0
 
-                line = line.split()
-                feature = line[1].replace('\\x00','')
+        for filename in FILES.values():
+            try:
+                total += os.path.getsize(os.path.join(self.basedir, filename))
+            except OSError:
+                pass
 
-                if feature not in features:
-                    features.append(feature)
+        return total
 
-        return features
+    def iter_lines(self, filename):
+        '''
+        Yields the whitespace separated fields of each line of a bulk_extractor
+        output file, skipping the first line, comments and lines with fewer than
+        two fields.
 
-    def parse_ccn_features(self):
-        path = os.path.join(self.basedir, 'ccn_histogram.txt')
-        features = []
+        '''
+
+        path = os.path.join(self.basedir, filename)
 
         if not self.__check_valid_file(path):
-            return features
+            return
 
-        with open(path, 'r') as f:
+        with open(path, 'r', errors='surrogateescape') as f:
             f.readline()
 
-            for line in f.readlines():
-
+            for line in f:
                 if line[0] == '#':
                     continue
 
-                line = line.split()
-                feature = line[1]
+                fields = line.split()
 
-        return features
+                if len(fields) >= 2:
+                    yield fields
+
+    def parse_email_features(self):
+        # feature files list the offset, the feature and its context
+        return unique(fields[1].replace('\\x00', '') for fields in self.iter_lines(FILES['email']))
+
+    def parse_ccn_features(self):
+        # histograms list the count, as n=<count>, and the feature
+        return unique(fields[1] for fields in self.iter_lines(FILES['ccn']))
 
 #    def parse_telephone_features(self):
 #        path = os.path.join(self.basedir, 'telephone_histogram.txt')
@@ -83,53 +137,44 @@ class BulkExtractorFileParser:
 #        return features
 
     def parse_domain_features(self):
-        path = os.path.join(self.basedir, 'domain_histogram.txt')
-        features = []
-
-        if not self.__check_valid_file(path):
-            return features
-
-        with open(path, 'r') as f:
-            f.readline()
-
-            for line in f.readlines():
-
-                if line[0] == '#':
-                    continue
-
-                line = line.split()
-                feature = line[1]
-
-        return features
+        return unique(fields[1] for fields in self.iter_lines(FILES['domain']))
 
     def parse_url_searches(self):
-        path = os.path.join(self.basedir, 'url_searches.txt')
-        features = []
+        return unique(self.__iter_url_searches())
 
-        if not self.__check_valid_file(path):
-            return features
+    def __iter_url_searches(self):
+        '''
+        Yields the first word of each search, skipping words that also appear
+        in the previous line or are too short to be useful.
 
-        with open(path, 'r') as f:
+        '''
 
-            last_line = f.readline()
+        last_fields = ()
 
-            for line in f.readlines():
+        for fields in self.iter_lines(FILES['url_searches']):
+            feature = fields[1]
 
-                if line[0] == '#':
-                    continue
+            if feature not in last_fields and len(feature) > 3:
+                yield feature
 
-                line = line.split()
-                feature = line[1]
+            last_fields = fields
 
-                if feature in last_line or len(feature) <= 3:
-                    last_line = line
-                    continue
+def unique(features):
+    '''
+    Returns the distinct features of an iterable, in order of first occurrence.
 
-                if feature not in features:
-                    features.append(feature)
+    '''
 
-                last_line = line
+    seen = set()
+    out_features = []
 
-        return features
+    for feature in features:
+        if feature not in seen:
+            seen.add(feature)
+            out_features.append(feature)
 
+    return out_features
 
+def _parse_file(task):
+    (basedir, name) = task
+    return getattr(BulkExtractorFileParser(basedir, 1), name)()
@@ -22,6 +22,9 @@ class ListFeatureFilePlugin(plugin.AbstractPlugin):
             for line in f.readlines():
                 self.features.append(line.strip())
 
+    def feature_sources(self, basedir):
+        return [os.path.join(basedir, self.feature_file)]
+
     def filter_features(self, tcpflow_path, found_features):
         return found_features
 
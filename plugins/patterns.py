@@ -0,0 +1,45 @@
+import os
+import sys
+
+from tff import plugin
+from tff.patterns import Pattern, typed_pattern
+
+class PatternFeaturePlugin(plugin.AbstractPlugin):
+    '''
+    Reads regular expression features from a list of patterns.
+
+    Each line of the file is either the name of a built in pattern type (email,
+    ccn, ipv4, ipv6 or domain), or a name and a regular expression separated by
+    a tab.  Blank lines and lines starting with # are ignored.  Every match of a
+    pattern is a hit, recorded along with the name of the pattern.
+
+    '''
+
+    def __init__(self):
+        super(PatternFeaturePlugin, self).__init__()
+        self.feature_name = 'patterns'
+        self.feature_file = 'patterns.txt'
+        self.features = []
+
+    def get_features(self, basedir):
+        file_path = os.path.join(basedir, self.feature_file)
+
+        with open(file_path) as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+
+                if not line.strip() or line.startswith('#'):
+                    continue
+
+                if '\t' in line:
+                    (name, regex) = line.split('\t', 1)
+                    self.features.append(Pattern(name.strip(), regex))
+                else:
+                    self.features.append(typed_pattern(line.strip()))
+
+    def feature_sources(self, basedir):
+        return [os.path.join(basedir, self.feature_file)]
+
+    def filter_features(self, tcpflow_path, found_features):
+        return found_features
+
@@ -0,0 +1,222 @@
+import configparser
+import contextlib
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from tff.run import Driver
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIST_FEATURES = ['evil.com', 'bad@example.org', 'secret', 'token-123']
+
+PATTERN_FEATURES = ['email', 'ipv4']
+
+WORDS = [b'GET', b'Host:', b'the', b'value', b'user', b'login', b'password', b'json',
+         b'10.1.2.3', b'evil.com', b'notevil.com', b'secret', b'secrets', b'bad@example.org',
+         b'token-123', b'(evil.com)', b'x@y.io']
+
+def flow_payload(rand, size, binary):
+    '''
+    Generate the contents of one flow: random bytes or lines of words, with
+    features, partial features and delimited features mixed in.
+
+    '''
+
+    if binary:
+        data = bytearray(rand.getrandbits(8 * size).to_bytes(size, 'little'))
+
+        for _ in range(size // 64):
+            word = rand.choice(WORDS)
+            offset = rand.randrange(max(1, size - len(word)))
+            data[offset:offset + len(word)] = word
+
+        return bytes(data)
+
+    data = bytearray()
+
+    while len(data) < size:
+        data += b' '.join(rand.choice(WORDS) for _ in range(rand.randrange(1, 12))) + b'\r\n'
+
+    return bytes(data)
+
+def flow_names(count, rand):
+    names = []
+
+    for index in range(count):
+        name = '010.000.{:03d}.{:03d}.{:05d}-192.168.001.{:03d}.00080'.format(
+                    index // 250, index % 250 + 1, rand.randrange(1024, 65536),
+                    rand.randrange(1, 255))
+
+        if index % 5 == 1:
+            name += 'c{}'.format(index)
+        if index % 7 == 2:
+            name = '1480000000T' + name
+
+        names.append(name)
+
+    return names
+
+def write_corpus(directory, flows=24, seed=0):
+    '''
+    Write a small deterministic tcpflow output directory, mixing text and binary
+    flows, along with an empty flow and a file tcpflow writes that is not a flow.
+
+    Returns:
+        list of flow file names
+    '''
+
+    rand = random.Random(seed)
+    names = flow_names(flows, rand)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    for (index, name) in enumerate(names):
+        size = 0 if index == 3 else rand.randrange(64, 4096)
+
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(flow_payload(rand, size, index % 3 == 0))
+
+    with open(os.path.join(directory, 'report.xml'), 'w') as f:
+        f.write('<xml/>')
+
+    return names
+
+class Workspace:
+    '''
+    Directory laid out like a TcpFeatureFinder checkout, with the list.txt and
+    patterns plugins active, a small corpus in tcpflow_out and a config.ini
+    based on the one in the repository.
+
+    Arguments:
+        directory - directory to create the workspace in
+        options - dictionary of the form { section : { option : value } }
+            overriding options of config.ini
+
+    '''
+
+    def __init__(self, directory, options=None):
+        self.directory = directory
+        self.tcpout_dir = os.path.join(directory, 'tcpflow_out')
+        self.ff_dir = os.path.join(directory, 'features')
+
+        plugins_dir = os.path.join(directory, 'plugins')
+        os.makedirs(plugins_dir)
+        os.makedirs(self.ff_dir)
+
+        for name in ('__init__.py', 'list.py', 'list.yapsy-plugin', 'patterns.py',
+                     'patterns.yapsy-plugin'):
+            shutil.copy(os.path.join(REPO_DIR, 'plugins', name), plugins_dir)
+
+        with open(os.path.join(self.ff_dir, 'list.txt'), 'w') as f:
+            f.write('\n'.join(LIST_FEATURES) + '\n')
+
+        with open(os.path.join(self.ff_dir, 'patterns.txt'), 'w') as f:
+            f.write('\n'.join(PATTERN_FEATURES) + '\n')
+
+        self.flows = write_corpus(self.tcpout_dir)
+
+        self.config = configparser.ConfigParser()
+        self.config.read(os.path.join(REPO_DIR, 'config.ini'))
+        self.config.set('active_plugins', 'plugins', '\nlist.txt\npatterns')
+        self.config.set('progress', 'display', 'no')
+        self.config.set('cache', 'directory', os.path.join(directory, 'tff_cache'))
+        self.configure(options or {})
+
+    def configure(self, options):
+        '''
+        Override options of config.ini, given as { section : { option : value } }.
+
+        '''
+
+        for (section, values) in options.items():
+            if not self.config.has_section(section):
+                self.config.add_section(section)
+
+            for (option, value) in values.items():
+                self.config.set(section, option, str(value))
+
+        with open(os.path.join(self.directory, 'config.ini'), 'w') as f:
+            self.config.write(f)
+
+    def driver(self, output_dir, **options):
+        '''
+        Returns a Driver for the workspace.  It must be run inside working_dir().
+
+        '''
+
+        with self.working_dir():
+            return Driver('tff.db', self.ff_dir, self.tcpout_dir,
+                        os.path.join(self.directory, output_dir), **options)
+
+    def run(self, output_dir, **options):
+        driver = self.driver(output_dir, **options)
+
+        with self.working_dir():
+            driver.run()
+
+        return driver
+
+    @contextlib.contextmanager
+    def working_dir(self):
+        # config.ini and the plugins are found relative to it
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
+
+    def dump(self, output_dir):
+        '''
+        Returns the contents of the output of a run that do not depend on the
+        order rows were inserted in.
+
+        Returns:
+            dictionary holding the sorted found features, the scanned flows and
+                the names of the exported flows and tcp flow reports
+        '''
+
+        output_dir = os.path.join(self.directory, output_dir)
+        connection = sqlite3.connect(os.path.join(output_dir, 'tff.db'))
+
+        try:
+            features = sorted(connection.execute(
+                            'SELECT TcpFlowFileName, FeatureType, Feature, Position, Pattern '
+                            'FROM features'), key=repr)
+            flows = sorted(connection.execute(
+                            'SELECT TcpFlowFileName, SrcIp, SrcPort, DestIp, DestPort, '
+                            'ConnectionNumber, Timestamp FROM tcpflows'))
+        finally:
+            connection.close()
+
+        return {
+            'features' : features,
+            'flows' : flows,
+            'exported' : list_files(os.path.join(output_dir, 'tcpflows')),
+            'reports' : list_files(os.path.join(output_dir, 'tcpflow_reports')),
+        }
+
+class WorkspaceTestCase(unittest.TestCase):
+    '''
+    Test case running the Driver in a fresh Workspace for every test.
+
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.workspace = Workspace(self.directory)
+
+def list_files(directory):
+    if not os.path.exists(directory):
+        return []
+
+    return sorted(os.listdir(directory))
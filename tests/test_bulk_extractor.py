@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from plugins.bulk_extractor import parsers
+from plugins.bulk_extractor.parsers import PARALLEL_MIN_SIZE, BulkExtractorFileParser, unique
+
+# the first line of each file is skipped, like the banner bulk_extractor writes
+FILES = {
+    'email.txt' : b'# BANNER FILE NOT PROVIDED (-b option)\n'
+                  b'# Feature-Recorder: email\n'
+                  b'100\tbad@example.org\tFrom: bad@example.org\\x0D\\x0A\n'
+                  b'\n'
+                  b'200\tbad@example.org\tTo: bad@example.org\n'
+                  b'300\tadmin\\x00@evil.com\tFrom: admin@evil.com\n'
+                  b'malformed\n',
+    'ccn_histogram.txt' : b'# Feature-Recorder: ccn\n'
+                          b'n=4\t4111111111111111\n'
+                          b'# Histogram-File-Version: 1.1\n'
+                          b'n=2\t5500000000000004\n'
+                          b'n=1\t4111111111111111\n',
+    'domain_histogram.txt' : b'# Feature-Recorder: domain\n'
+                             b'n=5\tevil.com\n'
+                             b'n=3\tbad\xff.com\n'
+                             b'n=2\tevil.com\n'
+                             b'n=1\tio\n'
+                             b'\n'
+                             b'n=1\n'
+                             b'n=1\texample.org\n',
+    'url_searches.txt' : b'# Feature-Recorder: url_searches\n'
+                         b'n=4\tevil.com login\n'
+                         b'n=3\tlogin page\n'
+                         b'n=2\tpage reset\n'
+                         b'n=2\tpassword\n'
+                         b'n=1\tabc\n'
+                         b'n=1\tpassword\n',
+}
+
+class BulkExtractorParserTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_files(self, files):
+        for (filename, data) in files.items():
+            with open(os.path.join(self.directory, filename), 'wb') as f:
+                f.write(data)
+
+    def test_parse_files(self):
+        self.write_files(FILES)
+        parser = BulkExtractorFileParser(self.directory, 1)
+
+        # blank, comment and malformed lines are skipped and undecodable bytes
+        # are kept as surrogates
+        self.assertEqual(parser.parse_email_features(), ['bad@example.org', 'admin@evil.com'])
+        self.assertEqual(parser.parse_ccn_features(), ['4111111111111111', '5500000000000004'])
+        self.assertEqual(parser.parse_domain_features(),
+            ['evil.com', 'bad\udcff.com', 'io', 'example.org'])
+
+        # the first word of each search, unless it is in the previous line
+        self.assertEqual(parser.parse_url_searches(), ['evil.com', 'password'])
+
+        # features are deduplicated across files, and short ones dropped
+        self.assertEqual(parser.parse_all_features(), ['bad@example.org', 'admin@evil.com',
+            '4111111111111111', '5500000000000004', 'evil.com', 'bad\udcff.com', 'example.org',
+            'password'])
+
+    def test_missing_files(self):
+        self.write_files({'email.txt' : FILES['email.txt'], 'ccn_histogram.txt' : b''})
+        parser = BulkExtractorFileParser(self.directory, 1)
+
+        self.assertEqual(parser.parse_ccn_features(), [])
+        self.assertEqual(parser.parse_domain_features(), [])
+        self.assertEqual(parser.parse_all_features(), ['bad@example.org', 'admin@evil.com'])
+
+    def test_unique(self):
+        self.assertEqual(unique(['b', 'a', 'b', 'c', 'a']), ['b', 'a', 'c'])
+
+    def test_parallel(self):
+        # enough email features to parse the files on worker processes
+        lines = [FILES['email.txt']]
+        size = len(FILES['email.txt'])
+        index = 0
+
+        while size < PARALLEL_MIN_SIZE:
+            line = '{0}\tuser{1}@host{2}.org\tFrom: user{1}\n'.format(index, index % 50000,
+                        index % 50000 % 7).encode('utf-8')
+            lines.append(line)
+            size += len(line)
+            index += 1
+
+        self.write_files(dict(FILES, **{'email.txt' : b''.join(lines)}))
+
+        serial = BulkExtractorFileParser(self.directory, 1).parse_all_features()
+
+        with mock.patch.object(parsers.multiprocessing, 'Pool',
+                wraps=multiprocessing.Pool) as pool:
+            parallel = BulkExtractorFileParser(self.directory, 2).parse_all_features()
+
+        pool.assert_called_once_with(2)
+        self.assertEqual(len(serial), 50000 + 8)
+        self.assertEqual(parallel, serial)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from tff.cache import CACHE_HEADER, FeatureCache, default_cache_dir
+
+class Payload:
+    '''
+    Records being unpickled, standing in for a malicious pickle.
+
+    '''
+
+    loaded = []
+
+    def __reduce__(self):
+        return (Payload.loaded.append, ('unpickled',))
+
+class FeatureCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, 'cache')
+        self.cache = FeatureCache(self.directory)
+        Payload.loaded = []
+
+    def test_default_directory(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME' : self.directory}):
+            self.assertEqual(default_cache_dir(), os.path.join(self.directory, 'tff'))
+            self.assertEqual(FeatureCache().directory, os.path.join(self.directory, 'tff'))
+
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+
+    def test_round_trip(self):
+        key = self.cache.key('features', 'list.txt')
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.put(key, ['evil.com', 'secret'])
+
+        self.assertEqual(self.cache.get(key), ['evil.com', 'secret'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertFalse(os.stat(self.cache.path(key)).st_mode & 0o077)
+
+    def test_other_version_not_loaded(self):
+        key = self.cache.key('features')
+
+        with open(self.cache.path(key), 'wb') as f:
+            f.write(b'tff cache 0\n' + pickle.dumps(Payload()))
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(Payload.loaded, [])
+        self.assertFalse(os.path.exists(self.cache.path(key)))
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'files have no owners')
+    def test_writable_entry_not_loaded(self):
+        key = self.cache.key('features')
+        path = self.cache.path(key)
+
+        with open(path, 'wb') as f:
+            f.write(CACHE_HEADER + pickle.dumps(Payload()))
+
+        os.chmod(path, 0o666)
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(Payload.loaded, [])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'files have no owners')
+    def test_untrusted_directory(self):
+        os.chmod(self.directory, 0o777)
+
+        with self.assertRaises(ValueError):
+            FeatureCache(self.directory)
+
+        with mock.patch('os.getuid', return_value=os.getuid() + 1):
+            os.chmod(self.directory, 0o700)
+
+            with self.assertRaises(ValueError):
+                FeatureCache(self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
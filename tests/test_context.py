@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from tff.matcher import build_matcher
+from tff.tcp_flow import Hit, TcpFlow
+
+FLOW_NAME = '010.000.000.001.01234-192.168.001.002.00080'
+
+TEXT = b'GET / HTTP/1.1\r\nHost: evil.com\r\n\r\nsecret evil.com secret\nnothing here\nevil.com'
+
+class ContextTest(unittest.TestCase):
+    '''
+    Hits carry the bytes around them, captured while the flow is searched.
+
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_flow(self, data):
+        path = os.path.join(self.directory, FLOW_NAME)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return TcpFlow(path)
+
+    def test_find_features_text_context(self):
+        tcp_flow = self.write_flow(b'GET /\n\xff evil.com x evil.com\xfe secret\n')
+        tcp_flow.find_features('list', ['evil.com', 'secret'], context_bytes=2)
+
+        found = tcp_flow.get_found_features()['list']
+
+        # one Hit per line, at the start of the line, around the first occurrence
+        self.assertEqual(found['evil.com'], [6])
+        self.assertEqual([hit.context for hit in found['evil.com']], [b'\xff evil.com x'])
+        self.assertEqual([hit.context for hit in found['secret']], [b'\xfe secret\n'])
+
+        # the same positions are recorded as without context
+        tcp_flow.find_features('list', ['evil.com', 'secret'])
+        self.assertEqual(tcp_flow.get_found_features()['list'], found)
+
+    def test_find_features_context(self):
+        tcp_flow = self.write_flow(TEXT)
+        features = ['evil.com']
+        tcp_flow.find_features('list', features, build_matcher(features, binary=True), 4)
+
+        hits = tcp_flow.get_found_features()['list']['evil.com']
+
+        self.assertEqual(hits, [22, 41, 70])
+        self.assertTrue(all(isinstance(hit, Hit) for hit in hits))
+        self.assertEqual([hit.context for hit in hits],
+            [b'st: evil.com\r\n\r\n', b'ret evil.com sec', b'ere\nevil.com'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from tff.database_builder import INDEXES, DatabaseController
+from tff.tcp_flow import TcpFlow
+from tests.support import WorkspaceTestCase
+
+FLOWS = [
+    '010.000.000.001.01234-192.168.001.002.00080',
+    '010.000.000.002.01234-192.168.001.002.00080',
+    '010.000.000.003.01234-192.168.001.002.00080',
+]
+
+# tables as created by the first release of TFF
+BASELINE_SCHEMA = '''
+    CREATE TABLE tcpflows (
+        "TcpFlowFileName" VARCHAR NOT NULL, "TcpFlowFilePath" VARCHAR, "SrcIp" VARCHAR,
+        "SrcPort" VARCHAR, "DestIp" VARCHAR, "DestPort" VARCHAR, "VLAN" VARCHAR,
+        "Timestamp" VARCHAR, "ConnectionNumber" VARCHAR, PRIMARY KEY ("TcpFlowFileName"));
+    CREATE TABLE features (
+        id INTEGER NOT NULL, "TcpFlowFileName" VARCHAR, "FeatureType" VARCHAR,
+        "Feature" VARCHAR, "Position" VARCHAR, PRIMARY KEY (id),
+        FOREIGN KEY("TcpFlowFileName") REFERENCES tcpflows ("TcpFlowFileName"));
+'''
+
+def query(db_path, sql):
+    connection = sqlite3.connect(db_path)
+
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, 'tff.db')
+
+    def query(self, sql):
+        return query(self.db_path, sql)
+
+    def count(self, table):
+        return self.query('SELECT COUNT(*) FROM {}'.format(table))[0][0]
+
+class BatchInsertTest(DatabaseTestCase):
+
+    def add_flow(self, db_controller, flow_fn, features):
+        # features are batched before their flow, as the Driver does
+        for index in range(features):
+            db_controller.add_feature_to_batch(flow_fn, 'list.txt' if index % 2 else 'patterns',
+                'feature{}'.format(index), str(index * 10))
+
+        db_controller.add_tcp_flow_to_batch(TcpFlow(flow_fn, size=0, mtime=0.0))
+
+    def test_batches(self):
+        db_controller = DatabaseController(self.db_path, batch_size=4)
+
+        # the first full batch holds features of the first flow only, the second
+        # holds features of both flows and the row of the first
+        self.add_flow(db_controller, FLOWS[0], 6)
+        self.assertEqual((self.count('features'), self.count('tcpflows')), (4, 0))
+
+        self.add_flow(db_controller, FLOWS[1], 3)
+        self.add_flow(db_controller, FLOWS[2], 0)
+        self.assertEqual((self.count('features'), self.count('tcpflows')), (8, 1))
+        self.assertEqual((len(db_controller.feature_batch), len(db_controller.tcp_flow_batch)),
+            (1, 2))
+
+        # the partial batches are only inserted when flushed
+        db_controller.flush_batches()
+
+        self.assertEqual((self.count('features'), self.count('tcpflows')), (9, 3))
+        self.assertEqual(db_controller.rows_inserted, {'features' : 9, 'tcpflows' : 3})
+        self.assertEqual(db_controller.feature_rows_inserted, {'patterns' : 5, 'list.txt' : 4})
+        self.assertEqual((db_controller.feature_batch, db_controller.tcp_flow_batch), ([], []))
+
+        # every feature belongs to a recorded flow
+        self.assertEqual(self.query(
+            'SELECT tcpflows.TcpFlowFileName, COUNT(features.id) FROM tcpflows '
+            'LEFT JOIN features ON features.TcpFlowFileName = tcpflows.TcpFlowFileName '
+            'GROUP BY tcpflows.TcpFlowFileName ORDER BY tcpflows.TcpFlowFileName'),
+            [(FLOWS[0], 6), (FLOWS[1], 3), (FLOWS[2], 0)])
+        self.assertEqual(self.query(
+            "SELECT Feature, Position FROM features WHERE TcpFlowFileName = '{}' "
+            "ORDER BY id".format(FLOWS[1])),
+            [('feature0', '0'), ('feature1', '10'), ('feature2', '20')])
+
+    def test_failed_flush(self):
+        db_controller = DatabaseController(self.db_path, batch_size=100)
+        self.add_flow(db_controller, FLOWS[0], 2)
+        db_controller.flush_batches()
+
+        # the features are inserted before the flow that is already recorded
+        # fails, and must be rolled back with it
+        self.add_flow(db_controller, FLOWS[1], 3)
+        self.add_flow(db_controller, FLOWS[0], 0)
+
+        with self.assertRaises(IntegrityError):
+            db_controller.flush_batches()
+
+        self.assertEqual((self.count('features'), self.count('tcpflows')), (2, 1))
+        self.assertEqual(db_controller.rows_inserted, {'features' : 2, 'tcpflows' : 1})
+        self.assertEqual((len(db_controller.feature_batch), len(db_controller.tcp_flow_batch)),
+            (3, 2))
+
+        # the batches are kept and the session can still be used
+        db_controller.tcp_flow_batch.pop()
+        db_controller.flush_batches()
+
+        self.assertEqual((self.count('features'), self.count('tcpflows')), (5, 2))
+        self.assertEqual(db_controller.rows_inserted, {'features' : 5, 'tcpflows' : 2})
+
+class SchemaTest(DatabaseTestCase):
+
+    def test_default_pragmas(self):
+        session = DatabaseController(self.db_path).session
+
+        self.assertEqual([session.execute(text('PRAGMA {}'.format(name))).scalar()
+                            for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size')],
+                            ['wal', 1, -65536, 268435456])
+
+    def test_upgrade_schema(self):
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript(BASELINE_SCHEMA)
+        connection.execute("INSERT INTO tcpflows VALUES (?, ?, '010.000.000.001', '01234', "
+                    "'192.168.001.002', '00080', NULL, NULL, NULL)", (FLOWS[0], FLOWS[0]))
+        connection.execute("INSERT INTO features VALUES (1, ?, 'list.txt', 'evil.com', '10')",
+                    (FLOWS[0],))
+        connection.commit()
+        connection.close()
+
+        db_controller = DatabaseController(self.db_path, reuse=True)
+
+        self.assertEqual(db_controller.db_path, self.db_path)
+        self.assertEqual(sorted(name for (name,) in self.query(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")),
+            ['feature_sets', 'features', 'run_state', 'scanned_features', 'tcpflows'])
+        self.assertEqual([row[1] for row in self.query('PRAGMA table_info(tcpflows)')][9:],
+            ['FileSize', 'ModifiedTime', 'ScanHash'])
+        self.assertEqual([row[1] for row in self.query('PRAGMA table_info(features)')][5:],
+            ['Context', 'Pattern'])
+
+        # existing rows are kept, with the new columns NULL, and new rows use them
+        self.assertEqual(db_controller.get_flow_fingerprints(), {FLOWS[0] : (None, None, None)})
+
+        db_controller.add_feature_to_batch(FLOWS[1], 'patterns', '10.1.2.3', '20', b'ctx', 'ipv4')
+        db_controller.add_tcp_flow_to_batch(TcpFlow(FLOWS[1], size=5, mtime=1.0), 'hash')
+        db_controller.flush_batches()
+        db_controller.set_run_state('reports', 'done')
+
+        self.assertEqual(self.query('SELECT Feature, Position, Context, Pattern FROM features '
+            'ORDER BY id'), [('evil.com', '10', None, None), ('10.1.2.3', '20', b'ctx', 'ipv4')])
+        self.assertEqual(db_controller.get_flow_fingerprints()[FLOWS[1]], (5, 1.0, 'hash'))
+        self.assertEqual(db_controller.get_run_state('reports'), 'done')
+
+class DatabaseConfigTest(WorkspaceTestCase):
+
+    def test_config(self):
+        self.workspace.configure({'database' : {'batch_size' : 7, 'journal_mode' : 'TRUNCATE',
+                        'synchronous' : 'FULL', 'cache_size' : -1024}})
+        db_controller = self.workspace.run('out').db_controller
+        session = db_controller.session
+
+        # every option but batch_size is a pragma, the others keep their defaults
+        self.assertEqual(db_controller.batch_size, 7)
+        self.assertEqual([session.execute(text('PRAGMA {}'.format(name))).scalar()
+                            for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size')],
+                            ['truncate', 2, -1024, 268435456])
+
+        self.assertEqual(sorted(name for (name,) in query(
+            os.path.join(self.directory, 'out', 'tff.db'),
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")),
+            sorted(name for (name, table, columns) in INDEXES))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from tff.endpoints import Endpoint, EndpointMatcher, parse_ip
+from tff.tcp_flow import FlowName
+from tests.support import REPO_DIR, Workspace
+
+BLACKLIST = b'# dshield top sources\n198.51.100.7\t1234\t5\n\n'
+
+def match(matcher, *name):
+    return {str(endpoint): fields for (endpoint, fields) in matcher.match(FlowName(*name)).items()}
+
+class EndpointTest(unittest.TestCase):
+
+    def test_parse_ip(self):
+        self.assertEqual(parse_ip('010.000.000.001'), (4, 0x0a000001))
+        self.assertEqual(parse_ip('2001:db8::1'), (6, 0x20010db8 << 96 | 1))
+
+        for address in ('1.2.3.999', '1.2.3', '1.2.3.4.5', '1.2.3.0004', 'abc:::1', 'evil.com'):
+            with self.assertRaises(ValueError):
+                parse_ip(address)
+
+    def test_indicators(self):
+        self.assertEqual((Endpoint('10.0.0.0/8').first, Endpoint('10.0.0.0/8').last),
+            (0x0a000000, 0x0affffff))
+        self.assertEqual(Endpoint('port:80-90').kind, 'port')
+        self.assertNotEqual(Endpoint('10.1.2.3'), '10.1.2.3')
+
+        for indicator in ('10.0.0.0/33', '1.2.3.999', 'port:90-80', 'vlan:4096', 'evil.com'):
+            with self.assertRaises(ValueError):
+                Endpoint(indicator)
+
+    def test_match(self):
+        matcher = EndpointMatcher([Endpoint('10.0.0.0/8'), Endpoint('10.1.0.0/16'),
+                        Endpoint('port:443'), Endpoint('vlan:1-10'), Endpoint('2001:db8::/32')])
+        found = match(matcher, '010.001.002.003', 1234, '010.000.000.001', 443, 5, 0, None)
+
+        self.assertEqual(found, {
+            '10.0.0.0/8' : ['SrcIp', 'DestIp'],
+            '10.1.0.0/16' : ['SrcIp'],
+            'port:443' : ['DestPort'],
+            'vlan:1-10' : ['VLAN'],
+        })
+        self.assertEqual(match(matcher, '2001:db8::1', 1, '192.168.1.2', 2, None, 0, None),
+            {'2001:db8::/32' : ['SrcIp']})
+
+    def test_match_invalid_address(self):
+        # an address that does not parse matches nothing, the other fields still do
+        matcher = EndpointMatcher([Endpoint('10.0.0.0/8'), Endpoint('port:443')])
+
+        for address in ('abc:::1', '1.2.3.999'):
+            found = match(matcher, address, 80, '010.000.000.001', 443, None, 0, None)
+            self.assertEqual(found, {'10.0.0.0/8' : ['DestIp'], 'port:443' : ['DestPort']})
+
+class BlacklistPluginTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+
+        self.workspace = Workspace(directory.name)
+        shutil.copytree(os.path.join(REPO_DIR, 'plugins', 'blacklist'),
+            os.path.join(directory.name, 'plugins', 'blacklist'))
+        self.workspace.configure({'active_plugins' : {'plugins' : '\nblacklist'}})
+
+        for name in self.workspace.flows:
+            os.remove(os.path.join(self.workspace.tcpout_dir, name))
+
+        self.flows = {
+            # to the blacklisted IP, and mentioning it
+            '010.000.000.001.01234-198.051.100.007.00080' : b'GET / HTTP/1.1\r\nHost: 198.51.100.7\r\n',
+            # only mentioning it
+            '010.000.000.002.01234-192.168.001.002.00080' : b'redirect to 198.51.100.7\n',
+        }
+
+        for (name, data) in self.flows.items():
+            with open(os.path.join(self.workspace.tcpout_dir, name), 'wb') as f:
+                f.write(data)
+
+    def read_report(self, *path):
+        with open(os.path.join(self.workspace.directory, 'out', *path)) as f:
+            return [line.rstrip('\n').split('\t') for line in f if line[:1].isdigit()]
+
+    def run_blacklist(self):
+        with mock.patch('urllib.request.urlopen', return_value=io.BytesIO(BLACKLIST)):
+            return self.workspace.run('out')
+
+    def test_ips_as_endpoints(self):
+        driver = self.run_blacklist()
+
+        # the IP is only matched against the endpoints of each flow
+        (plugin,) = driver.plugins
+        self.assertEqual(plugin.plugin_object.features, [Endpoint('198.51.100.7')])
+
+        dump = self.workspace.dump('out')
+        self.assertEqual(dump['features'], [('010.000.000.001.01234-198.051.100.007.00080',
+            'malware_blacklist', '198.51.100.7', 'DestIp', None)])
+
+    def test_payload_search(self):
+        self.workspace.configure({'endpoints' : {'payload_search' : '\nblacklist'}})
+        self.run_blacklist()
+
+        # a blacklisted IP in the data of a flow is found whichever endpoints
+        # the flow has
+        dump = self.workspace.dump('out')
+        self.assertEqual(dump['features'], sorted([
+            ('010.000.000.001.01234-198.051.100.007.00080', 'malware_blacklist', '198.51.100.7',
+                '22', None),
+            ('010.000.000.001.01234-198.051.100.007.00080', 'malware_blacklist', '198.51.100.7',
+                'DestIp', None),
+            ('010.000.000.002.01234-192.168.001.002.00080', 'malware_blacklist', '198.51.100.7',
+                '12', None),
+        ], key=repr))
+
+    def test_endpoint_only(self):
+        self.workspace.configure({'endpoints' : {'endpoint_only' : '\nblacklist'}})
+        self.run_blacklist()
+
+        dump = self.workspace.dump('out')
+        self.assertEqual(dump['features'], [('010.000.000.001.01234-198.051.100.007.00080',
+            'malware_blacklist', '198.51.100.7', 'DestIp', None)])
+
+        self.assertEqual(self.read_report('featuretype_histogram.txt'),
+            [['1.', 'malware_blacklist', '1']])
+        self.assertEqual(self.read_report('ip_histogram.txt'),
+            [['1.', '010.000.000.001', '1'], ['2.', '198.051.100.007', '1']])
+        self.assertIn(['1.', '198.51.100.7', '1'], self.read_report('tcpflow_reports',
+            '010.000.000.001.01234-198.051.100.007.00080_report.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
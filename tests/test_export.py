@@ -0,0 +1,68 @@
+import errno
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from tff.export import FlowExporter
+
+class FlowExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.src_dir = os.path.join(directory.name, 'tcpflow_out')
+        self.dst_dir = os.path.join(directory.name, 'tcpflows')
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dst_dir)
+
+        self.flows = []
+
+        for index in range(8):
+            name = '010.000.000.{:03d}.01234-192.168.001.002.00080'.format(index + 1)
+
+            with open(os.path.join(self.src_dir, name), 'wb') as f:
+                f.write(b'flow %d\n' % index)
+
+            self.flows.append((os.path.join(self.src_dir, name),
+                               os.path.join(self.dst_dir, name)))
+
+    def test_copy(self):
+        counts = FlowExporter('copy', 3).export_flows(self.flows)
+
+        self.assertEqual(counts, {'hardlink' : 0, 'reflink' : 0, 'copy' : 8, 'skipped' : 0})
+
+        for (src, dst) in self.flows:
+            with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
+                self.assertEqual(fsrc.read(), fdst.read())
+
+            self.assertFalse(os.path.samefile(src, dst))
+
+        counts = FlowExporter('copy', 3).export_flows(self.flows)
+        self.assertEqual(counts['skipped'], 8)
+
+    def test_fallback_per_flow(self):
+        link = os.link
+        refused = self.flows[0][0]
+
+        # the first flow cannot be linked, which must not stop the others from
+        # being linked
+        def flaky_link(src, dst):
+            if src == refused:
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+            link(src, dst)
+
+        with mock.patch('os.link', flaky_link):
+            counts = FlowExporter('hardlink', 3).export_flows(self.flows)
+
+        self.assertEqual(counts['hardlink'], 7)
+        self.assertEqual(counts['reflink'] + counts['copy'], 1)
+        self.assertFalse(os.path.samefile(*self.flows[0]))
+
+        for (src, dst) in self.flows[1:]:
+            self.assertTrue(os.path.samefile(src, dst))
+
+if __name__ == '__main__':
+    unittest.main()
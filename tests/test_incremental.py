@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+from tests.support import WorkspaceTestCase
+
+class IncrementalTest(WorkspaceTestCase):
+    '''
+    An incremental run over changed features and flows gives the same output
+    as a fresh run.
+
+    '''
+
+    def test_incremental_matches_fresh(self):
+        self.workspace.run('incremental', incremental=True)
+
+        # change the features, and add, change and remove flows
+        with open(os.path.join(self.workspace.ff_dir, 'list.txt'), 'w') as f:
+            f.write('evil.com\nbad@example.org\nlogin\n')
+
+        flows = self.workspace.flows
+
+        with open(os.path.join(self.workspace.tcpout_dir, flows[1]), 'ab') as f:
+            f.write(b'\nsecret login token-123\n')
+
+        os.remove(os.path.join(self.workspace.tcpout_dir, flows[2]))
+
+        with open(os.path.join(self.workspace.tcpout_dir,
+                    '010.009.009.009.01234-010.000.000.001.00443'), 'wb') as f:
+            f.write(b'login to evil.com\n')
+
+        self.workspace.run('incremental', incremental=True)
+        self.workspace.run('fresh')
+
+        self.assertEqual(self.workspace.dump('incremental'), self.workspace.dump('fresh'))
+
+    def test_added_feature_set_matches_fresh(self):
+        self.workspace.configure({'active_plugins' : {'plugins' : '\nlist.txt'}})
+        self.workspace.run('incremental', incremental=True)
+
+        self.workspace.configure({'active_plugins' : {'plugins' : '\nlist.txt\npatterns'}})
+        self.workspace.run('incremental', incremental=True)
+        self.workspace.run('fresh')
+
+        self.assertEqual(self.workspace.dump('incremental'), self.workspace.dump('fresh'))
+
+    def test_unchanged_incremental_run_keeps_output(self):
+        self.workspace.run('incremental', incremental=True)
+        first = self.workspace.dump('incremental')
+
+        self.workspace.run('incremental', incremental=True)
+
+        self.assertEqual(self.workspace.dump('incremental'), first)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import random
+import re
+import sys
+import unittest
+from unittest import mock
+
+from tff import matcher
+from tff.matcher import TOKEN_DELIMITERS, build_matcher
+
+FEATURES = ['evil.com', 'com', 'abc', 'bc', 'abcabc', 'token-123', 'secret', 'ü-umlaut']
+
+PIECES = FEATURES + ['notevil.com', 'abca', 'x', 'secrets', 'GET', '10.1.2.3']
+
+SEPARATORS = ['', ' ', '\r\n', '/', '(', ')', '\x00', '.', '-', 'z']
+
+def make_text(seed, pieces=400):
+    '''
+    Returns text of features, partial features and other words joined by
+    delimiters or nothing at all, so features overlap and run into each other.
+
+    '''
+
+    rand = random.Random(seed)
+
+    return ''.join(rand.choice(PIECES) + rand.choice(SEPARATORS) for _ in range(pieces))
+
+def whole_tokens(hits, buffer, binary):
+    '''
+    Returns the hits of features delimited on both sides in buffer, the hits
+    the token engine is expected to find.
+
+    '''
+
+    delimiters = '[{}]'.format(TOKEN_DELIMITERS)
+
+    if binary:
+        delimiter = re.compile(delimiters.encode('utf-8'))
+    else:
+        delimiter = re.compile(delimiters)
+
+    tokens = []
+
+    for (feature, offset) in hits:
+        pattern = feature.encode('utf-8') if binary else feature
+        end = offset + len(pattern)
+
+        if delimiter.search(pattern):
+            continue
+
+        if (offset == 0 or delimiter.match(buffer, offset - 1)) and \
+                (end == len(buffer) or delimiter.match(buffer, end)):
+            tokens.append((feature, offset))
+
+    return tokens
+
+class EngineParityTest(unittest.TestCase):
+    '''
+    Every engine reports the same offsets for the same features, the token
+    engine those of the occurrences that are whole tokens.
+
+    '''
+
+    def offsets(self, engine, buffer, binary, **options):
+        return sorted(build_matcher(FEATURES, engine, binary, **options).find_offsets(buffer))
+
+    def check_parity(self, buffer, binary):
+        expected = self.offsets('substring', buffer, binary)
+        self.assertTrue(expected)
+
+        self.assertEqual(self.offsets('aho_corasick', buffer, binary), expected)
+
+        tokens = self.offsets('token', buffer, binary)
+        self.assertEqual(tokens, sorted(whole_tokens(expected, buffer, binary)))
+        self.assertTrue(tokens)
+
+        return expected
+
+    def test_binary(self):
+        for seed in range(5):
+            self.check_parity(make_text(seed).encode('utf-8'), True)
+
+    def test_text(self):
+        for seed in range(5):
+            self.check_parity(make_text(seed), False)
+
+    def test_offsets(self):
+        buffer = b'abcabc evil.com\n(token-123)'
+        offsets = self.check_parity(buffer, True)
+
+        self.assertIn(('abcabc', 0), offsets)
+        self.assertIn(('abc', 3), offsets)
+        self.assertIn(('bc', 4), offsets)
+        self.assertIn(('evil.com', 7), offsets)
+        self.assertIn(('com', 12), offsets)
+        self.assertIn(('token-123', 17), offsets)
+
+    def test_chunk_boundaries(self):
+        # small chunks, so many occurrences straddle a chunk boundary
+        buffer = make_text(0).encode('utf-8')
+        expected = self.offsets('substring', buffer, True)
+
+        for chunk_size in (1, 3, 7, 64):
+            with mock.patch.object(matcher, 'CHUNK_SIZE', chunk_size):
+                self.assertEqual(self.offsets('aho_corasick', buffer, True), expected)
+
+            with mock.patch.object(matcher.TokenMatcher, 'chunk_size', chunk_size):
+                self.assertEqual(self.offsets('token', buffer, True),
+                    sorted(whole_tokens(expected, buffer, True)))
+
+    def test_search(self):
+        text = make_text(1)
+        expected = set(build_matcher(FEATURES, 'substring').search(text))
+
+        for engine in ('aho_corasick', 'substring'):
+            found = build_matcher(FEATURES, engine).search(text)
+            self.assertEqual(len(found), len(set(found)))
+            self.assertEqual(set(found), expected)
+
+        tokens = build_matcher(FEATURES, 'token').search(text)
+        self.assertTrue(set(tokens) <= expected)
+
+    def test_undecodable_features(self):
+        # feature files are read with undecodable bytes kept as surrogates
+        feature = b'user\xe9@example.com'.decode('utf-8', 'surrogateescape')
+        buffer = b'from user\xe9@example.com to user@example.com'
+
+        for engine in ('aho_corasick', 'substring'):
+            found = list(build_matcher([feature, 'user@'], engine, True).find_offsets(buffer))
+            self.assertEqual(sorted(found, key=lambda hit: hit[1]), [(feature, 5), ('user@', 26)])
+
+        # \xe9 delimits tokens, so the token engine cannot find the feature
+        found = list(build_matcher([feature, 'user'], 'token', True).find_offsets(buffer))
+        self.assertEqual(found, [('user', 5)])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            build_matcher(FEATURES, 'grep')
+
+if __name__ == '__main__':
+    unittest.main()
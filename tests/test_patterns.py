@@ -0,0 +1,116 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+from tff.matcher import MatcherGroup, build_matcher
+from tff.patterns import Pattern, PatternMatcher, typed_pattern
+from tff.tcp_flow import TcpFlow
+
+FLOW_NAME = '010.000.000.001.01234-192.168.001.002.00080'
+
+TEXT = b'GET / HTTP/1.1\r\nHost: evil.com\r\n\r\nsecret evil.com secret\nnothing here\nevil.com'
+
+class PatternMatcherTest(unittest.TestCase):
+
+    def find(self, names, buffer):
+        matcher = PatternMatcher([typed_pattern(name) for name in names], True)
+
+        return sorted((str(feature), feature.pattern.name, offset)
+                        for (feature, offset) in matcher.find_offsets(buffer))
+
+    def test_typed_patterns(self):
+        buffer = (b'card 4111 1111 1111 1111, not 4111 1111 1111 1112, ip 10.1.2.3 '
+                  b'not 10.1.2.300, v6 fe80::1 mail a.b@evil.com')
+
+        self.assertEqual(self.find(['ccn', 'ipv4', 'ipv6', 'email'], buffer), [
+            ('10.1.2.3', 'ipv4', 54),
+            ('4111 1111 1111 1111', 'ccn', 5),
+            ('a.b@evil.com', 'email', 95),
+            ('fe80::1', 'ipv6', 82),
+        ])
+
+        with self.assertRaises(ValueError):
+            typed_pattern('phone')
+
+    def test_overlapping_patterns(self):
+        # every pattern reports its own matches, even inside those of another
+        self.assertEqual(self.find(['email', 'domain'], b'mail admin@evil.com'), [
+            ('admin@evil.com', 'email', 5),
+            ('evil.com', 'domain', 11),
+        ])
+
+    def test_same_as_separate_searches(self):
+        # the single pass finds what a separate search for each pattern finds,
+        # including matches running past the span of the match that hid them
+        patterns = [Pattern('ab', 'a+b'), Pattern('bc', 'b+c'), Pattern('cab', 'c?ab')]
+        text = 'aabbbc cab abc bbaab aabbc ab'
+
+        for binary in (True, False):
+            buffer = text.encode('utf-8') if binary else text
+            matcher = PatternMatcher(patterns, binary)
+
+            found = sorted((feature.pattern.name, offset, str(feature))
+                            for (feature, offset) in matcher.find_offsets(buffer))
+            expected = sorted((pattern.name, match.start(), text[match.start():match.end()])
+                            for pattern in patterns
+                            for match in re.finditer(pattern.regex, text))
+
+            self.assertEqual(found, expected)
+
+        self.assertEqual(PatternMatcher([], True).search(b'aabbbc'), [])
+
+    def test_group(self):
+        buffer = b'mail bad@example.org from 10.1.2.3 about evil.com'
+        literals = build_matcher(['evil.com'], 'aho_corasick', True)
+        patterns = PatternMatcher([typed_pattern('email'), typed_pattern('ipv4')], True)
+        group = MatcherGroup([literals, patterns])
+
+        found = sorted((str(feature), offset) for (feature, offset) in group.find_offsets(buffer))
+
+        self.assertEqual(found, [('10.1.2.3', 26), ('bad@example.org', 5), ('evil.com', 41)])
+        self.assertEqual(len(group.search(buffer)), 3)
+
+class TaggedPatternsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_flow(self, data):
+        path = os.path.join(self.directory, FLOW_NAME)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return TcpFlow(path)
+
+    def test_find_tagged_features(self):
+        tcp_flow = self.write_flow(TEXT)
+        pattern = Pattern('host', r'Host: [a-z.]+')
+        tags = {'evil.com' : ['a', 'b'], 'secret' : ['a'], pattern : ['b'], 'absent' : ['c']}
+
+        for binary in (True, False):
+            matcher = build_matcher([feature for feature in tags if feature != pattern],
+                        binary=binary)
+            group = MatcherGroup([matcher, PatternMatcher([pattern], binary)])
+
+            tcp_flow.find_tagged_features(['a', 'b', 'c'], tags, group)
+            found = tcp_flow.get_found_features()
+
+            self.assertEqual(sorted(found), ['a', 'b', 'c'])
+            self.assertEqual(sorted(found['a']), ['evil.com', 'secret'])
+            self.assertEqual(found['c'], {})
+
+            matched = [feature for feature in found['b'] if feature != 'evil.com']
+            self.assertEqual([str(feature) for feature in matched], ['Host: evil.com'])
+            self.assertIs(matched[0].pattern, pattern)
+            self.assertEqual(found['b'][matched[0]], [16])
+            self.assertEqual(found['a']['evil.com'], found['b']['evil.com'])
+
+            tcp_flow.clear_found_features()
+
+if __name__ == '__main__':
+    unittest.main()
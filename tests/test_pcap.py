@@ -0,0 +1,212 @@
+import os
+import random
+import socket
+import struct
+import sys
+import tempfile
+import unittest
+
+from tff.pcap import LINKTYPE_ETHERNET, TcpReassembler, iter_pcap_flows
+
+CLIENT = ('10.0.0.1', 40000)
+SERVER = ('192.168.1.2', 80)
+
+SYN = 0x02
+FIN = 0x01
+PSH_ACK = 0x18
+
+def tcp_frame(src, dst, seq, flags, payload=b'', vlan=None):
+    '''
+    Build an Ethernet frame holding an IPv4 TCP segment.  Checksums are left zero.
+
+    '''
+
+    tcp = struct.pack('!HHIIBBHHH', src[1], dst[1], seq % (1 << 32), 0, 5 << 4, flags,
+                65535, 0, 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0,
+                socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+
+    ethernet = b'\x00' * 12
+
+    if vlan is not None:
+        ethernet += struct.pack('!HH', 0x8100, vlan)
+
+    return ethernet + b'\x08\x00' + ip + tcp
+
+def connection(data, isn, mss=10, src=CLIENT, dst=SERVER):
+    '''
+    Returns the SYN, data segments and FIN of one direction of a connection
+    sending data, as (seq, flags, payload) tuples.
+
+    '''
+
+    segments = [(isn, SYN, b'')]
+
+    for offset in range(0, len(data), mss):
+        segments.append((isn + 1 + offset, PSH_ACK, data[offset:offset + mss]))
+
+    segments.append((isn + 1 + len(data), FIN, b''))
+
+    return segments
+
+def write_pcap(path, frames):
+    '''
+    Write Ethernet frames to a pcap file, a millisecond apart.
+
+    '''
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 262144, LINKTYPE_ETHERNET))
+
+        for (index, frame) in enumerate(frames):
+            f.write(struct.pack('<IIII', 1500000000, index * 1000, len(frame), len(frame)))
+            f.write(frame)
+
+class TcpReassemblerTest(unittest.TestCase):
+
+    def reassemble(self, segments, src=CLIENT, dst=SERVER, **limits):
+        reassembler = TcpReassembler(**limits)
+        flows = []
+
+        for (index, (seq, flags, payload)) in enumerate(segments):
+            flows.extend(reassembler.add(index * 0.001, LINKTYPE_ETHERNET,
+                            tcp_frame(src, dst, seq, flags, payload)))
+
+        flows.extend(reassembler.flush())
+
+        return flows
+
+    def assertReassembled(self, segments, data, **limits):
+        flows = self.reassemble(segments, **limits)
+
+        self.assertEqual(len(flows), 1)
+        self.assertEqual(flows[0].data, data)
+
+        return flows[0]
+
+    def test_in_order(self):
+        data = b'GET / HTTP/1.1\r\nHost: evil.com\r\n\r\n'
+        tcp_flow = self.assertReassembled(connection(data, 1000), data)
+
+        self.assertEqual(tcp_flow.filename, '010.000.000.001.40000-192.168.001.002.00080')
+        self.assertEqual(tcp_flow.size, len(data))
+
+    def test_out_of_order(self):
+        data = bytes(range(200))
+        segments = connection(data, 5000)
+        middle = segments[1:-1]
+
+        for seed in range(5):
+            random.Random(seed).shuffle(middle)
+            self.assertReassembled([segments[0]] + middle + [segments[-1]], data)
+
+    def test_retransmission(self):
+        data = b'0123456789abcdefghijklmnopqrstuvwxyz'
+        segments = connection(data, 7)
+
+        # every data segment sent twice, and the first one again at the end
+        retransmitted = [segments[0]]
+        for segment in segments[1:-1]:
+            retransmitted += [segment, segment]
+        retransmitted += [segments[1], segments[-1]]
+
+        self.assertReassembled(retransmitted, data)
+
+    def test_overlapping_segments(self):
+        data = b'0123456789abcdefghijklmnopqrstuvwxyz'
+        isn = 100
+        segment = lambda start, end: (isn + 1 + start, PSH_ACK, data[start:end])
+
+        # a retransmission repacketized with more data
+        self.assertReassembled([(isn, SYN, b''), segment(0, 10), segment(5, 20),
+            segment(0, 25), segment(25, 36)], data)
+
+        # overlapping segments held back until the gap before them is filled
+        self.assertReassembled([(isn, SYN, b''), segment(20, 30), segment(15, 25),
+            segment(25, 36), segment(10, 22), segment(0, 12)], data)
+
+        # of held segments starting at the same byte, the longest wins
+        self.assertReassembled([(isn, SYN, b''), segment(10, 15), segment(10, 36),
+            segment(0, 10)], data)
+
+    def test_gap_never_filled(self):
+        data = b'0123456789abcdefghijklmnopqrstuvwxyz'
+        isn = 100
+        segment = lambda start, end: (isn + 1 + start, PSH_ACK, data[start:end])
+
+        # held segments are appended in order, without their overlap
+        self.assertReassembled([(isn, SYN, b''), segment(0, 5), segment(20, 30),
+            segment(10, 25), segment(32, 36)], data[0:5] + data[10:30] + data[32:36])
+
+    def test_sequence_wraparound(self):
+        data = bytes(range(256)) * 2
+
+        for isn in ((1 << 32) - 1, (1 << 32) - 100, (1 << 32) - 257):
+            segments = connection(data, isn, mss=64)
+            self.assertReassembled(segments, data)
+
+            middle = segments[1:-1]
+            random.Random(isn).shuffle(middle)
+            self.assertReassembled([segments[0]] + middle + [segments[-1]], data)
+
+    def test_directions_and_connections(self):
+        reassembler = TcpReassembler()
+        frames = [tcp_frame(CLIENT, SERVER, seq, flags, payload)
+                    for (seq, flags, payload) in connection(b'request', 1)]
+        frames += [tcp_frame(SERVER, CLIENT, seq, flags, payload)
+                    for (seq, flags, payload) in connection(b'response', 2)]
+        # the same addresses and ports reused for a new connection
+        frames += [tcp_frame(CLIENT, SERVER, seq, flags, payload)
+                    for (seq, flags, payload) in connection(b'again', 3000)]
+
+        flows = []
+
+        for frame in frames:
+            flows.extend(reassembler.add(0.0, LINKTYPE_ETHERNET, frame))
+
+        flows.extend(reassembler.flush())
+
+        self.assertEqual(sorted((tcp_flow.filename, tcp_flow.data) for tcp_flow in flows), [
+            ('010.000.000.001.40000-192.168.001.002.00080', b'request'),
+            ('010.000.000.001.40000-192.168.001.002.00080c1', b'again'),
+            ('192.168.001.002.00080-010.000.000.001.40000', b'response'),
+        ])
+
+    def test_memory_limit(self):
+        # streams emitted early continue as a new flow
+        data = b'x' * 100
+        flows = self.reassemble(connection(data, 1), max_buffered_bytes=50)
+
+        self.assertEqual(b''.join(tcp_flow.data for tcp_flow in flows), data)
+        self.assertEqual([tcp_flow.connection_number for tcp_flow in flows],
+            list(range(len(flows))))
+
+class PcapFlowTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'capture.pcap')
+
+    def test_iter_pcap_flows(self):
+        data = b'\xff\xfe binary\n\x80 Host: evil.com\r\nsecret evil.com\n'
+        segments = connection(data, 99, mss=7)
+        frames = [tcp_frame(CLIENT, SERVER, seq, flags, payload, vlan=12)
+                    for (seq, flags, payload) in segments[:1] + segments[1:-1][::-1] + segments[-1:]]
+        write_pcap(self.path, frames)
+
+        flows = list(iter_pcap_flows(self.path))
+
+        self.assertEqual(len(flows), 1)
+        self.assertEqual(flows[0].data, data)
+        self.assertEqual(flows[0].vlan, 12)
+
+        # text mode positions are byte offsets of lines, like those of tcpflow files
+        flows[0].find_features('list', ['evil.com', 'secret'])
+        self.assertEqual(flows[0].get_found_features()['list'], {
+            'evil.com' : [10, 28],
+            'secret' : [28],
+        })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from tff.progress import Progress
+
+class ProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.status_path = os.path.join(directory.name, 'status.json')
+        self.stream = io.StringIO()
+
+    def progress(self):
+        return Progress(True, 0.0, self.status_path, 0.0, self.stream)
+
+    def status(self):
+        with open(self.status_path) as f:
+            return json.load(f)
+
+    def test_totals(self):
+        progress = self.progress()
+        progress.start('scan', 4, 4 << 20)
+        progress.update(1 << 20, 2)
+        progress.update(3 << 20, 0, skipped=True)
+
+        status = self.status()
+        self.assertEqual((status['flows'], status['total_flows'], status['bytes'],
+                    status['total_bytes'], status['hits']), (2, 4, 4 << 20, 4 << 20, 2))
+        # every byte is accounted for, so nothing is left whatever the rate
+        self.assertEqual(status['eta'], 0)
+        self.assertIn('2/4 flows (50.0%), 4.0/4.0 MiB', self.stream.getvalue())
+
+        progress.finish()
+        progress.close()
+        self.assertEqual(self.status()['state'], 'done')
+
+    def count_total(self, progress, total):
+        '''
+        Start counting the total of the current pass, returning a function that
+        lets the count finish and waits for it.
+
+        '''
+
+        counting = threading.Event()
+
+        def count():
+            counting.wait()
+            return total
+
+        progress.count_total(count)
+        (thread,) = [thread for thread in threading.enumerate() if thread.name == 'count_total']
+
+        def finish():
+            counting.set()
+            thread.join()
+
+        return finish
+
+    def test_count_total(self):
+        progress = self.progress()
+        progress.start('scan')
+        finish = self.count_total(progress, (10, 1 << 20))
+
+        # the pass goes on while counting
+        progress.update(1000)
+        self.assertIsNone(self.status()['total_flows'])
+        self.assertIn('1 flows, 0.0 MiB,', self.stream.getvalue())
+
+        finish()
+        progress.update(1000)
+
+        status = self.status()
+        self.assertEqual((status['total_flows'], status['total_bytes']), (10, 1 << 20))
+        self.assertIsNotNone(status['eta'])
+        self.assertIn('2/10 flows (20.0%), 0.0/1.0 MiB', self.stream.getvalue())
+
+    def test_count_total_of_finished_pass(self):
+        progress = self.progress()
+        progress.start('scan')
+        finish = self.count_total(progress, (10, 1 << 20))
+
+        progress.start('scan for added features', 3)
+        finish()
+
+        self.assertEqual((progress.total, progress.total_bytes), (3, None))
+
+if __name__ == '__main__':
+    unittest.main()
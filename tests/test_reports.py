@@ -0,0 +1,307 @@
+import configparser
+import os
+import sys
+import tempfile
+import unittest
+
+from tff.database_builder import DatabaseController
+from tff.report_builder import ReportBuilder
+from tff.tcp_flow import TcpFlow
+
+REPORTS = ['feature_type_hist', 'ip_hist', 'ip_report', 'tcpflow_report']
+
+# 10.0.0.1 and 192.168.1.2 are each the source of one flow and the destination
+# of another, and the last flow has no features
+FLOWS = [
+    '010.000.000.001.01234-192.168.001.002.00080',
+    '010.000.000.001.02345-172.016.000.009.00443',
+    '172.016.000.009.00443-010.000.000.003.05555',
+    '192.168.001.002.00080-010.000.000.001.01234',
+]
+
+# (flow, feature type, feature, position, pattern), with features repeated in a
+# flow, across flows and across feature types
+FEATURES = [
+    (FLOWS[0], 'list.txt', 'evil.com', '10', None),
+    (FLOWS[0], 'list.txt', 'evil.com', '50', None),
+    (FLOWS[0], 'list.txt', 'secret', '70', None),
+    (FLOWS[0], 'patterns', '10.1.2.3', '30', 'ipv4'),
+    (FLOWS[0], 'blacklist', '192.168.1.2', 'DestIp', None),
+    (FLOWS[1], 'list.txt', 'secret', '0', None),
+    (FLOWS[3], 'list.txt', 'evil.com', '5', None),
+    (FLOWS[3], 'patterns', 'bad@example.org', '40', 'email'),
+    (FLOWS[3], 'blacklist', '192.168.1.2', 'SrcIp', None),
+]
+
+HEADER = '# TcpFeatureFinder v1.0\n'
+
+def write_database(db_path, flows=FLOWS, features=FEATURES, batch_size=10000):
+    '''
+    Write a database holding the given flows and found features, as a run would.
+
+    Returns:
+        the DatabaseController of the database
+    '''
+
+    db_controller = DatabaseController(db_path, batch_size)
+
+    for flow_fn in flows:
+        db_controller.add_tcp_flow_to_batch(TcpFlow(flow_fn, size=0, mtime=0.0))
+
+    for (flow_fn, feature_type, feature, position, pattern) in features:
+        db_controller.add_feature_to_batch(flow_fn, feature_type, feature, position,
+            pattern=pattern)
+
+    db_controller.flush_batches()
+    db_controller.create_indexes()
+
+    return db_controller
+
+def build_reports(db_controller, outdir, workers=1):
+    config = configparser.ConfigParser()
+    config.add_section('reports')
+    config.set('reports', 'reports', '\n'.join(REPORTS))
+
+    ReportBuilder(config, db_controller, outdir, workers).generate_reports()
+
+def read_reports(outdir):
+    '''
+    Returns the contents of every report in outdir.
+
+    Returns:
+        dictionary of the form { 'path relative to outdir' : b'contents' }
+    '''
+
+    reports = {}
+
+    for (dirpath, dirnames, filenames) in os.walk(outdir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+
+            with open(path, 'rb') as f:
+                reports[os.path.relpath(path, outdir)] = f.read()
+
+    return reports
+
+class ReportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def build(self, name, workers=1, **options):
+        db_controller = write_database(os.path.join(self.directory, name + '.db'), **options)
+        outdir = os.path.join(self.directory, name)
+        os.makedirs(outdir)
+        build_reports(db_controller, outdir, workers)
+
+        return read_reports(outdir)
+
+class ReportContentTest(ReportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reports = {path : contents.decode('utf-8')
+                            for (path, contents) in self.build('out').items()}
+
+    def test_report_files(self):
+        self.assertEqual(sorted(self.reports), [
+            'featuretype_histogram.txt',
+            'ip_histogram.txt',
+            os.path.join('ip_reports', '010.000.000.001_report.txt'),
+            os.path.join('ip_reports', '172.016.000.009_report.txt'),
+            os.path.join('ip_reports', '192.168.001.002_report.txt'),
+            os.path.join('tcpflow_reports', FLOWS[0] + '_report.txt'),
+            os.path.join('tcpflow_reports', FLOWS[1] + '_report.txt'),
+            os.path.join('tcpflow_reports', FLOWS[3] + '_report.txt'),
+        ])
+
+    def test_feature_type_histogram(self):
+        # least common first
+        self.assertEqual(self.reports['featuretype_histogram.txt'], HEADER +
+            '# Feature Type Histogram\n'
+            '\n'
+            '1.\tblacklist\t2\n'
+            '2.\tpatterns\t2\n'
+            '3.\tlist.txt\t5\n')
+
+    def test_ip_histogram(self):
+        # each flow counts for both of its IPs
+        self.assertEqual(self.reports['ip_histogram.txt'], HEADER +
+            '# IP Histogram of Found Features\n'
+            '\n'
+            '1.\t010.000.000.001\t9\n'
+            '2.\t192.168.001.002\t8\n'
+            '3.\t172.016.000.009\t1\n')
+
+    def test_ip_reports(self):
+        self.assertEqual(self.reports[os.path.join('ip_reports', '010.000.000.001_report.txt')],
+            HEADER +
+            '# 010.000.000.001 Feature Report\n'
+            '\n'
+            'Unique Features Found: 5\n'
+            'Features Found: 9\n'
+            'Feature Types Found: 6\n'
+            '\n'
+            'All Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tevil.com\t3\n'
+            '2.\t192.168.1.2\t2\n'
+            '3.\tsecret\t2\n'
+            '4.\t10.1.2.3\t1\n'
+            '5.\tbad@example.org\t1\n'
+            '\n'
+            'Src Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tevil.com\t2\n'
+            '2.\tsecret\t2\n'
+            '3.\t10.1.2.3\t1\n'
+            '4.\t192.168.1.2\t1\n'
+            '\n'
+            'Dest Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\t192.168.1.2\t1\n'
+            '2.\tbad@example.org\t1\n'
+            '3.\tevil.com\t1\n'
+            '\n'
+            'IP interaction histogram by number of features found\n'
+            'Rank\tIP\tCount\n'
+            '1.\t192.168.001.002\t8\n'
+            '2.\t172.016.000.009\t1\n')
+
+        self.assertEqual(self.reports[os.path.join('ip_reports', '192.168.001.002_report.txt')],
+            HEADER +
+            '# 192.168.001.002 Feature Report\n'
+            '\n'
+            'Unique Features Found: 5\n'
+            'Features Found: 8\n'
+            'Feature Types Found: 6\n'
+            '\n'
+            'All Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tevil.com\t3\n'
+            '2.\t192.168.1.2\t2\n'
+            '3.\t10.1.2.3\t1\n'
+            '4.\tbad@example.org\t1\n'
+            '5.\tsecret\t1\n'
+            '\n'
+            'Src Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\t192.168.1.2\t1\n'
+            '2.\tbad@example.org\t1\n'
+            '3.\tevil.com\t1\n'
+            '\n'
+            'Dest Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tevil.com\t2\n'
+            '2.\t10.1.2.3\t1\n'
+            '3.\t192.168.1.2\t1\n'
+            '4.\tsecret\t1\n'
+            '\n'
+            'IP interaction histogram by number of features found\n'
+            'Rank\tIP\tCount\n'
+            '1.\t010.000.000.001\t8\n')
+
+        self.assertEqual(self.reports[os.path.join('ip_reports', '172.016.000.009_report.txt')],
+            HEADER +
+            '# 172.016.000.009 Feature Report\n'
+            '\n'
+            'Unique Features Found: 1\n'
+            'Features Found: 1\n'
+            'Feature Types Found: 1\n'
+            '\n'
+            'All Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tsecret\t1\n'
+            '\n'
+            'Src Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '\n'
+            'Dest Found Features Histogram\n'
+            'Rank\tFeature\tCount\n'
+            '1.\tsecret\t1\n'
+            '\n'
+            'IP interaction histogram by number of features found\n'
+            'Rank\tIP\tCount\n'
+            '1.\t010.000.000.001\t1\n')
+
+    def test_tcpflow_reports(self):
+        self.assertEqual(self.reports[os.path.join('tcpflow_reports', FLOWS[0] + '_report.txt')],
+            HEADER +
+            '# {} TcpFlow Report\n'.format(FLOWS[0]) +
+            '\n'
+            'Source: 010.000.000.001\n'
+            'Destination: 192.168.001.002\n'
+            'Total Features Found: 5\n'
+            'Total Feature Types Found: 3\n'
+            '\n'
+            'Feature Types Found\n'
+            'blacklist\n'
+            'list.txt\n'
+            'patterns\n'
+            '\n'
+            'Features Found\n'
+            '1.\tevil.com\t2\n'
+            '2.\t10.1.2.3\t1\n'
+            '3.\t192.168.1.2\t1\n'
+            '4.\tsecret\t1\n')
+
+        self.assertEqual(self.reports[os.path.join('tcpflow_reports', FLOWS[1] + '_report.txt')],
+            HEADER +
+            '# {} TcpFlow Report\n'.format(FLOWS[1]) +
+            '\n'
+            'Source: 010.000.000.001\n'
+            'Destination: 172.016.000.009\n'
+            'Total Features Found: 1\n'
+            'Total Feature Types Found: 1\n'
+            '\n'
+            'Feature Types Found\n'
+            'list.txt\n'
+            '\n'
+            'Features Found\n'
+            '1.\tsecret\t1\n')
+
+        self.assertEqual(self.reports[os.path.join('tcpflow_reports', FLOWS[3] + '_report.txt')],
+            HEADER +
+            '# {} TcpFlow Report\n'.format(FLOWS[3]) +
+            '\n'
+            'Source: 192.168.001.002\n'
+            'Destination: 010.000.000.001\n'
+            'Total Features Found: 3\n'
+            'Total Feature Types Found: 3\n'
+            '\n'
+            'Feature Types Found\n'
+            'blacklist\n'
+            'list.txt\n'
+            'patterns\n'
+            '\n'
+            'Features Found\n'
+            '1.\t192.168.1.2\t1\n'
+            '2.\tbad@example.org\t1\n'
+            '3.\tevil.com\t1\n')
+
+class ParallelReportTest(ReportTestCase):
+
+    def test_same_reports_as_serial(self):
+        # 23 flows between 13 IPs, split into ranges that do not divide evenly
+        # between the workers
+        flows = ['010.000.000.{:03d}.{:05d}-192.168.001.{:03d}.00080'.format(
+                    index % 7 + 1, 1024 + index, index % 6 + 1) for index in range(23)]
+        features = [(flow_fn, 'list.txt' if index % 3 else 'patterns', 'feature{}'.format(
+                        index * feature % 5), str(feature), None)
+                        for (index, flow_fn) in enumerate(flows)
+                        for feature in range(index % 4 + 1)]
+
+        serial = self.build('serial', flows=flows, features=features)
+        parallel = self.build('parallel', workers=3, flows=flows, features=features)
+
+        self.assertEqual(len([path for path in serial if path.startswith('ip_reports')]), 13)
+        self.assertEqual(len([path for path in serial if path.startswith('tcpflow_reports')]), 23)
+        self.assertEqual(sorted(parallel), sorted(serial))
+
+        for path in serial:
+            self.assertEqual(parallel[path], serial[path], path)
+
+if __name__ == '__main__':
+    unittest.main()
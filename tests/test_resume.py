@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+from tests.support import WorkspaceTestCase
+
+class Interrupted(Exception):
+    pass
+
+class ResumeTest(WorkspaceTestCase):
+    '''
+    A run resumed after an interruption gives the same output as a fresh run.
+
+    '''
+
+    def test_resume_matches_fresh(self):
+        # flush every row right away, so the interrupted run leaves partial output
+        self.workspace.configure({'database' : {'batch_size' : 1}})
+
+        driver = self.workspace.driver('resumed')
+        record_scanned_flow = driver.record_scanned_flow
+        recorded = []
+
+        def interrupt(tcp_flow, *args):
+            if len(recorded) == len(self.workspace.flows) // 2:
+                raise Interrupted()
+
+            recorded.append(tcp_flow.filename)
+            record_scanned_flow(tcp_flow, *args)
+
+        driver.record_scanned_flow = interrupt
+
+        with self.workspace.working_dir(), self.assertRaises(Interrupted):
+            driver.run()
+
+        driver.db_controller.session.close()
+        interrupted = self.workspace.dump('resumed')
+        self.assertEqual(len(interrupted['flows']), len(recorded))
+        self.assertFalse(interrupted['reports'])
+
+        self.workspace.run('resumed', resume=True)
+        self.workspace.run('fresh')
+
+        self.assertEqual(self.workspace.dump('resumed'), self.workspace.dump('fresh'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import unittest
+
+from tests.support import WorkspaceTestCase
+
+class DriverTest(WorkspaceTestCase):
+    '''
+    Runs the Driver end to end on a small corpus and checks that every way of
+    getting to the same output gives the same output.
+
+    '''
+
+    def test_finds_features(self):
+        self.workspace.run('out')
+        dump = self.workspace.dump('out')
+
+        found = {(feature_type, feature) for (name, feature_type, feature, position, pattern)
+                    in dump['features']}
+
+        for feature in ('evil.com', 'bad@example.org', 'secret', 'token-123'):
+            self.assertIn(('list.txt', feature), found)
+
+        self.assertIn(('patterns', '10.1.2.3'), found)
+        self.assertIn(('patterns', 'x@y.io'), found)
+        self.assertEqual(len(dump['flows']), len(self.workspace.flows))
+        # the empty flow has no features, so it is not exported
+        self.assertEqual(len(dump['exported']), len(self.workspace.flows) - 1)
+
+    def test_run_stats(self):
+        self.workspace.run('out')
+        dump = self.workspace.dump('out')
+
+        with open(os.path.join(self.directory, 'out', 'run_stats.json')) as f:
+            stats = json.load(f)
+
+        self.assertEqual(set(stats['phases']), {'get_features', 'diff_feature_sets', 'scan',
+            'build_scanners', 'save_feature_sets', 'database_insert', 'create_indexes',
+            'plugin_reports', 'reports', 'export_flows', 'cache'})
+
+        sizes = [os.path.getsize(os.path.join(self.workspace.tcpout_dir, name))
+                    for name in self.workspace.flows]
+        scan = stats['phases']['scan']
+        self.assertEqual((scan['flows'], scan['bytes'], scan['hits']),
+            (len(sizes), sum(sizes), len(dump['features'])))
+        self.assertGreater(scan['wall'], 0)
+        self.assertEqual(scan['flows_per_s'], scan['flows'] / scan['wall'])
+
+        database_insert = stats['phases']['database_insert']
+        self.assertEqual((database_insert['features'], database_insert['tcpflows']),
+            (len(dump['features']), len(dump['flows'])))
+        self.assertEqual(stats['phases']['export_flows']['flows'], len(dump['exported']))
+
+        self.assertEqual(sorted(stats['plugins']), ['list.txt', 'patterns'])
+
+        for (feature_type, plugin) in stats['plugins'].items():
+            rows = len([row for row in dump['features'] if row[1] == feature_type])
+
+            self.assertTrue(rows)
+            self.assertEqual((plugin['scan']['flows'], plugin['scan']['bytes']),
+                (len(sizes), sum(sizes)))
+            # the plugins keep every hit
+            self.assertEqual(plugin['scan']['hits'], rows)
+            self.assertEqual(plugin['filter_features']['kept'], rows)
+            self.assertEqual(plugin['database_insert']['rows'], rows)
+            self.assertEqual(plugin['get_features']['calls'], 1)
+
+    def test_text_read_mode(self):
+        self.workspace.configure({'scan' : {'read_mode' : 'text', 'context_bytes' : 8,
+                                    'store_context' : 'yes'}})
+        self.workspace.run('serial')
+        self.workspace.run('workers', workers=2)
+        self.workspace.configure({'scan' : {'mode' : 'per_plugin'}})
+        self.workspace.run('per_plugin')
+
+        dump = self.workspace.dump('serial')
+        self.assertTrue(dump['features'])
+        self.assertEqual(self.workspace.dump('workers'), dump)
+        self.assertEqual(self.workspace.dump('per_plugin'), dump)
+
+        # positions are the byte offsets of the lines holding the features,
+        # binary flows included
+        for (name, feature_type, feature, position, pattern) in dump['features']:
+            with open(os.path.join(self.workspace.tcpout_dir, name), 'rb') as f:
+                data = f.read()
+
+            position = int(position)
+            line = data[position:data.find(b'\n', position) + 1 or len(data)]
+
+            self.assertTrue(position == 0 or data[position - 1:position] == b'\n')
+            self.assertIn(feature.encode('utf-8', 'surrogateescape'), line)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import unittest
+
+from tests.support import WorkspaceTestCase
+
+class ScanModeTest(WorkspaceTestCase):
+    '''
+    Scanning each flow once for all plugins gives the same output as scanning
+    it once per plugin.
+
+    '''
+
+    def test_per_plugin_matches_combined(self):
+        self.workspace.run('combined')
+        self.workspace.configure({'scan' : {'mode' : 'per_plugin'}})
+        self.workspace.run('per_plugin')
+
+        self.assertEqual(self.workspace.dump('per_plugin'), self.workspace.dump('combined'))
+
+    def test_per_plugin_matches_combined_text(self):
+        self.workspace.configure({'scan' : {'read_mode' : 'text'}})
+        self.workspace.run('combined')
+        self.workspace.configure({'scan' : {'mode' : 'per_plugin'}})
+        self.workspace.run('per_plugin')
+
+        self.assertEqual(self.workspace.dump('per_plugin'), self.workspace.dump('combined'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import collections
+import os
+import sys
+import tempfile
+import unittest
+
+from tff.endpoints import Endpoint
+from tff.matcher import AhoCorasickMatcher, MatcherGroup, TokenMatcher
+from tff.patterns import PatternMatcher, typed_pattern
+from tff.scanner import FeatureScanner
+from tff.tcp_flow import TcpFlow
+
+DATA = b'mail bad@example.org from 10.1.2.3 about evil.com\nsecret\n'
+
+class FeatureScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, '010.000.000.001.01234-192.168.001.002.00080')
+
+        with open(self.path, 'wb') as f:
+            f.write(DATA)
+
+    def scan(self, feature_sets, **options):
+        scanner = FeatureScanner(collections.OrderedDict(feature_sets), **options)
+        tcp_flow = TcpFlow(self.path)
+        scanner.scan(tcp_flow)
+
+        return (scanner, {feature_type: {str(feature): positions
+                            for (feature, positions) in found.items()}
+                            for (feature_type, found) in tcp_flow.get_found_features().items()})
+
+    def test_matchers(self):
+        patterns = [typed_pattern('email'), typed_pattern('ipv4')]
+
+        (scanner, found) = self.scan([('patterns', patterns)])
+        self.assertEqual([type(matcher) for (types, tags, matcher) in scanner.groups],
+            [PatternMatcher])
+        self.assertEqual(found, {'patterns' : {'bad@example.org' : [5], '10.1.2.3' : [26]}})
+
+        (scanner, found) = self.scan([('list', ['evil.com'])])
+        self.assertEqual([type(matcher) for (types, tags, matcher) in scanner.groups],
+            [AhoCorasickMatcher])
+
+        (scanner, found) = self.scan([('list', ['evil.com']), ('patterns', patterns)])
+        self.assertEqual([type(matcher) for (types, tags, matcher) in scanner.groups],
+            [MatcherGroup])
+        self.assertEqual(found, {
+            'list' : {'evil.com' : [41]},
+            'patterns' : {'bad@example.org' : [5], '10.1.2.3' : [26]},
+        })
+
+    def test_patterns_per_plugin_match_combined(self):
+        # the email pattern of one feature type must not hide the domain in it
+        # from another
+        feature_sets = [('a', [typed_pattern('email')]), ('b', [typed_pattern('domain')])]
+
+        (scanner, combined) = self.scan(feature_sets)
+        per_plugin = {}
+
+        for feature_set in feature_sets:
+            per_plugin.update(self.scan([feature_set])[1])
+
+        self.assertEqual(combined, per_plugin)
+        self.assertEqual(combined, {
+            'a' : {'bad@example.org' : [5]},
+            'b' : {'example.org' : [9], 'evil.com' : [41]},
+        })
+
+    def test_engines(self):
+        # a group per engine, each with the feature types using it
+        (scanner, found) = self.scan([('list', ['evil.com', 'secret']), ('tokens', ['secret']),
+                                ('patterns', [typed_pattern('ipv4')])],
+                                engines={'tokens' : 'token'})
+
+        self.assertEqual([(types, type(matcher)) for (types, tags, matcher) in scanner.groups],
+            [(['list', 'patterns'], MatcherGroup), (['tokens'], TokenMatcher)])
+        self.assertEqual(found, {
+            'list' : {'evil.com' : [41], 'secret' : [50]},
+            'tokens' : {'secret' : [50]},
+            'patterns' : {'10.1.2.3' : [26]},
+        })
+
+    def test_endpoints(self):
+        (scanner, found) = self.scan([('blacklist', [Endpoint('10.0.0.0/8'), Endpoint('port:80')]),
+                                ('list', ['evil.com', Endpoint('192.168.1.2')])])
+
+        self.assertEqual(len(scanner.groups), 1)
+        self.assertEqual(found, {
+            'blacklist' : {'10.0.0.0/8' : ['SrcIp'], 'port:80' : ['DestPort']},
+            'list' : {'evil.com' : [41], '192.168.1.2' : ['DestIp']},
+        })
+
+        # flows are not read at all when there are only endpoints
+        (scanner, found) = self.scan([('blacklist', [Endpoint('010.000.000.001')])])
+        self.assertEqual(scanner.groups, [])
+        self.assertEqual(found, {'blacklist' : {'010.000.000.001' : ['SrcIp']}})
+
+if __name__ == '__main__':
+    unittest.main()
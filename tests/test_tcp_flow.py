@@ -0,0 +1,153 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from tff.matcher import build_matcher
+from tff.tcp_flow import TcpFlow, count_tcp_flows, iter_tcp_flows, parse_flow_name
+
+FLOW_NAME = '010.000.000.001.01234-192.168.001.002.00080'
+
+TEXT = b'GET / HTTP/1.1\r\nHost: evil.com\r\n\r\nsecret evil.com secret\nnothing here\nevil.com'
+
+class TcpFlowTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_flow(self, data, name=FLOW_NAME):
+        path = os.path.join(self.directory, name)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return TcpFlow(path)
+
+    def test_flow_name(self):
+        tcp_flow = self.write_flow(b'', '1480000000T010.000.000.001.01234-192.168.001.002.00080--12c3')
+
+        self.assertEqual((tcp_flow.source_ip, tcp_flow.source_port, tcp_flow.dest_ip,
+                    tcp_flow.dest_port, tcp_flow.vlan, tcp_flow.connection_number,
+                    tcp_flow.timestamp),
+                    ('010.000.000.001', 1234, '192.168.001.002', 80, 12, 3, 1480000000))
+        self.assertEqual(tcp_flow.size, 0)
+
+        self.assertEqual(parse_flow_name('2001:0db8:0000:0000:0000:0000:0000:0001.00080-'
+                    '::ffff:10.0.0.1.40000c1')[:5],
+                    ('2001:0db8:0000:0000:0000:0000:0000:0001', 80, '::ffff:10.0.0.1', 40000, None))
+        # ISO 8601 timestamps written by tcpflow -FT
+        for prefix in ('2016-11-24T15:06:40Z', '2016-11-24T15:06:40.250Z',
+                       '2016-11-24T16:06:40+01:00', '2016-11-24T10:06:40-0500'):
+            self.assertEqual(parse_flow_name(prefix + FLOW_NAME + 'c2'),
+                ('010.000.000.001', 1234, '192.168.001.002', 80, None, 2, 1480000000))
+
+        self.assertEqual(parse_flow_name('2016-11-24T15:06:40Z2001:db8::1.00080-'
+                    '010.000.000.001.00443').timestamp, 1480000000)
+
+        self.assertEqual(parse_flow_name('255.255.255.255.65535-000.000.000.000.00000')[:4],
+                    ('255.255.255.255', 65535, '000.000.000.000', 0))
+
+        for name in ('report.xml', '010.000.000.001.99999-192.168.001.002.00080', 'a.1-b.2',
+                     'abc:::12345.00080-010.000.000.001.00443',
+                     '1.2.3.999.00080-010.000.000.001.00443',
+                     '010.000.000.001.00080-256.000.000.001.00443',
+                     '1.2.3.00080-010.000.000.001.00443',
+                     '1.2.3.4.5.00080-010.000.000.001.00443',
+                     '0001.002.003.004.00080-010.000.000.001.00443',
+                     '2001:db8::1::2.00080-010.000.000.001.00443',
+                     ':.00080-010.000.000.001.00443',
+                     '2016-13-24T15:06:40Z' + FLOW_NAME,
+                     '2016-11-24T15:06:40' + FLOW_NAME,
+                     '2016-11-24 15:06:40Z' + FLOW_NAME):
+            with self.assertRaises(ValueError):
+                parse_flow_name(name)
+
+    def test_find_features_binary(self):
+        tcp_flow = self.write_flow(TEXT)
+        features = ['evil.com', 'secret', 'absent']
+        tcp_flow.find_features('list', features, build_matcher(features, binary=True))
+
+        found = tcp_flow.get_found_features()
+
+        self.assertEqual(list(found), ['list'])
+        self.assertEqual(found['list'], {
+            'evil.com' : [22, 41, 70],
+            'secret' : [34, 50],
+        })
+
+        for (feature, offsets) in found['list'].items():
+            for offset in offsets:
+                self.assertEqual(TEXT[offset:offset + len(feature)], feature.encode('utf-8'))
+
+    def test_find_features_text(self):
+        tcp_flow = self.write_flow(TEXT)
+
+        # without a matcher, flows are read as text and lines are recorded
+        tcp_flow.find_features('list', ['evil.com', 'secret', 'absent'])
+
+        self.assertEqual(tcp_flow.get_found_features(), {'list' : {
+            'evil.com' : [16, 34, 70],
+            'secret' : [34],
+        }})
+
+    def test_find_features_text_binary(self):
+        # undecodable bytes, lone carriage returns and NULs do not shift positions
+        data = b'\xff\xfe\x00evil.com\r\x80secret\n\xc3\xa9\xc3 secret\n\n\xffevil.com\xff'
+        tcp_flow = self.write_flow(data)
+        tcp_flow.find_features('list', ['evil.com', 'secret'])
+
+        self.assertEqual(tcp_flow.get_found_features()['list'], {
+            'evil.com' : [0, 32],
+            'secret' : [0, 20],
+        })
+
+        for position in (0, 20, 32):
+            self.assertTrue(position == 0 or data[position - 1:position] == b'\n')
+
+class IterTcpFlowsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, *names):
+        for name in names:
+            path = os.path.join(self.directory, name)
+
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            with open(path, 'wb') as f:
+                f.write(b'data')
+
+    def names(self, recursive):
+        return sorted(tcp_flow.filename for tcp_flow in iter_tcp_flows(self.directory, recursive))
+
+    def test_count_matches_flows(self):
+        # names the loose pattern accepts but parse_flow_name rejects are not counted
+        self.write(FLOW_NAME, 'report.xml', 'notes.txt',
+            '010.000.000.001.99999-192.168.001.002.00080', '10.1-192.168.001.002.00080',
+            os.path.join('run2', '010.000.000.002.01234-192.168.001.002.00080'))
+
+        for recursive in (False, True):
+            names = self.names(recursive)
+            self.assertEqual(count_tcp_flows(self.directory, recursive),
+                (len(names), 4 * len(names)))
+
+        self.assertEqual(self.names(False), [FLOW_NAME])
+        self.assertEqual(self.names(True),
+            [FLOW_NAME, '010.000.000.002.01234-192.168.001.002.00080'])
+
+    def test_duplicate_names(self):
+        self.write(FLOW_NAME, os.path.join('run2', FLOW_NAME))
+
+        self.assertEqual(self.names(False), [FLOW_NAME])
+
+        with self.assertRaises(ValueError):
+            self.names(True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+from tff.matcher import TOKEN_DELIMITERS, build_matcher
+from tff.tcp_flow import iter_tcp_flows
+from tests.support import LIST_FEATURES, write_corpus
+
+FEATURES = LIST_FEATURES + ['notevil.com', 'login', 'user', 'com', 'in']
+
+class TokenEngineTest(unittest.TestCase):
+    '''
+    Validates the token engine against TcpFlow.find_features with the
+    aho_corasick engine on a small generated corpus: its hits must be exactly
+    the whole token hits of aho_corasick.
+
+    '''
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        write_corpus(directory.name, flows=40, seed=1)
+        self.tcp_flows = sorted(iter_tcp_flows(directory.name), key=lambda tcp_flow: tcp_flow.filename)
+        self.delimiter = re.compile('[{}]'.format(TOKEN_DELIMITERS).encode('utf-8'))
+
+    def find_features(self, engine, binary):
+        matcher = build_matcher(FEATURES, engine, binary)
+        results = {}
+
+        for tcp_flow in self.tcp_flows:
+            tcp_flow.find_features('list', FEATURES, matcher)
+            results[tcp_flow.filename] = tcp_flow.get_found_features()['list']
+            tcp_flow.clear_found_features()
+
+        return results
+
+    def whole_tokens(self, tcp_flow, found):
+        with open(tcp_flow.path, 'rb') as f:
+            data = f.read()
+
+        tokens = {}
+
+        for (feature, positions) in found.items():
+            length = len(feature.encode('utf-8'))
+
+            for position in positions:
+                end = position + length
+
+                if (position == 0 or self.delimiter.match(data, position - 1)) and \
+                        (end == len(data) or self.delimiter.match(data, end)):
+                    tokens.setdefault(feature, []).append(position)
+
+        return (data, tokens)
+
+    def test_binary(self):
+        aho_corasick = self.find_features('aho_corasick', True)
+        token = self.find_features('token', True)
+        total = 0
+
+        for tcp_flow in self.tcp_flows:
+            (data, expected) = self.whole_tokens(tcp_flow, aho_corasick[tcp_flow.filename])
+            found = {feature: sorted(positions)
+                        for (feature, positions) in token[tcp_flow.filename].items()}
+
+            self.assertEqual(found, expected, tcp_flow.filename)
+            total += sum(len(positions) for positions in found.values())
+
+        # the corpus holds both whole tokens and features inside other tokens
+        self.assertTrue(total)
+        self.assertNotEqual(token, aho_corasick)
+
+    def test_text(self):
+        # in text mode the lines holding whole token hits are found
+        aho_corasick = self.find_features('aho_corasick', True)
+        token = self.find_features('token', False)
+
+        for tcp_flow in self.tcp_flows:
+            (data, expected) = self.whole_tokens(tcp_flow, aho_corasick[tcp_flow.filename])
+            lines = {feature: sorted({data.rfind(b'\n', 0, position) + 1 for position in positions})
+                        for (feature, positions) in expected.items()}
+
+            self.assertEqual(token[tcp_flow.filename], lines, tcp_flow.filename)
+
+class TokenMatcherTest(unittest.TestCase):
+
+    def test_without_whitespace_delimiters(self):
+        # delimiters that do not include all whitespace are split with a regex
+        matcher = build_matcher(['evil.com', 'com', 'abc', 'secret'], 'token', True,
+                    delimiters=' /()')
+        found = sorted(matcher.find_offsets(b'evil.com/abc\t(secret) com'))
+
+        self.assertEqual(found, [('com', 22), ('evil.com', 0), ('secret', 14)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import collections
+import os
+import sys
+import tempfile
+import unittest
+
+from tff.scanner import FeatureScanner, scan_flows
+from tff.tcp_flow import TcpFlow
+from tests.support import WorkspaceTestCase
+
+class ScanFlowsTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory(prefix='tff_test_')
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, '010.000.000.001.01234-192.168.001.002.00080')
+
+        with open(self.path, 'wb') as f:
+            f.write(b'mail bad@example.org from 10.1.2.3 about evil.com\nsecret\n')
+
+    def test_workers_match_serial(self):
+        scanner = FeatureScanner(collections.OrderedDict([('list', ['evil.com', 'secret'])]))
+        tcp_flows = [TcpFlow(self.path) for _ in range(40)]
+
+        serial = [tcp_flow.get_found_features() for tcp_flow in scan_flows(scanner, tcp_flows)]
+        workers = [tcp_flow.get_found_features() for tcp_flow
+                    in scan_flows(scanner, [TcpFlow(self.path) for _ in range(40)], 2, 3)]
+
+        self.assertEqual(workers, serial)
+        self.assertEqual(serial[0], {'list' : {'evil.com' : [41], 'secret' : [50]}})
+
+class DriverWorkersTest(WorkspaceTestCase):
+
+    def test_workers_match_serial(self):
+        self.workspace.run('serial')
+        self.workspace.run('workers', workers=2)
+
+        self.assertEqual(self.workspace.dump('workers'), self.workspace.dump('serial'))
+
+if __name__ == '__main__':
+    unittest.main()
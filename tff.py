@@ -7,8 +7,17 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Search TCP flows for features.")
     parser.add_argument('-f', type=str, help='Path to feature file directory.', default='features')
     parser.add_argument('-t', type=str, help='Path to tcpflows directory', default='tcpflow_out')
+    parser.add_argument('-p', type=str, help='Path to a pcap or pcapng file to read flows from instead of a tcpflows directory', default=None)
     parser.add_argument('-d', type=str, help="Path to output database", default='tff.db')
     parser.add_argument('-o', type=str, help='Path to output directory', default='tff_out')
+    parser.add_argument('-j', '--workers', type=int, help='Number of processes used to scan tcp flows', default=1)
+    parser.add_argument('--report-workers', type=int, help='Number of processes used to render reports (default: same as --workers)', default=None)
+    parser.add_argument('--incremental', action='store_true', help='Reuse the output database and only scan new or changed flows and newly added features')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run, reusing its output database, reports and copied flows')
+    parser.add_argument('--export', type=str, choices=['copy', 'reflink', 'hardlink'], help='How flows with features are exported to the output directory (default: copy)', default='copy')
+    parser.add_argument('--profile', action='store_true', help='Profile the run with cProfile and save the profile to the output directory')
     args = parser.parse_args()
 
-    main(args.d, args.f, args.t, args.o)
+    main(args.d, args.f, args.t, args.o, args.workers, args.report_workers,
+        args.incremental, args.p, args.profile, args.resume,
+        args.export)
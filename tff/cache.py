@@ -0,0 +1,212 @@
+import gc
+import hashlib
+import os
+import pickle
+import sys
+
+# bumped whenever the layout of cached values changes, so old entries are ignored
+CACHE_VERSION = 6
+
+# first line of every entry, checked before anything in the entry is unpickled
+CACHE_HEADER = 'tff cache {}\n'.format(CACHE_VERSION).encode('ascii')
+
+def default_cache_dir():
+    '''
+    Returns the per-user cache directory, tff under $XDG_CACHE_HOME or ~/.cache.
+
+    '''
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'tff')
+
+class FeatureCache:
+    '''
+    On-disk cache of feature lists and compiled matchers.
+
+    Each entry is a pickle in the cache directory, named after a key derived
+    from everything the cached value depends on, such as the hashes of the files
+    a plugin reads its features from.  Entries are therefore never stale: when a
+    source changes the key changes with it, and the old entry is simply no
+    longer used.
+
+    Reading an entry marks it as recently used by touching its file.  Whenever
+    an entry is written, the least recently used entries are evicted until the
+    cache fits in max_size bytes again.
+
+    Unpickling an entry can run arbitrary code, so the cache directory and
+    every entry must be owned by the current user and not be writable by
+    anyone else.  Entries that are not, or that were written by another
+    version of the cache, are discarded without being unpickled.
+
+    Arguments:
+        directory - path of the cache directory, created if needed.  Defaults
+            to default_cache_dir().
+        max_size - size budget of the cache in bytes
+
+    Raises:
+        ValueError if the cache directory is owned by another user or is
+            writable by others
+
+    '''
+
+    def __init__(self, directory=None, max_size=1 << 30):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, 0o700)
+
+        if not trusted(os.stat(self.directory)):
+            raise ValueError("Cache directory {} must be owned by the current user and not be "
+                             "writable by others".format(self.directory))
+
+    def key(self, *parts):
+        '''
+        Returns a cache key identifying the given parts.
+
+        Arguments:
+            parts - strings, numbers or booleans the cached value depends on
+
+        '''
+
+        digest = hashlib.sha1(str(CACHE_VERSION).encode('ascii'))
+
+        for part in parts:
+            digest.update(b'\0' + str(part).encode('utf-8', 'surrogateescape'))
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        '''
+        Returns the value cached under key, or None if there is none.
+
+        '''
+
+        path = self.path(key)
+
+        # loading creates millions of small objects for large matchers, which
+        # would otherwise trigger many pointless garbage collections
+        gc_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            with open(path, 'rb') as f:
+                if not trusted(os.fstat(f.fileno())):
+                    raise ValueError('not owned by the current user or writable by others')
+
+                if f.readline() != CACHE_HEADER:
+                    raise ValueError('written by another version')
+
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            # unpickling a damaged or foreign file can raise almost anything
+            print("[-] Discarding unreadable cache entry {}: {}".format(path, e))
+            remove(path)
+            self.misses += 1
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Cache value under key, then evict least recently used entries if the
+        cache has grown over its size budget.
+
+        '''
+
+        path = self.path(key)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(CACHE_HEADER)
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        '''
+        Remove the least recently used entries, other than keep, until the
+        cache fits in max_size bytes.
+
+        '''
+
+        entries = []
+        total = 0
+
+        for direntry in os.scandir(self.directory):
+            if not direntry.name.endswith('.pickle'):
+                continue
+
+            try:
+                stat = direntry.stat()
+            except OSError:
+                continue
+
+            total += stat.st_size
+
+            if direntry.path != keep:
+                entries.append((stat.st_mtime, stat.st_size, direntry.path))
+
+        entries.sort()
+
+        for (mtime, size, path) in entries:
+            if total <= self.max_size:
+                break
+
+            remove(path)
+            total -= size
+
+def hash_file(path):
+    '''
+    Returns the SHA-1 of the contents of a file, or None if it does not exist.
+
+    '''
+
+    digest = hashlib.sha1()
+
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+
+    return digest.hexdigest()
+
+def trusted(stat):
+    '''
+    Returns whether a cache file or directory, given by its stat, is owned by
+    the current user and writable by no one else.  Always true on platforms
+    without file owners.
+
+    '''
+
+    if not hasattr(os, 'getuid'):
+        return True
+
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,18 +1,40 @@
+import collections
 import os
+import sqlite3
 import sys
 import time
 import uuid
 
 from .tcp_flow import TcpFlow
+from .endpoints import POSITIONS
 
-from sqlalchemy import and_, func, or_
-from sqlalchemy import Column, Integer, Float, String, Text, ForeignKey
+from sqlalchemy import and_, bindparam, event, func, literal_column, or_, select, text, union_all
+from sqlalchemy import Column, Integer, Float, LargeBinary, String, Text, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 
 Base = declarative_base()
 
+# SQLite settings applied to every connection, tuned for bulk loading followed by
+# read heavy reporting.  Any of these may be overridden in the [database] section
+# of config.ini.
+DEFAULT_PRAGMAS = {
+    'journal_mode' : 'WAL',
+    'synchronous' : 'NORMAL',
+    'cache_size' : '-65536',
+    'mmap_size' : '268435456',
+}
+
+# (index name, table, columns) for the lookups made while reporting.  They are
+# created by DatabaseController.create_indexes once the tables are loaded.
+INDEXES = [
+    ('ix_features_flow', 'features', ('TcpFlowFileName', 'FeatureType', 'Feature')),
+    ('ix_features_type', 'features', ('FeatureType',)),
+    ('ix_tcpflows_src', 'tcpflows', ('SrcIp', 'TcpFlowFileName')),
+    ('ix_tcpflows_dest', 'tcpflows', ('DestIp', 'TcpFlowFileName')),
+]
+
 class TcpFlowDb(Base):
     '''
     Class defining the structure of the database table for tcp flows examined.
@@ -24,15 +46,20 @@ class TcpFlowDb(Base):
     TcpFlowFileName = Column(String, primary_key = True)
     TcpFlowFilePath = Column(String)
     SrcIp = Column(String)
-    SrcPort = Column(String)
+    SrcPort = Column(Integer)
     DestIp = Column(String)
-    DestPort = Column(String)
-    VLAN = Column(String)
-    Timestamp = Column(String)
-    ConnectionNumber = Column(String)
+    DestPort = Column(Integer)
+    VLAN = Column(Integer)
+    Timestamp = Column(Integer)
+    ConnectionNumber = Column(Integer)
+    FileSize = Column(Integer)
+    ModifiedTime = Column(Float)
+    # hash of the feature sets the flow has been completely scanned with
+    ScanHash = Column(String)
 
     def __init__(self, TcpFlowFileName, TcpFlowFilePath, SrcIp, SrcPort, DestIp,
-        DestPort, Timestamp, VLAN, ConnectionNumber):
+        DestPort, Timestamp, VLAN, ConnectionNumber, FileSize=None, ModifiedTime=None,
+        ScanHash=None):
         
         self.TcpFlowFileName = TcpFlowFileName
         self.TcpFlowFilePath = TcpFlowFilePath
@@ -43,6 +70,9 @@ class TcpFlowDb(Base):
         self.VLAN = VLAN
         self.Timestamp = Timestamp
         self.ConnectionNumber = ConnectionNumber
+        self.FileSize = FileSize
+        self.ModifiedTime = ModifiedTime
+        self.ScanHash = ScanHash
 
 class FoundFeatureDb(Base):
     '''
@@ -56,31 +86,175 @@ class FoundFeatureDb(Base):
     TcpFlowFileName = Column(String, ForeignKey('tcpflows.TcpFlowFileName'))
     FeatureType = Column(String)
     Feature = Column(String)
+    # file offset, or for hits of an Endpoint the tcpflows column it matched
     Position = Column(String)
+    # bytes around the feature, if store_context is set in the [scan] section
+    Context = Column(LargeBinary)
+    # name of the pattern that matched the feature, NULL for literal features
+    Pattern = Column(String)
 
-    def __init__(self, TcpFlowFileName, FeatureType, Feature, Position):
+    def __init__(self, TcpFlowFileName, FeatureType, Feature, Position, Context=None,
+            Pattern=None):
         self.TcpFlowFileName = TcpFlowFileName
         self.FeatureType = FeatureType
         self.Feature = Feature
         self.Position = Position
+        self.Context = Context
+        self.Pattern = Pattern
+
+class FeatureSetDb(Base):
+    '''
+    Class defining the structure of the database table recording the hash of
+    the feature set each feature type was last scanned with.
+
+    '''
+
+    __tablename__ = "feature_sets"
+
+    FeatureType = Column(String, primary_key = True)
+    Hash = Column(String)
+    ReadMode = Column(String)
+
+    def __init__(self, FeatureType, Hash, ReadMode):
+        self.FeatureType = FeatureType
+        self.Hash = Hash
+        self.ReadMode = ReadMode
+
+class RunStateDb(Base):
+    '''
+    Class defining the structure of the database table holding the state of
+    the run phases that can be resumed.
+
+    '''
+
+    __tablename__ = "run_state"
+
+    Key = Column(String, primary_key = True)
+    Value = Column(String)
+
+    def __init__(self, Key, Value):
+        self.Key = Key
+        self.Value = Value
+
+class ScannedFeatureDb(Base):
+    '''
+    Class defining the structure of the database table listing the features
+    each feature type was last scanned with.
+
+    '''
+
+    __tablename__ = "scanned_features"
+
+    FeatureType = Column(String, primary_key = True)
+    Feature = Column(String, primary_key = True)
+
+    def __init__(self, FeatureType, Feature):
+        self.FeatureType = FeatureType
+        self.Feature = Feature
+
+def upgrade_schema(engine):
+    '''
+    Add the columns of each table that a database created by an earlier version
+    lacks.  New columns are all nullable, so existing rows read as NULL.
+
+    '''
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = set(row[1] for row in connection.execute(
+                            text("PRAGMA table_info({})".format(table.name))))
+
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text("ALTER TABLE {} ADD COLUMN {} {}".format(
+                        table.name, column.name, column.type.compile(engine.dialect))))
 
 class DatabaseController:
     '''
     Database handler for creationand manipulation of the tff output database.
 
+    Rows can either be added to the session one ORM object at a time, or added to
+    a batch which is bulk inserted once batch_size rows have been gathered.
+
+    A read only controller opens an existing database without creating it, so
+    that several processes can query the database alongside its writer.
+
+    Arguments:
+        db_path - path of the database file to create
+        batch_size - number of rows bulk inserted per transaction
+        pragmas - dictionary of SQLite pragmas to set on each connection, in
+            addition to or overriding DEFAULT_PRAGMAS
+        read_only - open the existing database at db_path read only
+        reuse - keep adding to the database at db_path if it already exists,
+            rather than creating a new, uniquely named database next to it
+
     '''
 
-    def __init__(self, db_path):
-        if os.path.exists(db_path):
+    def __init__(self, db_path, batch_size=10000, pragmas=None, read_only=False,
+            reuse=False):
+        if os.path.exists(db_path) and not (read_only or reuse):
             db = db_path[:-3] + "_{}.db".format(uuid.uuid4().hex)
         else:
             db = db_path
 
-        engine = create_engine('sqlite:///' + db, echo=False)
-        Base.metadata.create_all(engine)
+        self.db_path = db
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.pragmas.update(pragmas or {})
+
+        if read_only:
+            # the journal mode is a property of the database file and cannot be
+            # set from a read only connection
+            self.pragmas.pop('journal_mode', None)
+            engine = create_engine('sqlite://', echo=False, creator=lambda: sqlite3.connect(
+                                    'file:{}?mode=ro'.format(db), uri=True))
+        else:
+            engine = create_engine('sqlite:///' + db, echo=False)
+
+        event.listen(engine, 'connect', self.__set_pragmas)
+
+        if not read_only:
+            Base.metadata.create_all(engine)
+            upgrade_schema(engine)
+
         Session = sessionmaker(bind=engine)
         self.session = Session()
 
+        self.batch_size = batch_size
+        self.tcp_flow_batch = []
+        self.feature_batch = []
+        self.scanned_flow_batch = []
+
+        # rows bulk inserted per table and features rows per feature type, and
+        # the wall and CPU seconds spent inserting them
+        self.rows_inserted = collections.Counter()
+        self.feature_rows_inserted = collections.Counter()
+        self.insert_time = 0.0
+        self.insert_cpu = 0.0
+
+    def __set_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        for name, value in self.pragmas.items():
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+
+        cursor.close()
+
+    def create_indexes(self):
+        '''
+        Create the indexes used by report queries, if they do not exist yet.
+
+        Building the indexes once after the tables are loaded is much faster than
+        maintaining them during the bulk inserts.
+
+        '''
+
+        for (name, table, columns) in INDEXES:
+            self.session.execute(text("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                                    name, table, ', '.join(columns))))
+
+        self.session.execute(text("ANALYZE"))
+        self.session.commit()
+
     def get_db_session(self):
         '''
         Get a copy of the database session object.
@@ -103,7 +277,8 @@ class DatabaseController:
 
         tcp_row = TcpFlowDb(tcp_flow.filename, tcp_flow.path, tcp_flow.source_ip,
                         tcp_flow.source_port, tcp_flow.dest_ip, tcp_flow.dest_port,
-                        tcp_flow.vlan, tcp_flow.timestamp, tcp_flow.connection_number)
+                        tcp_flow.timestamp, tcp_flow.vlan, tcp_flow.connection_number,
+                        tcp_flow.size, tcp_flow.mtime)
         self.session.add(tcp_row)
 
     def add_feature_to_session(self, tcpflow_filename, feature_type, feature, location):
@@ -118,6 +293,313 @@ class DatabaseController:
         feature_row = FoundFeatureDb(tcpflow_filename, feature_type, feature, location)
         self.session.add(feature_row)
 
+    def add_tcp_flow_to_batch(self, tcp_flow, scan_hash=None):
+        '''
+        Add a row for a given TcpFlow object to the tcp flow batch.
+
+        The batches are inserted and committed once one of them holds batch_size
+        rows.  Call flush_batches() to insert any remaining rows.
+
+        Arguments:
+            tcp_flow - TcpFlow object
+            scan_hash - hash of the feature sets the flow was completely
+                scanned with
+
+        '''
+
+        self.tcp_flow_batch.append({
+            'TcpFlowFileName' : tcp_flow.filename,
+            'TcpFlowFilePath' : tcp_flow.path,
+            'SrcIp' : tcp_flow.source_ip,
+            'SrcPort' : tcp_flow.source_port,
+            'DestIp' : tcp_flow.dest_ip,
+            'DestPort' : tcp_flow.dest_port,
+            'VLAN' : tcp_flow.vlan,
+            'Timestamp' : tcp_flow.timestamp,
+            'ConnectionNumber' : tcp_flow.connection_number,
+            'FileSize' : tcp_flow.size,
+            'ModifiedTime' : tcp_flow.mtime,
+            'ScanHash' : scan_hash,
+        })
+
+        if len(self.tcp_flow_batch) >= self.batch_size:
+            self.flush_batches()
+
+    def add_feature_to_batch(self, tcpflow_filename, feature_type, feature, location,
+            context=None, pattern=None):
+        '''
+        Add a row for a found feature to the feature batch.
+
+        The batches are inserted and committed once one of them holds batch_size
+        rows.  Call flush_batches() to insert any remaining rows.
+
+        '''
+
+        self.feature_batch.append({
+            'TcpFlowFileName' : tcpflow_filename,
+            'FeatureType' : feature_type,
+            'Feature' : feature,
+            'Position' : location,
+            'Context' : context,
+            'Pattern' : pattern,
+        })
+
+        if len(self.feature_batch) >= self.batch_size:
+            self.flush_batches()
+
+    def add_scanned_flow_to_batch(self, tcpflow_filename, scan_hash):
+        '''
+        Record that an existing tcp flow has been completely scanned with the
+        feature sets of scan_hash, once the batches are flushed.
+
+        '''
+
+        self.scanned_flow_batch.append({'name' : tcpflow_filename, 'hash' : scan_hash})
+
+        if len(self.scanned_flow_batch) >= self.batch_size:
+            self.flush_batches()
+
+    def flush_batches(self):
+        '''
+        Insert all batched rows in a single transaction.
+
+        Features are only ever batched before the row marking their flow as
+        scanned, so once a flow is recorded as scanned all of its features are
+        in the database as well.  If the insert fails the transaction is rolled
+        back, so none of the batched rows are in the database, and the batches
+        are kept.
+
+        '''
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+
+        inserts = [(FoundFeatureDb.__table__, self.feature_batch),
+                   (TcpFlowDb.__table__, self.tcp_flow_batch)]
+
+        try:
+            for (table, rows) in inserts:
+                if rows:
+                    self.session.execute(table.insert(), rows)
+
+            if self.scanned_flow_batch:
+                self.session.execute(TcpFlowDb.__table__.update()\
+                        .where(TcpFlowDb.TcpFlowFileName == bindparam('name'))\
+                        .values(ScanHash=bindparam('hash')), self.scanned_flow_batch)
+
+            self.session.commit()
+        except BaseException:
+            self.session.rollback()
+            raise
+
+        for (table, rows) in inserts:
+            if rows:
+                self.rows_inserted[table.name] += len(rows)
+
+        self.feature_rows_inserted.update(row['FeatureType'] for row in self.feature_batch)
+        self.feature_batch = []
+        self.tcp_flow_batch = []
+        self.scanned_flow_batch = []
+
+        self.insert_time += time.perf_counter() - start
+        self.insert_cpu += time.process_time() - start_cpu
+
+    def get_flow_fingerprints(self):
+        '''
+        Returns the size and modification time recorded for each tcp flow, and
+        the hash of the feature sets it was completely scanned with.
+
+        Returns:
+            dictionary of the form { 'tcp flow file name' : (size, mtime, scan hash) }
+
+        '''
+
+        flows = self.session.query(TcpFlowDb.TcpFlowFileName, TcpFlowDb.FileSize,
+                    TcpFlowDb.ModifiedTime, TcpFlowDb.ScanHash)
+
+        return {flow_fn : (size, mtime, scan_hash) for (flow_fn, size, mtime, scan_hash) in flows}
+
+    def delete_flows(self, flow_fns):
+        '''
+        Delete tcp flows and the features found in them.
+
+        Arguments:
+            flow_fns - list of tcp flow file names
+
+        '''
+
+        flow_fns = list(flow_fns)
+
+        # keep each statement well under the SQLite bound parameter limit
+        for i in range(0, len(flow_fns), 500):
+            chunk = flow_fns[i:i + 500]
+
+            self.session.query(FoundFeatureDb)\
+                    .filter(FoundFeatureDb.TcpFlowFileName.in_(chunk))\
+                    .delete(synchronize_session=False)
+            self.session.query(TcpFlowDb)\
+                    .filter(TcpFlowDb.TcpFlowFileName.in_(chunk))\
+                    .delete(synchronize_session=False)
+
+        self.session.commit()
+
+    def delete_orphan_features(self):
+        '''
+        Delete found features of tcp flows that were never recorded as scanned,
+        left behind by a run that was interrupted.
+
+        Returns:
+            number of features deleted
+
+        '''
+
+        deleted = self.session.query(FoundFeatureDb)\
+                    .filter(~FoundFeatureDb.TcpFlowFileName.in_(
+                        self.session.query(TcpFlowDb.TcpFlowFileName)))\
+                    .delete(synchronize_session=False)
+
+        self.session.commit()
+
+        return deleted
+
+    def get_run_state(self, key):
+        '''
+        Returns the value recorded for key in the run_state table, or None.
+
+        '''
+
+        row = self.session.query(RunStateDb).filter(RunStateDb.Key == key).first()
+
+        return None if row is None else row.Value
+
+    def set_run_state(self, key, value):
+        '''
+        Record a value for key in the run_state table, or remove key if value is
+        None, and commit.
+
+        '''
+
+        self.session.query(RunStateDb).filter(RunStateDb.Key == key)\
+                .delete(synchronize_session=False)
+
+        if value is not None:
+            self.session.add(RunStateDb(key, value))
+
+        self.session.commit()
+
+    def get_feature_set(self, feature_type):
+        '''
+        Returns the feature set a feature type was last scanned with.
+
+        Returns:
+            FeatureSetDb row, or None if the feature type has not been scanned
+
+        '''
+
+        return self.session.query(FeatureSetDb)\
+                    .filter(FeatureSetDb.FeatureType == feature_type)\
+                    .first()
+
+    def get_scanned_features(self, feature_type):
+        '''
+        Returns the features a feature type was last scanned with.
+
+        Returns:
+            set of feature strings
+
+        '''
+
+        features = self.session.query(ScannedFeatureDb.Feature)\
+                    .filter(ScannedFeatureDb.FeatureType == feature_type)
+
+        return {feature for (feature,) in features}
+
+    def delete_features(self, feature_type, features, keep_hash=None, patterns=(),
+            endpoints=()):
+        '''
+        Delete the found features of a feature type.
+
+        Arguments:
+            feature_type - feature type of the features
+            features - list of literal features to delete, or None to delete
+                every found feature of the feature type
+            keep_hash - if given, keep the features of tcp flows that have been
+                completely scanned with the feature sets of this hash
+            patterns - names of patterns whose hits to delete as well
+            endpoints - indicators of Endpoints whose hits to delete as well
+
+        Returns:
+            number of features deleted
+
+        '''
+
+        query = self.session.query(FoundFeatureDb)\
+                    .filter(FoundFeatureDb.FeatureType == feature_type)
+
+        if keep_hash is not None:
+            query = query.filter(~FoundFeatureDb.TcpFlowFileName.in_(
+                        self.session.query(TcpFlowDb.TcpFlowFileName)\
+                            .filter(TcpFlowDb.ScanHash == keep_hash)))
+
+        deleted = 0
+
+        if features is None:
+            deleted += query.delete(synchronize_session=False)
+        else:
+            features = list(features)
+            literals = query.filter(FoundFeatureDb.Pattern.is_(None))\
+                        .filter(~FoundFeatureDb.Position.in_(POSITIONS))
+
+            for i in range(0, len(features), 500):
+                deleted += literals.filter(FoundFeatureDb.Feature.in_(features[i:i + 500]))\
+                        .delete(synchronize_session=False)
+
+            patterns = list(patterns)
+
+            if patterns:
+                deleted += query.filter(FoundFeatureDb.Pattern.in_(patterns))\
+                        .delete(synchronize_session=False)
+
+            endpoints = list(endpoints)
+            endpoint_hits = query.filter(FoundFeatureDb.Position.in_(POSITIONS))
+
+            for i in range(0, len(endpoints), 500):
+                deleted += endpoint_hits.filter(FoundFeatureDb.Feature.in_(endpoints[i:i + 500]))\
+                        .delete(synchronize_session=False)
+
+        self.session.commit()
+
+        return deleted
+
+    def save_feature_set(self, feature_type, feature_hash, read_mode, features):
+        '''
+        Record the feature set a feature type has been scanned with, replacing
+        any previously recorded feature set.
+
+        Arguments:
+            feature_type - feature type of the features
+            feature_hash - hash of the feature set
+            read_mode - read mode the flows were scanned with
+            features - iterable of feature strings, with patterns given by
+                tff.patterns.feature_key
+
+        '''
+
+        self.session.query(FeatureSetDb)\
+                .filter(FeatureSetDb.FeatureType == feature_type)\
+                .delete(synchronize_session=False)
+        self.session.query(ScannedFeatureDb)\
+                .filter(ScannedFeatureDb.FeatureType == feature_type)\
+                .delete(synchronize_session=False)
+
+        self.session.add(FeatureSetDb(feature_type, feature_hash, read_mode))
+
+        rows = [{'FeatureType' : feature_type, 'Feature' : feature} for feature in features]
+        if rows:
+            self.session.execute(ScannedFeatureDb.__table__.insert(), rows)
+
+        self.session.commit()
+
     def select_features_by_type(self, feature_type):
         '''
         Return all features of a given type
@@ -339,6 +821,242 @@ class DatabaseController:
 
         return features
 
+    def get_flows_with_features(self):
+        '''
+        Returns the file names of all tcp flows with at least one feature.
+
+        Returns:
+            sorted list of tcp flow file names
+
+        '''
+
+        flows = self.session.query(FoundFeatureDb.TcpFlowFileName)\
+                    .distinct()\
+                    .order_by(FoundFeatureDb.TcpFlowFileName)\
+                    .all()
+
+        return [flow_fn for (flow_fn,) in flows]
+
+    def get_flow_paths_with_features(self):
+        '''
+        Returns the file name and path of all tcp flows with at least one feature.
+
+        Returns:
+            list of tuples of the form ('tcp flow file name', 'tcp flow file path')
+
+        '''
+
+        return self.session.query(TcpFlowDb.TcpFlowFileName, TcpFlowDb.TcpFlowFilePath)\
+                    .filter(TcpFlowDb.TcpFlowFileName.in_(
+                        self.session.query(FoundFeatureDb.TcpFlowFileName).distinct()))\
+                    .all()
+
+    def __ip_rows(self, start_ip=None, end_ip=None):
+        '''
+        Build a subquery with a row per found feature for each of the two IPs of
+        its flow: (ip, direction, paired_ip, feature_type, feature), where
+        direction is 'src' for the source IP of the flow and 'dest' for its
+        destination IP.
+
+        Arguments:
+            start_ip - if given, only rows for IPs greater than or equal to start_ip
+            end_ip - if given, only rows for IPs less than end_ip
+
+        '''
+
+        src = select([TcpFlowDb.SrcIp.label('ip'), literal_column("'src'").label('direction'),
+                    TcpFlowDb.DestIp.label('paired_ip'),
+                    FoundFeatureDb.FeatureType.label('feature_type'),
+                    FoundFeatureDb.Feature.label('feature')])\
+                    .where(and_(FoundFeatureDb.TcpFlowFileName == TcpFlowDb.TcpFlowFileName,
+                        *self.__range(TcpFlowDb.SrcIp, start_ip, end_ip)))
+
+        dest = select([TcpFlowDb.DestIp.label('ip'), literal_column("'dest'").label('direction'),
+                    TcpFlowDb.SrcIp.label('paired_ip'),
+                    FoundFeatureDb.FeatureType.label('feature_type'),
+                    FoundFeatureDb.Feature.label('feature')])\
+                    .where(and_(FoundFeatureDb.TcpFlowFileName == TcpFlowDb.TcpFlowFileName,
+                        *self.__range(TcpFlowDb.DestIp, start_ip, end_ip)))
+
+        return union_all(src, dest).alias('ip_rows')
+
+    def get_ip_totals(self):
+        '''
+        Count the features found in flows to or from each IP.  A flow is counted
+        for both its source and its destination IP.
+
+        Returns:
+            iterable of (ip, count) tuples, most features first, read from the
+                database cursor as they are iterated over
+        '''
+
+        rows = self.__ip_rows()
+
+        return self.session.execute(
+                    select([rows.c.ip, func.count().label('hits')])\
+                    .group_by(rows.c.ip)\
+                    .order_by(text('hits DESC'), rows.c.ip))
+
+    def get_ip_summaries(self, start_ip=None, end_ip=None):
+        '''
+        Summarize the features found in flows to or from each IP.
+
+        Arguments:
+            start_ip - if given, only IPs greater than or equal to start_ip
+            end_ip - if given, only IPs less than end_ip
+
+        Returns:
+            iterable of tuples of the form (ip, unique features, features,
+                feature types), where feature types counts the feature types
+                found in flows from the IP and those found in flows to it
+                separately.  Rows are ordered by IP and read from the database
+                cursor as they are iterated over.
+        '''
+
+        rows = self.__ip_rows(start_ip, end_ip)
+
+        return self.session.execute(
+                    select([rows.c.ip, func.count(rows.c.feature.distinct()), func.count(),
+                        func.count(rows.c.direction.concat(' ').concat(rows.c.feature_type)
+                            .distinct())])\
+                    .group_by(rows.c.ip)\
+                    .order_by(rows.c.ip))
+
+    def get_ip_feature_histograms(self, start_ip=None, end_ip=None, direction=None):
+        '''
+        Count each feature found in flows to or from each IP.
+
+        Arguments:
+            start_ip - if given, only IPs greater than or equal to start_ip
+            end_ip - if given, only IPs less than end_ip
+            direction - if given, only count flows from the IP, with 'src', or
+                to the IP, with 'dest'
+
+        Returns:
+            iterable of (ip, 'feature', count) tuples ordered by IP, then most
+                common feature first, read from the database cursor as they are
+                iterated over
+        '''
+
+        rows = self.__ip_rows(start_ip, end_ip)
+        query = select([rows.c.ip, rows.c.feature, func.count().label('hits')])
+
+        if direction is not None:
+            query = query.where(rows.c.direction == direction)
+
+        return self.session.execute(query\
+                    .group_by(rows.c.ip, rows.c.feature)\
+                    .order_by(rows.c.ip, text('hits DESC'), rows.c.feature))
+
+    def get_paired_ip_histograms(self, start_ip=None, end_ip=None):
+        '''
+        Count the features found in flows between each IP and each IP it
+        exchanged data with.
+
+        Arguments:
+            start_ip - if given, only IPs greater than or equal to start_ip
+            end_ip - if given, only IPs less than end_ip
+
+        Returns:
+            iterable of (ip, paired ip, count) tuples ordered by IP, then most
+                features first, read from the database cursor as they are
+                iterated over
+        '''
+
+        rows = self.__ip_rows(start_ip, end_ip)
+
+        return self.session.execute(
+                    select([rows.c.ip, rows.c.paired_ip, func.count().label('hits')])\
+                    .group_by(rows.c.ip, rows.c.paired_ip)\
+                    .order_by(rows.c.ip, text('hits DESC'), rows.c.paired_ip))
+
+    def get_flow_summaries(self, start_flow=None, end_flow=None):
+        '''
+        Summarize the features found in each tcp flow.
+
+        Arguments:
+            start_flow - if given, only flows whose file name is greater than or
+                equal to start_flow
+            end_flow - if given, only flows whose file name is less than end_flow
+
+        Returns:
+            iterable of tuples of the form ('tcp flow file name', src ip,
+                dest ip, features, feature types), ordered by tcp flow and read
+                from the database cursor as they are iterated over
+        '''
+
+        return self.session.execute(
+                    select([TcpFlowDb.TcpFlowFileName, TcpFlowDb.SrcIp, TcpFlowDb.DestIp,
+                        func.count(), func.count(FoundFeatureDb.FeatureType.distinct())])\
+                    .where(and_(*self.__flow_conditions(start_flow, end_flow)))\
+                    .group_by(TcpFlowDb.TcpFlowFileName, TcpFlowDb.SrcIp, TcpFlowDb.DestIp)\
+                    .order_by(TcpFlowDb.TcpFlowFileName))
+
+    def get_flow_feature_types(self, start_flow=None, end_flow=None):
+        '''
+        Returns the feature types found in each tcp flow.
+
+        Arguments:
+            start_flow, end_flow - range of tcp flows, see get_flow_summaries
+
+        Returns:
+            iterable of ('tcp flow file name', 'feature type') tuples ordered by
+                tcp flow and feature type, read from the database cursor as
+                they are iterated over
+        '''
+
+        return self.session.execute(
+                    select([FoundFeatureDb.TcpFlowFileName, FoundFeatureDb.FeatureType])\
+                    .where(and_(*self.__flow_conditions(start_flow, end_flow)))\
+                    .distinct()\
+                    .order_by(FoundFeatureDb.TcpFlowFileName, FoundFeatureDb.FeatureType))
+
+    def get_flow_feature_histograms(self, start_flow=None, end_flow=None):
+        '''
+        Count each feature found in each tcp flow.
+
+        Arguments:
+            start_flow, end_flow - range of tcp flows, see get_flow_summaries
+
+        Returns:
+            iterable of ('tcp flow file name', 'feature', count) tuples ordered
+                by tcp flow, then most common feature first, read from the
+                database cursor as they are iterated over
+        '''
+
+        return self.session.execute(
+                    select([FoundFeatureDb.TcpFlowFileName, FoundFeatureDb.Feature,
+                        func.count().label('hits')])\
+                    .where(and_(*self.__flow_conditions(start_flow, end_flow)))\
+                    .group_by(FoundFeatureDb.TcpFlowFileName, FoundFeatureDb.Feature)\
+                    .order_by(FoundFeatureDb.TcpFlowFileName, text('hits DESC'),
+                        FoundFeatureDb.Feature))
+
+    def __flow_conditions(self, start_flow, end_flow):
+        '''
+        Build the conditions joining found features to their tcp flows within
+        the range of flows [start_flow, end_flow).
+
+        '''
+
+        return [FoundFeatureDb.TcpFlowFileName == TcpFlowDb.TcpFlowFileName] + \
+                    self.__range(FoundFeatureDb.TcpFlowFileName, start_flow, end_flow)
+
+    def __range(self, column, start, end):
+        '''
+        Build the conditions restricting a column to the range [start, end).
+
+        '''
+
+        conditions = []
+
+        if start is not None:
+            conditions.append(column >= start)
+        if end is not None:
+            conditions.append(column < end)
+
+        return conditions
+
     def commit_session(self):
         self.session.commit()           
     
@@ -0,0 +1,261 @@
+import bisect
+import ipaddress
+import os
+import sys
+
+# columns of the tcpflows table each kind of endpoint indicator is matched
+# against.  Hits are recorded with the column as their position.
+ENDPOINT_FIELDS = {
+    'ip' : (('SrcIp', 'source_ip'), ('DestIp', 'dest_ip')),
+    'port' : (('SrcPort', 'source_port'), ('DestPort', 'dest_port')),
+    'vlan' : (('VLAN', 'vlan'),),
+}
+
+POSITIONS = tuple(field for fields in ENDPOINT_FIELDS.values() for (field, attribute) in fields)
+
+class Endpoint(str):
+    '''
+    An indicator matched against the endpoints of each tcp flow, as parsed
+    from its file name, rather than searched for in its payload.
+
+    Plugins supply Endpoints alongside their literal features.  Matching them
+    needs no more than the name of a flow, so flows are never opened for them.
+    An Endpoint is its indicator string, which is stored as the feature of its
+    hits, but it never equals a literal feature with the same text.
+
+    Arguments:
+        indicator - one of
+            an IPv4 or IPv6 address, such as 10.1.2.3, leading zeros allowed
+            a CIDR range, such as 10.0.0.0/8 or 2001:db8::/32
+            port:<port> or port:<first>-<last>
+            vlan:<vlan> or vlan:<first>-<last>
+
+    Attributes:
+        kind - ip, port or vlan
+        version - IP version of ip indicators, otherwise None
+        first, last - range of addresses, as integers, or of ports or VLANs
+            matched by the indicator
+
+    '''
+
+    def __new__(cls, indicator):
+        endpoint = str.__new__(cls, indicator.strip())
+
+        try:
+            endpoint.__parse()
+        except ValueError:
+            raise ValueError("Invalid endpoint indicator '{}'.  Use an IP address, a CIDR range, "
+                             "port:<port>[-<port>] or vlan:<vlan>[-<vlan>].".format(indicator))
+
+        return endpoint
+
+    def __parse(self):
+        (kind, separator, value) = self.partition(':')
+
+        if kind in ('port', 'vlan'):
+            (first, separator, last) = value.partition('-')
+
+            self.kind = kind
+            self.version = None
+            self.first = int(first)
+            self.last = int(last) if separator else self.first
+
+            if not 0 <= self.first <= self.last <= (65535 if kind == 'port' else 4095):
+                raise ValueError(self)
+            return
+
+        (address, separator, prefix) = self.partition('/')
+        (version, value) = parse_ip(address)
+        bits = 32 if version == 4 else 128
+        prefix = int(prefix) if separator else bits
+
+        if not 0 <= prefix <= bits:
+            raise ValueError(self)
+
+        host_bits = bits - prefix
+
+        self.kind = 'ip'
+        self.version = version
+        self.first = value >> host_bits << host_bits
+        self.last = self.first | ((1 << host_bits) - 1)
+
+    def __eq__(self, other):
+        return isinstance(other, Endpoint) and str.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(('endpoint', str(self)))
+
+    def __reduce__(self):
+        return (Endpoint, (str(self),))
+
+class IntervalIndex:
+    '''
+    Finds which of a set of integer ranges contain a value.
+
+    The ranges are cut into disjoint intervals at every range boundary, each
+    holding the ranges that cover it, so a lookup is a single binary search
+    however many ranges there are and however they nest.
+
+    Arguments:
+        ranges - iterable of (first, last, value) tuples, inclusive
+
+    '''
+
+    def __init__(self, ranges):
+        events = {}
+
+        for (first, last, value) in ranges:
+            events.setdefault(first, ([], []))[0].append(value)
+            events.setdefault(last + 1, ([], []))[1].append(value)
+
+        self.starts = []
+        self.values = []
+
+        active = {}
+
+        for point in sorted(events):
+            (added, removed) = events[point]
+
+            for value in removed:
+                active[value] -= 1
+                if not active[value]:
+                    del active[value]
+
+            for value in added:
+                active[value] = active.get(value, 0) + 1
+
+            self.starts.append(point)
+            self.values.append(tuple(active))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, number):
+        '''
+        Returns a tuple of the values of the ranges containing number.
+
+        '''
+
+        index = bisect.bisect_right(self.starts, number) - 1
+
+        if index < 0:
+            return ()
+
+        return self.values[index]
+
+class EndpointMatcher:
+    '''
+    Matches the endpoints of tcp flows against Endpoint indicators.
+
+    Addresses are looked up in an IntervalIndex per IP version, and ports and
+    VLANs in one each, so the cost of matching a flow does not depend on the
+    number of indicators.
+
+    Arguments:
+        endpoints - iterable of Endpoint objects
+
+    '''
+
+    def __init__(self, endpoints):
+        ranges = {}
+
+        for endpoint in endpoints:
+            ranges.setdefault((endpoint.kind, endpoint.version), []).append(
+                (endpoint.first, endpoint.last, endpoint))
+
+        self.indexes = {key: IntervalIndex(key_ranges) for (key, key_ranges) in ranges.items()}
+        self.ips = {}
+
+    def match(self, tcp_flow):
+        '''
+        Match the endpoints of a tcp flow.
+
+        An address that cannot be parsed matches no indicator, rather than
+        stopping the scan.
+
+        Returns:
+            dictionary of the form { Endpoint : [field] }, where each field is
+                a column of the tcpflows table listed in ENDPOINT_FIELDS
+        '''
+
+        found = {}
+
+        for (kind, fields) in ENDPOINT_FIELDS.items():
+            for (field, attribute) in fields:
+                value = getattr(tcp_flow, attribute)
+
+                if value is None:
+                    continue
+
+                if kind == 'ip':
+                    try:
+                        (version, value) = self.parse_flow_ip(value)
+                    except ValueError:
+                        continue
+                else:
+                    version = None
+
+                index = self.indexes.get((kind, version))
+
+                if index is None:
+                    continue
+
+                for endpoint in index.lookup(value):
+                    found.setdefault(endpoint, []).append(field)
+
+        return found
+
+    def parse_flow_ip(self, address):
+        '''
+        Parse an address of a flow name, remembering the addresses of recent
+        flows as most flows are between a small number of hosts.
+
+        '''
+
+        parsed = self.ips.get(address)
+
+        if parsed is None:
+            if len(self.ips) >= 65536:
+                self.ips.clear()
+
+            parsed = self.ips[address] = parse_ip(address)
+
+        return parsed
+
+def parse_ip(address):
+    '''
+    Parse an IPv4 or IPv6 address.  The octets of IPv4 addresses may have
+    leading zeros, as in tcpflow file names.
+
+    Returns:
+        (version, integer value) tuple
+
+    Raises:
+        ValueError if address is not an IP address
+    '''
+
+    if ':' in address:
+        try:
+            return (6, int(ipaddress.IPv6Address(address)))
+        except ValueError:
+            raise ValueError("Invalid IP address '{}'".format(address))
+
+    octets = address.split('.')
+
+    if len(octets) != 4 or not all(octet.isdigit() and len(octet) <= 3 for octet in octets):
+        raise ValueError("Invalid IP address '{}'".format(address))
+
+    value = 0
+
+    for octet in octets:
+        octet = int(octet)
+
+        if octet > 255:
+            raise ValueError("Invalid IP address '{}'".format(address))
+
+        value = value << 8 | octet
+
+    return (4, value)
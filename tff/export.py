@@ -0,0 +1,180 @@
+import concurrent.futures
+import errno
+import os
+import shutil
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EXPORT_MODES = ('copy', 'reflink', 'hardlink')
+
+# ioctl cloning a whole file on btrfs, xfs and other reflink capable filesystems
+FICLONE = 0x40049409
+
+# errors meaning a method is not supported for a pair of files, rather than
+# that something went wrong
+UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EINVAL, errno.ENOSYS,
+               errno.EOPNOTSUPP, errno.ENOTTY, errno.EMLINK, errno.EBADF)
+
+class FlowExporter:
+    '''
+    Exports tcp flows with features to the output directory.
+
+    In copy mode the data is copied inside the kernel with copy_file_range or
+    sendfile, so it never passes through Python.  In reflink mode the copy
+    shares the data blocks of the original on filesystems that support it, and
+    in hardlink mode the exported flow is a hard link to the original, so
+    nothing is copied at all.  Each mode falls back to the next cheaper one,
+    down to copy, when the filesystem or the location of the files does not
+    allow it.  The fallback is decided for each flow on its own, so a flow
+    that cannot be linked does not change how any other flow is exported.
+    Note that hard links share the file with the original, so changes to
+    either are seen by both.
+
+    Each flow is written to a temporary file that is renamed into place, so an
+    interrupted export never looks complete, and flows whose export is already
+    up to date are skipped.  Flows are exported concurrently by a pool of
+    threads, as the work is almost all done in system calls.
+
+    Arguments:
+        mode - one of EXPORT_MODES
+        threads - number of threads exporting flows
+
+    '''
+
+    def __init__(self, mode='copy', threads=4):
+        if mode not in EXPORT_MODES:
+            raise ValueError("Unknown export mode '{}'.  Choose copy, reflink or hardlink.".format(
+                                mode))
+
+        self.mode = mode
+        self.threads = max(1, threads)
+
+        self.hardlink = mode == 'hardlink'
+        self.reflink = mode in ('hardlink', 'reflink') and fcntl is not None
+
+    def export_flows(self, flows):
+        '''
+        Export tcp flows.
+
+        Arguments:
+            flows - iterable of (source path, destination path) tuples
+
+        Returns:
+            dictionary of the form { method : number of flows }, where method is
+                hardlink, reflink, copy or skipped
+        '''
+
+        counts = dict.fromkeys(('hardlink', 'reflink', 'copy', 'skipped'), 0)
+
+        with concurrent.futures.ThreadPoolExecutor(self.threads) as executor:
+            for method in executor.map(self.export_flow_args, flows):
+                counts[method] += 1
+
+        return counts
+
+    def export_flow_args(self, args):
+        return self.export_flow(*args)
+
+    def export_flow(self, src, dst):
+        '''
+        Export a single tcp flow, unless an up to date export already exists.
+
+        Returns:
+            the method used, or skipped
+        '''
+
+        src_stat = os.stat(src)
+
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            dst_stat = None
+
+        if dst_stat is not None and (os.path.samestat(src_stat, dst_stat) or
+                (dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime == src_stat.st_mtime)):
+            return 'skipped'
+
+        temp_path = dst + '.tmp'
+
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+
+        if self.hardlink:
+            try:
+                os.link(src, temp_path)
+                os.replace(temp_path, dst)
+                return 'hardlink'
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+
+        method = copy_file(src, temp_path, src_stat.st_size, self.reflink)
+
+        shutil.copystat(src, temp_path)
+        os.replace(temp_path, dst)
+
+        return method
+
+def copy_file(src, dst, size, reflink=False):
+    '''
+    Copy src to a new file dst, as a reflink if reflink is set and the
+    filesystem supports it, and otherwise inside the kernel where possible.
+
+    Returns:
+        reflink or copy
+    '''
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if reflink:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return 'reflink'
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+
+        if not kernel_copy(fsrc.fileno(), fdst.fileno(), size):
+            shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+    return 'copy'
+
+def kernel_copy(src_fd, dst_fd, size):
+    '''
+    Copy size bytes between two file descriptors with copy_file_range, or with
+    sendfile if that is not available.
+
+    Returns:
+        True if the data was copied, False if neither is supported, in which case
+            nothing was copied
+    '''
+
+    for copy in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy is None:
+            continue
+
+        offset = 0
+
+        try:
+            while offset < size:
+                if copy is os.sendfile:
+                    copied = copy(dst_fd, src_fd, offset, size - offset)
+                else:
+                    copied = copy(src_fd, dst_fd, size - offset)
+
+                # the file was truncated while copying
+                if not copied:
+                    break
+
+                offset += copied
+        except OSError as e:
+            if offset or e.errno not in UNSUPPORTED:
+                raise
+            continue
+
+        return True
+
+    return False
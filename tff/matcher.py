@@ -0,0 +1,394 @@
+import collections
+import os
+import re
+import sys
+
+# number of bytes of a buffer searched at a time by find_offsets
+CHUNK_SIZE = 1 << 20
+
+# characters separating the tokens looked up by the token engine, as the body of
+# a regular expression character class: control characters, space, bytes
+# outside ASCII and punctuation that does not occur in addresses, domains or
+# hashes
+TOKEN_DELIMITERS = '\\x00-\\x20\\x7f-\\xff"\'()<>\\[\\]{},;:=|/\\\\?&#!*'
+
+class Matcher:
+    '''
+    Interface class for feature matching engines.
+
+    A matcher is built once for a set of features and can then be used to search
+    any amount of text for all of those features.  Engines are registered in
+    ENGINES and selected by name with build_matcher.
+
+    A binary matcher searches bytes instead of strings.  Its features are
+    encoded as UTF-8 for searching, with undecodable bytes read from feature
+    files as surrogates encoded back to those bytes, but matches are still
+    reported using the original feature strings.
+
+    '''
+
+    def __init__(self, features, binary=False):
+        '''
+        Duplicate and empty features are dropped, first occurrence wins.
+
+        Arguments:
+            features - iterable of feature strings to search for
+            binary - search bytes-like objects rather than strings
+
+        '''
+
+        self.binary = binary
+        self.features = list(collections.OrderedDict.fromkeys(
+                            feature for feature in features if feature))
+
+    def pattern(self, feature):
+        '''
+        Returns the form of a feature that is searched for.
+
+        '''
+
+        if self.binary:
+            return feature.encode('utf-8', 'surrogateescape')
+
+        return feature
+
+    def search(self, text):
+        '''
+        Find which features occur in a piece of text.
+
+        Arguments:
+            text - string to search, or bytes for binary matchers
+
+        Returns:
+            list of distinct features found in text
+
+        '''
+
+        raise NotImplementedError("Matcher must implement search.  See Matcher.")
+
+    def find_offsets(self, buffer):
+        '''
+        Find every occurrence of every feature in a buffer.
+
+        Arguments:
+            buffer - string, or for binary matchers any bytes-like object that
+                supports slicing and find, such as bytes or an mmap
+
+        Returns:
+            iterable of (feature, offset) tuples where offset is the position of
+                the first character or byte of the occurrence in buffer
+
+        '''
+
+        raise NotImplementedError("Matcher must implement find_offsets.  See Matcher.")
+
+class SubstringMatcher(Matcher):
+    '''
+    Tests every feature against the text with the in operator.
+
+    Costs O(len(text) * number of features), but needs no setup.  Useful for
+    very small feature lists.
+
+    '''
+
+    def __init__(self, features, binary=False):
+        super(SubstringMatcher, self).__init__(features, binary)
+        self._patterns = [(feature, self.pattern(feature)) for feature in self.features]
+
+    def search(self, text):
+        return [feature for (feature, pattern) in self._patterns if pattern in text]
+
+    def find_offsets(self, buffer):
+        for (feature, pattern) in self._patterns:
+            offset = buffer.find(pattern)
+
+            while offset != -1:
+                yield (feature, offset)
+                offset = buffer.find(pattern, offset + 1)
+
+class AhoCorasickMatcher(Matcher):
+    '''
+    Searches text for all features in a single pass using an Aho-Corasick automaton.
+
+    The automaton is a trie of the features with failure links, so the cost of a
+    search depends on the length of the text and the number of matches, not on
+    the number of features.
+
+    '''
+
+    def __init__(self, features, binary=False):
+        super(AhoCorasickMatcher, self).__init__(features, binary)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for feature in self.features:
+            self.__add(feature)
+
+        self.__link()
+
+    def __add(self, feature):
+        '''
+        Add a feature to the trie.
+
+        '''
+
+        state = 0
+        pattern = self.pattern(feature)
+
+        for symbol in pattern:
+            next_state = self._goto[state].get(symbol)
+
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][symbol] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+
+            state = next_state
+
+        self._out[state] = ((feature, len(pattern)),)
+
+    def __link(self):
+        '''
+        Compute failure links breadth first and merge the outputs of each state
+        with those of its failure state.
+
+        '''
+
+        queue = collections.deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for symbol, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and symbol not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[next_state] = self._goto[fail].get(symbol, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def search(self, text):
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        found = {}
+        state = 0
+
+        for symbol in text:
+            next_state = goto[state].get(symbol)
+
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(symbol)
+
+            state = next_state or 0
+
+            if out[state]:
+                for (feature, length) in out[state]:
+                    found[feature] = None
+
+        return list(found)
+
+    def find_offsets(self, buffer):
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        state = 0
+
+        # the automaton state carries over between chunks, so occurrences that
+        # straddle a chunk boundary are still found
+        for base in range(0, len(buffer), CHUNK_SIZE):
+            chunk = buffer[base:base + CHUNK_SIZE]
+
+            for (index, symbol) in enumerate(chunk, base + 1):
+                next_state = goto[state].get(symbol)
+
+                while next_state is None and state:
+                    state = fail[state]
+                    next_state = goto[state].get(symbol)
+
+                state = next_state or 0
+
+                if out[state]:
+                    for (feature, length) in out[state]:
+                        yield (feature, index - length)
+
+class TokenMatcher(Matcher):
+    '''
+    Finds features that occur as whole tokens, by splitting the text on
+    delimiters and looking every token up in a hash set of the features.
+
+    The cost of a search depends on the length of the text and not on the
+    number of features, which makes it far cheaper than substring search for
+    long lists of indicators such as IP addresses, domains or hashes.  Only
+    occurrences delimited on both sides are found: evil.com is found in
+    "Host: evil.com" but not in "notevil.com", and a feature containing a
+    delimiter is never found.
+
+    Buffers are split into tokens and checked against the set a chunk at a
+    time without leaving C code.  Only the features found in a chunk are then
+    located in it, to report their offsets.  Chunks are small, so that
+    locating the features of a chunk with many hits stays cheap.
+
+    Arguments:
+        delimiters - characters separating tokens, as the body of a regular
+            expression character class, TOKEN_DELIMITERS by default
+
+    '''
+
+    # number of bytes of a buffer split into tokens at a time by find_offsets
+    chunk_size = 1 << 16
+
+    def __init__(self, features, binary=False, delimiters=TOKEN_DELIMITERS):
+        super(TokenMatcher, self).__init__(features, binary)
+        self.delimiters = delimiters
+        self._features = {self.pattern(feature): feature for feature in self.features}
+        self._tokens = frozenset(self._features)
+        self._table = None
+
+        if binary:
+            self._token_re = re.compile('[^{}]+'.format(delimiters).encode('utf-8'))
+            self._delimiter_re = re.compile('[{}]'.format(delimiters).encode('utf-8'))
+
+            # translating every delimiter to a space and splitting on whitespace
+            # is several times faster than a regular expression, but only gives
+            # the same tokens if all whitespace delimits tokens
+            table = bytes(32 if self._delimiter_re.match(bytes([byte])) else byte
+                            for byte in range(256))
+
+            if all(table[byte] == 32 for byte in b' \t\n\r\x0b\x0c'):
+                self._table = table
+        else:
+            byte_delimiter = re.compile('[{}]'.format(delimiters).encode('utf-8'))
+
+            # undecodable bytes of flows read as text are kept as surrogates.  Other
+            # characters outside ASCII delimit tokens if all the bytes they are
+            # encoded with do, so text is split into the same tokens as bytes.
+            if all(byte_delimiter.match(bytes([byte])) for byte in range(0x80, 0x100)):
+                delimiters += '\\x80-\\U0010ffff'
+            else:
+                delimiters += '\\udc80-\\udcff'
+
+            self._token_re = re.compile('[^{}]+'.format(delimiters))
+            self._delimiter_re = re.compile('[{}]'.format(delimiters))
+
+    def search(self, text):
+        tokens = self._token_re.findall(text)
+        found = self._tokens.intersection(tokens)
+
+        if not found:
+            return []
+
+        # report the features in the order they occur
+        return [self._features[token] for token in collections.OrderedDict.fromkeys(tokens)
+                    if token in found]
+
+    def find_offsets(self, buffer):
+        start = 0
+        size = len(buffer)
+
+        while start < size:
+            end = start + self.chunk_size
+
+            # extend the chunk past the next delimiter, so no token is split
+            if end < size:
+                delimiter = self._delimiter_re.search(buffer, end)
+                end = delimiter.end() if delimiter else size
+            else:
+                end = size
+
+            chunk = buffer[start:end]
+
+            if self._table is not None:
+                found = self._tokens.intersection(chunk.translate(self._table).split())
+            else:
+                found = self._tokens.intersection(self._token_re.findall(chunk))
+
+            for (offset, feature) in self.__locate(chunk, found):
+                yield (feature, start + offset)
+
+            start = end
+
+    def __locate(self, chunk, found):
+        '''
+        Returns the sorted (offset, feature) pairs of the whole token
+        occurrences in a chunk of the tokens found in it.
+
+        '''
+
+        delimiter = self._delimiter_re.match
+        hits = []
+
+        for token in found:
+            offset = chunk.find(token)
+
+            while offset != -1:
+                after = offset + len(token)
+
+                if (offset == 0 or delimiter(chunk, offset - 1)) and \
+                        (after == len(chunk) or delimiter(chunk, after)):
+                    hits.append((offset, self._features[token]))
+
+                offset = chunk.find(token, offset + 1)
+
+        hits.sort()
+
+        return hits
+
+class MatcherGroup(Matcher):
+    '''
+    Searches text with several matchers in turn, such as a literal feature
+    matcher and a tff.patterns.PatternMatcher, reporting the hits of all of
+    them.  The matchers must all be binary or all search strings.
+
+    '''
+
+    def __init__(self, matchers):
+        self.matchers = list(matchers)
+        self.binary = self.matchers[0].binary
+        self.features = [feature for matcher in self.matchers for feature in matcher.features]
+
+    def search(self, text):
+        return [feature for matcher in self.matchers for feature in matcher.search(text)]
+
+    def find_offsets(self, buffer):
+        for matcher in self.matchers:
+            for hit in matcher.find_offsets(buffer):
+                yield hit
+
+ENGINES = {
+    'aho_corasick' : AhoCorasickMatcher,
+    'substring' : SubstringMatcher,
+    'token' : TokenMatcher,
+}
+
+def build_matcher(features, engine='aho_corasick', binary=False, **options):
+    '''
+    Build a matcher for a list of features using the named engine.
+
+    Arguments:
+        features - iterable of feature strings
+        engine - name of a matching engine registered in ENGINES
+        binary - build a matcher that searches bytes rather than strings
+        options - further arguments of the engine, such as the delimiters of
+            the token engine
+
+    Returns:
+        Matcher instance
+
+    '''
+
+    try:
+        matcher_class = ENGINES[engine]
+    except KeyError:
+        raise ValueError("Unknown matching engine '{}'.  Choose one of: {}".format(
+                            engine, ', '.join(sorted(ENGINES))))
+
+    return matcher_class(features, binary, **options)
@@ -0,0 +1,309 @@
+import ipaddress
+import os
+import re
+import sys
+
+from .endpoints import Endpoint
+from .matcher import Matcher
+
+# top level domains accepted by the domain pattern.  Matching any run of letters
+# would turn every file name and dotted identifier into a domain.
+DOMAIN_TLDS = frozenset('''
+    com net org edu gov mil int info biz name pro mobi arpa io co ai app dev me tv
+    cc ws xyz online site top club shop tech cloud store
+    ac ad ae af ag al am ar at au az ba bd be bg bh br by ca ch cl cn cr cu cy cz
+    de dk do dz ec ee eg es eu fi fr gb ge gr hk hr hu id ie il in iq ir is it jo
+    jp ke kg kr kw kz lb li lk lt lu lv ly ma md mk mn mx my ng nl no np nz om pe
+    ph pk pl pt py qa ro rs ru sa se sg si sk su sy th tj tm tn tr tw ua ug uk us
+    uy uz ve vn ye za
+'''.split())
+
+class Pattern:
+    '''
+    A regular expression feature, supplied by a plugin alongside its literal
+    features.
+
+    Every occurrence of the pattern is a hit.  The text it matched is stored as
+    the feature, and the name of the pattern is stored with it, so hits can be
+    attributed to the pattern that found them.
+
+    Patterns are combined into a single regular expression per scan, so they
+    must not use numbered backreferences, and flags must be scoped, as in
+    (?i:...), rather than global.  The regex is searched as UTF-8 encoded bytes
+    in the mmap read mode and as text in the text read mode.
+
+    Arguments:
+        name - name of the pattern, letters, digits and underscores only
+        regex - regular expression string
+        validate - optional function called with the matched text, returning
+            False to reject the match.  It must be a module level function so
+            that it can be sent to worker processes.
+
+    '''
+
+    def __init__(self, name, regex, validate=None):
+        if not re.match(r'\w+\Z', name):
+            raise ValueError("Invalid pattern name '{}'.  Use letters, digits and underscores.".format(
+                                name))
+
+        re.compile(regex)
+
+        self.name = name
+        self.regex = regex
+        self.validate = validate
+        self.key = '\0pattern\0{}\0{}'.format(name, regex)
+
+    def __eq__(self, other):
+        return isinstance(other, Pattern) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'Pattern({!r}, {!r})'.format(self.name, self.regex)
+
+class MatchedText(str):
+    '''
+    Text matched by a Pattern, used as the feature of a pattern hit.
+
+    A MatchedText is the matched string, so plugins can treat it like any other
+    feature, but it only equals matches of the same pattern.  Hits of a pattern
+    therefore never merge with those of a literal feature or another pattern
+    that found the same text.
+
+    Attributes:
+        pattern - the Pattern that matched
+
+    '''
+
+    def __new__(cls, text, pattern):
+        matched = str.__new__(cls, text)
+        matched.pattern = pattern
+        return matched
+
+    def __eq__(self, other):
+        return isinstance(other, MatchedText) and self.pattern == other.pattern \
+                and str.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((str(self), self.pattern.key))
+
+    def __reduce__(self):
+        return (MatchedText, (str(self), self.pattern))
+
+class PatternMatcher(Matcher):
+    '''
+    Searches for any number of Patterns in a single pass.
+
+    The patterns are compiled into one alternation with a named group per
+    pattern, so the text is searched in a single pass however many patterns
+    there are, and the group that matched tells which pattern a hit belongs
+    to.  An alternation only finds the leftmost match, so the span of each
+    match is then searched again for matches of every pattern starting inside
+    it, such as the domain of an email address.  Every match a separate search
+    for each pattern would find is reported: matches of one pattern do not
+    overlap, but matches of different patterns may.
+
+    '''
+
+    def __init__(self, patterns, binary=False):
+        self.binary = binary
+        self.patterns = list(_unique(patterns))
+        self.features = self.patterns
+
+        alternatives = []
+
+        # the group naming the pattern goes after it, rather than around it, so
+        # that an alternative starting with a literal or a character class is
+        # still rejected with a single test where it cannot match
+        for (index, pattern) in enumerate(self.patterns):
+            alternatives.append('(?:{})(?P<_p{}>)'.format(pattern.regex, index))
+
+        regex = '|'.join(alternatives) or '(?!)'
+        regexes = [pattern.regex for pattern in self.patterns]
+
+        if binary:
+            regex = regex.encode('utf-8')
+            regexes = [pattern_regex.encode('utf-8') for pattern_regex in regexes]
+
+        self._regex = re.compile(regex)
+        self._regexes = [re.compile(pattern_regex) for pattern_regex in regexes]
+
+    def __iter_matches(self, text):
+        patterns = self.patterns
+        regexes = self._regexes
+
+        # where the search for each pattern on its own would resume, after the
+        # end of its last match
+        resume = [0] * len(patterns)
+
+        for match in self._regex.finditer(text):
+            start = match.start()
+            end = max(match.end(), start + 1)
+            first = int(match.lastgroup[2:])
+
+            # any other match starts inside the span of this one, as the
+            # alternation would have found it first otherwise
+            for (index, regex) in enumerate(regexes):
+                position = max(start, resume[index])
+
+                while position < end:
+                    if index == first and position == start:
+                        found = match
+                    else:
+                        found = regex.match(text, position)
+
+                    if found is None:
+                        position += 1
+                        continue
+
+                    position = resume[index] = max(found.end(), position + 1)
+                    pattern = patterns[index]
+                    matched = found.group()
+
+                    if self.binary:
+                        matched = matched.decode('utf-8', 'surrogateescape')
+
+                    if pattern.validate is not None and not pattern.validate(matched):
+                        continue
+
+                    yield (MatchedText(matched, pattern), found.start())
+
+    def search(self, text):
+        found = {}
+
+        for (feature, offset) in self.__iter_matches(text):
+            found[feature] = None
+
+        return list(found)
+
+    def find_offsets(self, buffer):
+        return self.__iter_matches(buffer)
+
+def _unique(patterns):
+    seen = set()
+
+    for pattern in patterns:
+        if pattern not in seen:
+            seen.add(pattern)
+            yield pattern
+
+def luhn(text):
+    '''
+    Returns whether the digits of text pass the Luhn checksum used by payment
+    card numbers.
+
+    '''
+
+    digits = [int(c) for c in text if c.isdigit()]
+
+    if not 13 <= len(digits) <= 19:
+        return False
+
+    total = 0
+
+    for (index, digit) in enumerate(reversed(digits)):
+        if index % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+
+    return total % 10 == 0
+
+def valid_ipv4(text):
+    return all(int(octet) <= 255 for octet in text.split('.'))
+
+def valid_ipv6(text):
+    try:
+        ipaddress.IPv6Address(text)
+    except ValueError:
+        return False
+
+    # reject things like "d::" in "std::", which are valid but hardly ever addresses
+    return sum(1 for group in text.split(':') if group) >= 2
+
+def valid_domain(text):
+    return text.rsplit('.', 1)[-1].lower() in DOMAIN_TLDS
+
+# regex and validator of each typed pattern.  Each starts with a character
+# class, with the left boundary checked by a lookbehind after it, so that the
+# combined search rejects them with a single test wherever they cannot start.
+TYPED_PATTERNS = {
+    'email' : (r'[A-Za-z0-9._%+-](?<![A-Za-z0-9._%+-]{2})[A-Za-z0-9._%+-]{0,63}'
+               r'@(?:[A-Za-z0-9-]{1,63}\.){1,8}[A-Za-z]{2,24}', None),
+    'ccn' : (r'[0-9](?<![0-9]{2})(?:[ -]?[0-9]){12,18}(?![0-9])', luhn),
+    'ipv4' : (r'[0-9](?<![0-9.][0-9])[0-9]{0,2}(?:\.[0-9]{1,3}){3}(?![0-9]|\.[0-9])', valid_ipv4),
+    'ipv6' : (r'[0-9A-Fa-f:](?<![0-9A-Fa-f:]{2})[0-9A-Fa-f]{0,3}:[0-9A-Fa-f:]{1,37}'
+              r'(?![0-9A-Fa-f:])', valid_ipv6),
+    'domain' : (r'[A-Za-z0-9](?<![A-Za-z0-9.-][A-Za-z0-9])(?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.'
+                r'(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.){0,7}[A-Za-z]{2,24}'
+                r'(?![A-Za-z0-9-])', valid_domain),
+}
+
+def typed_pattern(name):
+    '''
+    Returns the Pattern for one of the built in pattern types.
+
+    Arguments:
+        name - one of email, ccn (payment card numbers, Luhn validated), ipv4,
+            ipv6 or domain
+
+    Returns:
+        Pattern object
+
+    '''
+
+    try:
+        (regex, validate) = TYPED_PATTERNS[name]
+    except KeyError:
+        raise ValueError("Unknown pattern type '{}'.  Choose one of: {}".format(
+                            name, ', '.join(sorted(TYPED_PATTERNS))))
+
+    return Pattern(name, regex, validate)
+
+def feature_key(feature):
+    '''
+    Returns the string recorded in the database for a literal feature, a
+    Pattern or an Endpoint, when saving the feature set a feature type was
+    scanned with.
+
+    '''
+
+    if isinstance(feature, Pattern):
+        return feature.key
+
+    if isinstance(feature, Endpoint):
+        return '\0endpoint\0{}'.format(feature)
+
+    return feature
+
+def pattern_name(key):
+    '''
+    Returns the name of the pattern a key returned by feature_key stands for,
+    or None if the key is a literal feature.
+
+    '''
+
+    if key.startswith('\0pattern\0'):
+        return key.split('\0')[2]
+
+    return None
+
+def endpoint_indicator(key):
+    '''
+    Returns the indicator of the Endpoint a key returned by feature_key stands
+    for, or None if the key is not an Endpoint.
+
+    '''
+
+    if key.startswith('\0endpoint\0'):
+        return key.split('\0', 2)[2]
+
+    return None
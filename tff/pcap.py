@@ -0,0 +1,588 @@
+import collections
+import io
+import os
+import struct
+import sys
+
+from .tcp_flow import TcpFlow
+
+# link layer types understood by parse_frame
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+# ethertypes of 802.1Q and 802.1ad VLAN tags
+VLAN_ETHERTYPES = (0x8100, 0x88a8, 0x9100)
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_OBSOLETE_PACKET = 2
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+
+class PcapError(Exception):
+    '''
+    Raised when a capture file cannot be parsed.
+
+    '''
+
+class PcapReader:
+    '''
+    Reads packets from a pcap or pcapng capture file.
+
+    Packets are read one at a time, so captures of any size can be read with
+    constant memory.
+
+    Arguments:
+        path - path to a pcap or pcapng file
+
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        '''
+        Yields (timestamp, link type, frame) tuples, where timestamp is in
+        seconds since the epoch and frame is the captured bytes of the packet.
+
+        '''
+
+        with open(self.path, 'rb') as f:
+            magic = f.read(4)
+
+            if len(magic) < 4:
+                return
+
+            if struct.unpack('<I', magic)[0] == PCAPNG_SECTION_HEADER:
+                for packet in self.__read_pcapng(f, magic):
+                    yield packet
+            else:
+                for packet in self.__read_pcap(f, magic):
+                    yield packet
+
+    def __read_pcap(self, f, magic):
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            endian = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            endian = '>'
+        else:
+            raise PcapError("{} is not a pcap or pcapng file.".format(self.path))
+
+        # the second magic number variant stores nanosecond timestamps
+        resolution = 1e-9 if magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d') else 1e-6
+
+        header = self.__read_exactly(f, 20)
+        linktype = struct.unpack(endian + 'HHiIII', header)[5] & 0xffff
+        record = struct.Struct(endian + 'IIII')
+
+        while True:
+            header = f.read(16)
+            if len(header) < 16:
+                return
+
+            (seconds, fraction, captured_length, original_length) = record.unpack(header)
+            frame = self.__read_exactly(f, captured_length)
+
+            yield (seconds + fraction * resolution, linktype, frame)
+
+    def __read_pcapng(self, f, magic):
+        endian = '<'
+        interfaces = []
+
+        block_type = struct.unpack('<I', magic)[0]
+
+        while True:
+            length_bytes = self.__read_exactly(f, 4)
+
+            if block_type == PCAPNG_SECTION_HEADER:
+                byte_order = self.__read_exactly(f, 4)
+                endian = '<' if byte_order == b'\x4d\x3c\x2b\x1a' else '>'
+                body = byte_order + self.__read_exactly(
+                            f, struct.unpack(endian + 'I', length_bytes)[0] - 12)
+                interfaces = []
+            else:
+                body = self.__read_exactly(f, struct.unpack(endian + 'I', length_bytes)[0] - 8)
+
+            # the block body is followed by a copy of the block length
+            body = body[:-4]
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                interfaces.append(self.__parse_interface(body, endian))
+
+            elif block_type == PCAPNG_ENHANCED_PACKET:
+                (interface, high, low, captured_length, original_length) = \
+                    struct.unpack(endian + 'IIIII', body[:20])
+                (linktype, resolution) = interfaces[interface]
+                yield (((high << 32) | low) * resolution, linktype, body[20:20 + captured_length])
+
+            elif block_type == PCAPNG_SIMPLE_PACKET:
+                original_length = struct.unpack(endian + 'I', body[:4])[0]
+                (linktype, resolution) = interfaces[0]
+                yield (0.0, linktype, body[4:4 + original_length])
+
+            elif block_type == PCAPNG_OBSOLETE_PACKET:
+                (interface, drops, high, low, captured_length, original_length) = \
+                    struct.unpack(endian + 'HHIIII', body[:20])
+                (linktype, resolution) = interfaces[interface]
+                yield (((high << 32) | low) * resolution, linktype, body[20:20 + captured_length])
+
+            block_type_bytes = f.read(4)
+            if len(block_type_bytes) < 4:
+                return
+
+            # the section header block type reads the same in either byte order
+            block_type = struct.unpack(endian + 'I', block_type_bytes)[0]
+
+    def __parse_interface(self, body, endian):
+        '''
+        Returns the link type and timestamp resolution of an interface
+        description block.
+
+        '''
+
+        linktype = struct.unpack(endian + 'H', body[:2])[0]
+        resolution = 1e-6
+        offset = 8
+
+        while offset + 4 <= len(body):
+            (code, length) = struct.unpack(endian + 'HH', body[offset:offset + 4])
+
+            if code == 0:
+                break
+
+            # if_tsresol, a power of ten or, with the high bit set, of two
+            if code == 9 and length >= 1:
+                value = body[offset + 4]
+                resolution = 2 ** -(value & 0x7f) if value & 0x80 else 10 ** -value
+
+            offset += 4 + ((length + 3) & ~3)
+
+        return (linktype, resolution)
+
+    def __read_exactly(self, f, size):
+        data = f.read(size)
+
+        if len(data) < size:
+            raise PcapError("{} is truncated.".format(self.path))
+
+        return data
+
+def parse_frame(linktype, frame):
+    '''
+    Parse a captured frame down to its TCP segment.
+
+    IP fragments and non-TCP packets are skipped.
+
+    Arguments:
+        linktype - link layer type of the capture interface
+        frame - captured bytes of the packet
+
+    Returns:
+        tuple of the form (src ip, src port, dest ip, dest port, vlan, seq,
+            flags, payload), or None if the frame does not hold a TCP segment
+
+    '''
+
+    vlan = None
+
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None
+
+        ethertype = struct.unpack('!H', frame[12:14])[0]
+        offset = 14
+
+        while ethertype in VLAN_ETHERTYPES and len(frame) >= offset + 4:
+            (tci, ethertype) = struct.unpack('!HH', frame[offset:offset + 4])
+            if vlan is None:
+                vlan = tci & 0x0fff
+            offset += 4
+
+        if ethertype not in (0x0800, 0x86dd):
+            return None
+
+        packet = frame[offset:]
+
+    elif linktype == LINKTYPE_LINUX_SLL:
+        packet = frame[16:]
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        packet = frame[20:]
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        packet = frame[4:]
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        packet = frame
+    else:
+        return None
+
+    if not packet:
+        return None
+
+    version = packet[0] >> 4
+
+    if version == 4:
+        segment = _parse_ipv4(packet)
+    elif version == 6:
+        segment = _parse_ipv6(packet)
+    else:
+        return None
+
+    if segment is None:
+        return None
+
+    (src_ip, dest_ip, tcp) = segment
+
+    if len(tcp) < 20:
+        return None
+
+    (src_port, dest_port, seq, ack, offset, flags) = struct.unpack('!HHIIBB', tcp[:14])
+
+    return (src_ip, src_port, dest_ip, dest_port, vlan, seq, flags, tcp[(offset >> 4) * 4:])
+
+def _parse_ipv4(packet):
+    if len(packet) < 20:
+        return None
+
+    header_length = (packet[0] & 0x0f) * 4
+    (total_length, fragment, protocol) = struct.unpack('!2xH2xHxB', packet[:10])
+
+    # more fragments flag or a fragment offset
+    if protocol != 6 or fragment & 0x3fff:
+        return None
+
+    # a zero total length is left by TCP segmentation offload
+    if total_length < header_length:
+        total_length = len(packet)
+
+    src_ip = '{:03d}.{:03d}.{:03d}.{:03d}'.format(*packet[12:16])
+    dest_ip = '{:03d}.{:03d}.{:03d}.{:03d}'.format(*packet[16:20])
+
+    return (src_ip, dest_ip, packet[header_length:total_length])
+
+def _parse_ipv6(packet):
+    if len(packet) < 40:
+        return None
+
+    (payload_length, next_header) = struct.unpack('!4xHB', packet[:7])
+    payload = packet[40:40 + payload_length]
+
+    # walk hop-by-hop, routing and destination options extension headers
+    while next_header in (0, 43, 60) and len(payload) >= 8:
+        next_header = payload[0]
+        payload = payload[(payload[1] + 1) * 8:]
+
+    if next_header != 6:
+        return None
+
+    src_ip = ':'.join('{:04x}'.format(group) for group in struct.unpack('!8H', packet[8:24]))
+    dest_ip = ':'.join('{:04x}'.format(group) for group in struct.unpack('!8H', packet[24:40]))
+
+    return (src_ip, dest_ip, payload)
+
+class MemoryTcpFlow(TcpFlow):
+    '''
+    A tcp flow reassembled in memory, usable wherever a TcpFlow is.
+
+    The flow is named the same way tcpflow names its output files.  Its path is
+    None until save is called.
+
+    '''
+
+    __slots__ = ('data',)
+
+    in_memory = True
+
+    def __init__(self, source_ip, source_port, dest_ip, dest_port, vlan,
+            connection_number, data, mtime):
+        self.source_ip = sys.intern(source_ip)
+        self.source_port = source_port
+        self.dest_ip = sys.intern(dest_ip)
+        self.dest_port = dest_port
+        self.vlan = vlan
+        self.timestamp = None
+        self.connection_number = connection_number
+
+        self.filename = '{}.{:05d}-{}.{:05d}'.format(
+            self.source_ip, self.source_port, self.dest_ip, self.dest_port)
+        if self.vlan is not None:
+            self.filename += '--{}'.format(self.vlan)
+        if connection_number:
+            self.filename += 'c{}'.format(connection_number)
+
+        self.path = None
+        self.data = bytes(data)
+        self.size = len(self.data)
+        self.mtime = mtime
+        self.found_features = {}
+
+    def save(self, directory):
+        '''
+        Write the flow to a file named after it in directory, and use that file
+        as the path of the flow from then on.
+
+        '''
+
+        self.path = os.path.join(directory, self.filename)
+
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+        os.utime(self.path, (self.mtime, self.mtime))
+
+    def open_bytes(self):
+        return _Unclosed(self.data)
+
+    def open_text(self):
+        # read as bytes, like a tcpflow file, so positions are byte offsets
+        return io.BytesIO(self.data)
+
+class _Unclosed:
+    '''
+    Context manager handing out a value without closing anything afterwards.
+
+    '''
+
+    def __init__(self, value):
+        self.value = value
+
+    def __enter__(self):
+        return self.value
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class _Stream:
+    '''
+    Reassembly state of one direction of a TCP connection.
+
+    '''
+
+    def __init__(self, next_seq, timestamp):
+        self.next_seq = next_seq
+        self.data = bytearray()
+        self.pending = {}
+        self.pending_bytes = 0
+        self.last_seen = timestamp
+        self.closed = False
+
+class TcpReassembler:
+    '''
+    Reassembles the TCP streams of a capture into MemoryTcpFlows.
+
+    Each direction of a connection becomes its own flow, as with tcpflow.
+    Segments are placed by sequence number, so retransmissions are dropped and
+    out of order segments are held back until the gap before them is filled.
+    Bytes that overlap data already received are dropped, the first copy of
+    each byte wins.
+
+    Memory is bounded: once max_buffered_bytes are buffered or max_open_flows
+    streams are open, the least recently active stream is emitted early.  Any
+    later data for the same connection starts a new flow with the next
+    connection number, as tcpflow does for reused connections.  Streams are
+    also emitted once linger seconds of capture time have passed since they
+    were closed by a FIN or RST.
+
+    Arguments:
+        max_buffered_bytes - bytes of stream data held before emitting streams
+        max_open_flows - number of streams held before emitting streams
+        linger - seconds of capture time a closed stream is kept for late segments
+        max_gap - segments further than this many bytes ahead are dropped
+
+    '''
+
+    def __init__(self, max_buffered_bytes=256 << 20, max_open_flows=100000, linger=5.0,
+            max_gap=1 << 20):
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_open_flows = max_open_flows
+        self.linger = linger
+        self.max_gap = max_gap
+
+        self.streams = collections.OrderedDict()
+        self.closed_streams = collections.OrderedDict()
+        self.connection_numbers = {}
+        self.buffered_bytes = 0
+
+    def add(self, timestamp, linktype, frame):
+        '''
+        Add a captured frame to its stream.
+
+        Returns:
+            list of MemoryTcpFlows completed by adding the frame
+
+        '''
+
+        completed = []
+        segment = parse_frame(linktype, frame)
+
+        if segment is not None:
+            self.__add_segment(timestamp, segment, completed)
+
+        self.__expire(timestamp, completed)
+
+        return completed
+
+    def flush(self):
+        '''
+        Emit every remaining stream, at the end of the capture.
+
+        Returns:
+            list of MemoryTcpFlows
+
+        '''
+
+        completed = []
+
+        for key in list(self.streams):
+            self.__emit(key, completed)
+
+        return completed
+
+    def __add_segment(self, timestamp, segment, completed):
+        (src_ip, src_port, dest_ip, dest_port, vlan, seq, flags, payload) = segment
+        key = (src_ip, src_port, dest_ip, dest_port, vlan)
+        stream = self.streams.get(key)
+
+        # a new SYN on a stream that already carried data is a new connection
+        if stream is not None and flags & TCP_SYN and (stream.data or stream.pending):
+            self.__emit(key, completed)
+            stream = None
+
+        if stream is None:
+            if not payload and not flags & TCP_SYN:
+                return
+
+            stream = _Stream(seq + 1 if flags & TCP_SYN else seq, timestamp)
+            self.streams[key] = stream
+        else:
+            self.streams.move_to_end(key)
+
+        stream.last_seen = timestamp
+
+        if flags & TCP_SYN:
+            payload = payload[:0]
+
+        if payload:
+            self.__add_payload(stream, seq, payload)
+
+        if flags & (TCP_FIN | TCP_RST) and not stream.closed:
+            stream.closed = True
+            self.closed_streams[key] = timestamp
+
+        while self.streams and (self.buffered_bytes > self.max_buffered_bytes or
+                len(self.streams) > self.max_open_flows):
+            self.__emit(next(iter(self.streams)), completed)
+
+    def __add_payload(self, stream, seq, payload):
+        offset = _seq_offset(seq, stream.next_seq)
+
+        if offset > 0:
+            held = stream.pending.get(seq)
+
+            # of segments starting at the same byte, keep the longest
+            if offset <= self.max_gap and (held is None or len(payload) > len(held)):
+                if held is not None:
+                    stream.pending_bytes -= len(held)
+                    self.buffered_bytes -= len(held)
+
+                stream.pending[seq] = payload
+                stream.pending_bytes += len(payload)
+                self.buffered_bytes += len(payload)
+            return
+
+        # drop the part of the segment that was already received
+        self.__append(stream, payload[-offset:])
+
+        while stream.pending:
+            seq = stream.next_seq
+
+            # held segments may also overlap the data received since
+            if seq not in stream.pending:
+                seq = next((seq for seq in stream.pending
+                                if _seq_offset(seq, stream.next_seq) < 0), None)
+                if seq is None:
+                    break
+
+            payload = stream.pending.pop(seq)
+            stream.pending_bytes -= len(payload)
+            self.buffered_bytes -= len(payload)
+            self.__append(stream, payload[-_seq_offset(seq, stream.next_seq):])
+
+    def __append(self, stream, payload):
+        stream.data += payload
+        stream.next_seq = (stream.next_seq + len(payload)) % (1 << 32)
+        self.buffered_bytes += len(payload)
+
+    def __expire(self, timestamp, completed):
+        while self.closed_streams:
+            (key, closed_at) = next(iter(self.closed_streams.items()))
+
+            if timestamp - closed_at < self.linger:
+                break
+
+            self.__emit(key, completed)
+
+    def __emit(self, key, completed):
+        stream = self.streams.pop(key)
+        self.closed_streams.pop(key, None)
+        self.buffered_bytes -= len(stream.data) + stream.pending_bytes
+
+        # segments that never became contiguous are appended in sequence order,
+        # without the bytes they share with the segments before them
+        end = 0
+
+        for seq in sorted(stream.pending, key=lambda seq: (seq - stream.next_seq) % (1 << 32)):
+            payload = stream.pending[seq]
+            offset = (seq - stream.next_seq) % (1 << 32)
+            stream.data += payload[max(0, end - offset):]
+            end = max(end, offset + len(payload))
+
+        if not stream.data:
+            return
+
+        connection_number = self.connection_numbers.get(key, 0)
+        self.connection_numbers[key] = connection_number + 1
+
+        (src_ip, src_port, dest_ip, dest_port, vlan) = key
+        completed.append(MemoryTcpFlow(src_ip, src_port, dest_ip, dest_port, vlan,
+                            connection_number, stream.data, stream.last_seen))
+
+def _seq_offset(seq, next_seq):
+    '''
+    Returns the distance of seq from next_seq, negative for bytes before it,
+    allowing for sequence number wraparound.
+
+    '''
+
+    return (seq - next_seq + (1 << 31)) % (1 << 32) - (1 << 31)
+
+def iter_pcap_flows(path, **limits):
+    '''
+    Reassemble the TCP flows of a capture file, yielding each flow as soon as it
+    is complete.
+
+    Arguments:
+        path - path to a pcap or pcapng file
+        limits - keyword arguments passed on to TcpReassembler
+
+    Returns:
+        generator of MemoryTcpFlow objects
+
+    '''
+
+    reassembler = TcpReassembler(**limits)
+
+    for (timestamp, linktype, frame) in PcapReader(path):
+        for tcp_flow in reassembler.add(timestamp, linktype, frame):
+            yield tcp_flow
+
+    for tcp_flow in reassembler.flush():
+        yield tcp_flow
@@ -37,12 +37,38 @@ class AbstractPlugin(IPlugin):
             basedir - Fully qualified path to features base drectory
 
         Returns:
-            features - a list of strings to search for in TCP flows
+            features - a list of strings to search for in TCP flows, which may
+                also hold tff.patterns.Pattern objects.  Every match of a
+                pattern is found as a feature holding the matched text, with
+                the Pattern in its pattern attribute.  It may also hold
+                tff.endpoints.Endpoint objects, IPs, CIDR ranges, ports or
+                VLANs matched against the endpoints of each flow instead of its
+                data.  Their hits are saved without being passed to
+                filter_features.
 
         '''
 
         raise NotImplementedError("Plugin must implement get_features.  See AbstractPlugin.")
 
+    def feature_sources(self, basedir):
+        '''
+        List the files get_features reads its features from.
+
+        Override this method to let Tcp Feature Finder cache the features of the
+        plugin.  While the contents of every listed file stay the same, the
+        features are loaded from the cache instead of calling get_features.
+        Only return paths if the features depend on nothing but these files.
+
+        Arguments:
+            basedir - Fully qualified path to features base drectory
+
+        Returns:
+            list of file paths, or None if the features cannot be cached
+
+        '''
+
+        return None
+
     def filter_features(self, tcpflow_path, found_features):
         '''
         Filter features found in a tcpflow
@@ -55,6 +81,13 @@ class AbstractPlugin(IPlugin):
             tcpflow_path - 
             found_features - a dictionary of the following format:
                 { specific_feature : [file_offset] }
+                With the default mmap read mode, file_offset is the byte offset
+                of the feature itself.  With the text read mode it is the byte
+                offset of the start of the line containing the feature, listed
+                once per line.  If context_bytes is set in the [scan] section
+                of config.ini, each file_offset is a tff.tcp_flow.Hit, an int
+                whose context attribute holds the bytes around the feature, so
+                filtering on the context needs no further reads of the flow.
 
         Returns:
             filtered_features - a dictionary of the same format as the found_features
@@ -83,3 +116,26 @@ class AbstractPlugin(IPlugin):
 
         return None
 
+    def write_report(self, db_controller, report):
+        '''
+        Stream a custom report for a plugin.
+
+        Override this method instead of generate_report for large reports, so
+        that the report is written line by line rather than built up in memory.
+        The report is saved as (plugin name)_report.txt, and no file is created
+        if nothing is written.  By default, the string returned by
+        generate_report is written, if any.
+
+        Arguments:
+            db_controller - an instance of the DatabaseController object for
+                querying the database to get useful information
+            report - a ReportSink with a write(text) method, as used for the
+                standard reports
+
+        '''
+
+        plugin_report = self.generate_report(db_controller)
+
+        if plugin_report is not None:
+            report.write(plugin_report)
+
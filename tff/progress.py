@@ -0,0 +1,233 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+class Progress:
+    '''
+    Reports the progress of a scan on stderr, and optionally to a status file.
+
+    update() is called once per flow and only looks at the clock, so reporting
+    costs next to nothing between reports.  On a terminal the progress line is
+    redrawn in place, otherwise a new line is printed every interval seconds.
+
+    The status file is a JSON document replaced atomically every status_interval
+    seconds, so an external monitor can poll it at any time.
+
+    The total of a pass may be counted in a background thread with
+    count_total(), so the pass starts right away and the total and ETA are
+    shown once counting is done.  The ETA is based on bytes when the total
+    size is known, as the time a flow takes grows with its size.
+
+    Arguments:
+        display - print progress to stream
+        interval - seconds between progress lines
+        status_path - path of the status file, or None for no status file
+        status_interval - seconds between status file updates
+        stream - file progress is printed to
+
+    '''
+
+    def __init__(self, display=True, interval=1.0, status_path=None, status_interval=10.0,
+            stream=sys.stderr):
+        self.display = display
+        self.interval = interval
+        self.status_path = status_path
+        self.status_interval = status_interval
+        self.stream = stream
+        self.tty = display and stream.isatty()
+
+        self.started = time.time()
+        self.label = None
+        self.state = 'starting'
+        self.passes = 0
+        self.start(None)
+
+    def start(self, label, total=None, total_bytes=None):
+        '''
+        Start reporting a new pass over the flows.
+
+        Arguments:
+            label - name of the pass shown in the progress line
+            total - number of flows in the pass, if known
+            total_bytes - combined size of the flows in the pass, if known
+
+        '''
+
+        self.passes += 1
+        self.label = label
+        self.total = total
+        self.total_bytes = total_bytes
+        self.flows = 0
+        self.bytes = 0
+        self.skipped_bytes = 0
+        self.hits = 0
+        self.pass_started = time.monotonic()
+        self.next_display = self.pass_started + self.interval
+        self.next_status = self.pass_started
+
+        if label is not None:
+            self.state = 'running'
+
+    def count_total(self, count):
+        '''
+        Count the total of the current pass in a background thread.
+
+        Arguments:
+            count - function returning the number of flows and their combined
+                size in bytes.  The total is left unknown if it raises OSError.
+
+        '''
+
+        current = self.passes
+
+        def run():
+            try:
+                (total, total_bytes) = count()
+            except OSError:
+                return
+
+            # the pass may have finished while counting
+            if self.passes == current:
+                (self.total, self.total_bytes) = (total, total_bytes)
+
+        threading.Thread(target=run, name='count_total', daemon=True).start()
+
+    def update(self, size=0, hits=0, skipped=False):
+        '''
+        Record that a flow of size bytes is done.
+
+        Arguments:
+            size - size of the flow in bytes
+            hits - number of features found in the flow
+            skipped - the flow was not read, so its size counts towards the
+                total but not the throughput
+
+        '''
+
+        self.flows += 1
+        self.hits += hits
+
+        if skipped:
+            self.skipped_bytes += size
+        else:
+            self.bytes += size
+
+        now = time.monotonic()
+
+        if now >= self.next_display:
+            self.next_display = now + self.interval
+            self.show(now)
+
+        if self.status_path and now >= self.next_status:
+            self.next_status = now + self.status_interval
+            self.write_status(now)
+
+    def finish(self):
+        '''
+        Report the end of the current pass.
+
+        '''
+
+        now = time.monotonic()
+        self.show(now, final=True)
+
+        if self.status_path:
+            self.write_status(now)
+
+    def close(self):
+        '''
+        Mark the run as done in the status file.
+
+        '''
+
+        self.state = 'done'
+
+        if self.status_path:
+            self.write_status(time.monotonic())
+
+    def snapshot(self, now):
+        '''
+        Returns the counters of the current pass with rates and ETA.
+
+        '''
+
+        elapsed = now - self.pass_started
+        flows_per_s = self.flows / elapsed if elapsed > 0 else None
+        bytes_per_s = self.bytes / elapsed if elapsed > 0 else None
+        (total, total_bytes) = (self.total, self.total_bytes)
+        eta = None
+
+        if total_bytes is not None and bytes_per_s:
+            eta = max(0, total_bytes - self.bytes - self.skipped_bytes) / bytes_per_s
+        elif total is not None and flows_per_s:
+            eta = max(0, total - self.flows) / flows_per_s
+
+        return {
+            'state' : self.state,
+            'pass' : self.label,
+            'flows' : self.flows,
+            'total_flows' : total,
+            'bytes' : self.bytes + self.skipped_bytes,
+            'total_bytes' : total_bytes,
+            'hits' : self.hits,
+            'elapsed' : elapsed,
+            'flows_per_s' : flows_per_s,
+            'mib_per_s' : bytes_per_s / float(1 << 20) if bytes_per_s is not None else None,
+            'eta' : eta,
+            'run_started' : datetime.datetime.fromtimestamp(self.started).isoformat(),
+            'updated' : datetime.datetime.now().isoformat(),
+        }
+
+    def show(self, now, final=False):
+        if not self.display or self.label is None:
+            return
+
+        status = self.snapshot(now)
+        (total, total_bytes) = (status['total_flows'], status['total_bytes'])
+
+        if total is not None:
+            done = '{}/{} flows ({:.1%})'.format(status['flows'], total,
+                        status['flows'] / float(total) if total else 1.0)
+        else:
+            done = '{} flows'.format(status['flows'])
+
+        if total_bytes is not None:
+            size = '{:.1f}/{:.1f} MiB'.format(status['bytes'] / float(1 << 20),
+                        total_bytes / float(1 << 20))
+        else:
+            size = '{:.1f} MiB'.format(status['bytes'] / float(1 << 20))
+
+        line = '[-] {}: {}, {}, {:.1f} flows/s, {:.1f} MiB/s, {} hits'.format(
+                    self.label, done, size, status['flows_per_s'] or 0.0,
+                    status['mib_per_s'] or 0.0, status['hits'])
+
+        if final:
+            line += ', done in {}'.format(format_seconds(status['elapsed']))
+        elif status['eta'] is not None:
+            line += ', ETA {}'.format(format_seconds(status['eta']))
+
+        if self.tty:
+            self.stream.write('\r\x1b[K' + line + ('\n' if final else ''))
+        else:
+            self.stream.write(line + '\n')
+
+        self.stream.flush()
+
+    def write_status(self, now):
+        temp_path = self.status_path + '.tmp'
+
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(now), f, indent=4)
+
+        os.replace(temp_path, self.status_path)
+
+def format_seconds(seconds):
+    '''
+    Format a number of seconds as H:MM:SS.
+
+    '''
+
+    return str(datetime.timedelta(seconds=int(seconds)))
@@ -1,29 +1,161 @@
-import collections
-import operator
+import multiprocessing
 import os
 import sys
 
-from .tcp_flow import TcpFlow
+from .database_builder import DatabaseController
 from .helpers import get_list_from_config
 
+# report builder used by every task run in a report worker process
+_worker_report_builder = None
+
+class ReportSink:
+    '''
+    Buffered, write-only text file that a report is streamed into.
+
+    The file is not created until the first write, so a report that writes
+    nothing leaves no file behind.  The report is written to a temporary file
+    that only replaces path once it is complete, so a report file that exists is
+    never partially written.
+
+    Arguments:
+        path - path of the report file
+        buffer_size - number of bytes buffered before writing to the file
+
+    '''
+
+    def __init__(self, path, buffer_size=1 << 16):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.file = None
+
+    def write(self, text):
+        if self.file is None:
+            self.file = open(self.path + '.tmp', 'w', buffering=self.buffer_size)
+
+        self.file.write(text)
+
+    def close(self, discard=False):
+        if self.file is None:
+            return
+
+        self.file.close()
+        self.file = None
+
+        if discard:
+            os.remove(self.path + '.tmp')
+        else:
+            os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(discard=exc_type is not None)
+
+class IpFeatureStats:
+    '''
+    Counts of the features found in flows to or from a single IP.
+
+    The histograms are iterables of (value, count) tuples, most common first,
+    that are read from the database as the report is written.
+
+    '''
+
+    def __init__(self, unique_features, features, feature_types, all_features,
+            src_features, dest_features, paired_ips):
+        self.unique_features = unique_features
+        self.features = features
+        self.feature_types = feature_types
+        self.all_features = all_features
+        self.src_features = src_features
+        self.dest_features = dest_features
+        self.paired_ips = paired_ips
+
+class FlowFeatureStats:
+    '''
+    Counts of the features found in a single tcp flow.
+
+    feature_types and the features histogram, of (feature, count) tuples most
+    common first, are read from the database as the report is written.
+
+    '''
+
+    def __init__(self, source_ip, dest_ip, features_found, feature_type_count,
+            feature_types, features):
+        self.source_ip = source_ip
+        self.dest_ip = dest_ip
+        self.features_found = features_found
+        self.feature_type_count = feature_type_count
+        self.feature_types = feature_types
+        self.features = features
+
+class RowGroups:
+    '''
+    Reads the rows of a query ordered by its first column a group at a time,
+    so that several queries ordered by the same key can be read in step.  Each
+    query may skip keys that the others have.
+
+    Arguments:
+        rows - iterable of rows ordered by their first column
+
+    '''
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.row = next(self.rows, None)
+
+    def take(self, key):
+        '''
+        Yields the remaining columns of each row for key.  Rows for keys before
+        key must all have been taken.
+
+        '''
+
+        while self.row is not None and self.row[0] == key:
+            row = self.row
+            self.row = next(self.rows, None)
+            yield tuple(row[1:])
+
+    def skip(self, key):
+        '''
+        Skip the rows for key that have not been taken.
+
+        '''
+
+        for row in self.take(key):
+            pass
+
 class ReportBuilder:
     '''
     Object used to build reports.
 
+    Per IP and per tcp flow counts are streamed from grouped queries ordered by
+    IP or flow, and within each IP or flow by count, so the database does the
+    sorting and no report is ever held in memory.  Reports are written line by
+    line into buffered ReportSinks.
+
+    With more than one worker, the IP and tcp flow reports are split into ranges
+    of IPs and flow file names that are rendered by a pool of worker processes,
+    each querying the database over its own read only connection.
+
+    When skip_existing is set, reports that already exist in the output
+    directory are not written again, so an interrupted run can be resumed.
+
     Arguments:
         config - copy of the config object
         db_controller - instance of DatabaseController for database manipulation
         outdir - path to tff output directory
-        tcpflows - path to tcp flows
+        workers - number of processes used to render reports
 
     '''
 
-    def __init__(self, config, db_controller, outdir, tcpflows):
+    def __init__(self, config, db_controller, outdir, workers=1):
         self.config = config
         self.db_controller = db_controller
         self.outdir = outdir
-        self.tcpflows = tcpflows
-        self.report_header = "# TcpFeatureFinder v1.0\n"  
+        self.workers = workers
+        self.skip_existing = False
+        self.report_header = "# TcpFeatureFinder v1.0\n"
 
     def generate_reports(self):
         '''
@@ -31,33 +163,177 @@ class ReportBuilder:
 
         '''
 
-        self.ips = self.db_controller.get_all_ips()
         reports = get_list_from_config(self.config, 'reports', 'reports')
 
         if 'feature_type_hist' in reports:
             self.gen_feature_type_hist()
+
+        if 'ip_report' in reports:
+            if not os.path.exists(os.path.join(self.outdir, 'ip_reports')):
+                os.makedirs(os.path.join(self.outdir, 'ip_reports'))
+
+            if self.workers <= 1:
+                self.gen_ip_reports()
+            else:
+                self.__map(_gen_ip_reports, self.split_ranges(self.db_controller.get_all_ips()))
+
         if 'ip_hist' in reports:
             self.gen_ip_hist()
-        if 'ip_report' in reports:
-            for ip in self.ips:
-                self.gen_ip_report(ip)
+
         if 'tcpflow_report' in reports:
-            for tcpflow in self.tcpflows:
-                if self.db_controller.get_feature_count_by_flow(tcpflow.filename) > 0:
-                    self.gen_tcpflow_report(tcpflow)
+            if not os.path.exists(os.path.join(self.outdir, 'tcpflow_reports')):
+                os.makedirs(os.path.join(self.outdir, 'tcpflow_reports'))
+
+            if self.workers <= 1:
+                self.gen_tcpflow_reports()
+            else:
+                ranges = self.split_ranges(self.db_controller.get_flows_with_features())
+                self.__map(_gen_tcpflow_reports, ranges)
+
+    def gen_ip_reports(self, start_ip=None, end_ip=None):
+        '''
+        Builds the report for every IP in a range of IPs.
+
+        Arguments:
+            start_ip - if given, only report on IPs greater than or equal to start_ip
+            end_ip - if given, only report on IPs less than end_ip
+
+        '''
+
+        for ip, stats in self.iter_ip_stats(start_ip, end_ip):
+            self.gen_ip_report(ip, stats)
+
+    def gen_tcpflow_reports(self, start_flow=None, end_flow=None):
+        '''
+        Builds the report for every tcp flow with features in a range of flow
+        file names.
+
+        Arguments:
+            start_flow - if given, only report on flows from start_flow onwards
+            end_flow - if given, only report on flows before end_flow
+
+        '''
+
+        for flow_fn, stats in self.iter_flow_stats(start_flow, end_flow):
+            self.gen_tcpflow_report(flow_fn, stats)
+
+    def split_ranges(self, keys):
+        '''
+        Split keys into contiguous ranges, several per worker so that uneven
+        ranges balance out.
+
+        Arguments:
+            keys - list of IPs or tcp flow file names
+
+        Returns:
+            list of (start, end) tuples, where end is exclusive and is None for
+                the last range
+
+        '''
+
+        keys = sorted(set(keys))
+        step = max(1, -(-len(keys) // (self.workers * 4)))
+        starts = keys[::step]
+
+        return list(zip(starts, starts[1:] + [None]))
+
+    def __map(self, func, tasks):
+        '''
+        Run func over tasks on a pool of report worker processes.
+
+        '''
+
+        pool = multiprocessing.Pool(self.workers, _init_report_worker,
+                    (self.db_controller.db_path, self.db_controller.pragmas, self.outdir,
+                     self.skip_existing))
+
+        try:
+            results = pool.map(func, tasks, chunksize=1)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return results
+
+    def iter_ip_stats(self, start_ip=None, end_ip=None):
+        '''
+        Yields an IpFeatureStats for each IP involved in a flow with features.
+
+        The histograms of an IpFeatureStats can only be read until the next one
+        is yielded.
+
+        Arguments:
+            start_ip - if given, only IPs greater than or equal to start_ip
+            end_ip - if given, only IPs less than end_ip
+
+        Returns:
+            generator of (ip, IpFeatureStats) tuples
+
+        '''
+
+        db = self.db_controller
+        histograms = [
+            RowGroups(db.get_ip_feature_histograms(start_ip, end_ip)),
+            RowGroups(db.get_ip_feature_histograms(start_ip, end_ip, 'src')),
+            RowGroups(db.get_ip_feature_histograms(start_ip, end_ip, 'dest')),
+            RowGroups(db.get_paired_ip_histograms(start_ip, end_ip)),
+        ]
+
+        for (ip, unique_features, features, feature_types) in \
+                db.get_ip_summaries(start_ip, end_ip):
+
+            yield (ip, IpFeatureStats(unique_features, features, feature_types,
+                        *[groups.take(ip) for groups in histograms]))
+
+            for groups in histograms:
+                groups.skip(ip)
+
+    def iter_flow_stats(self, start_flow=None, end_flow=None):
+        '''
+        Yields a FlowFeatureStats for each tcp flow with features.
+
+        The feature types and histogram of a FlowFeatureStats can only be read
+        until the next one is yielded.
+
+        Arguments:
+            start_flow - if given, only flows from start_flow onwards
+            end_flow - if given, only flows before end_flow
+
+        Returns:
+            generator of ('tcp flow file name', FlowFeatureStats) tuples
+
+        '''
+
+        db = self.db_controller
+        feature_types = RowGroups(db.get_flow_feature_types(start_flow, end_flow))
+        features = RowGroups(db.get_flow_feature_histograms(start_flow, end_flow))
 
+        for (flow_fn, src_ip, dest_ip, features_found, feature_type_count) in \
+                db.get_flow_summaries(start_flow, end_flow):
+
+            yield (flow_fn, FlowFeatureStats(src_ip, dest_ip, features_found,
+                        feature_type_count,
+                        (feature_type for (feature_type,) in feature_types.take(flow_fn)),
+                        features.take(flow_fn)))
+
+            feature_types.skip(flow_fn)
+            features.skip(flow_fn)
 
     def gen_feature_type_hist(self):
+        if self.report_exists('featuretype_histogram.txt'):
+            return
+
         feature_type_list = self.db_controller.count_feature_type()
-        report = self.report_header
-        report += "# Feature Type Histogram\n\n"
 
-        rank = 0
-        for (count, feature_type) in feature_type_list:
-            rank += 1
-            report += "{}.\t{}\t{}".format(rank, feature_type, count)
+        with self.open_report('featuretype_histogram.txt') as report:
+            report.write(self.report_header)
+            report.write("# Feature Type Histogram\n\n")
 
-        self.save_report('featuretype_histogram.txt', report)
+            rank = 0
+            for (count, feature_type) in feature_type_list:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, feature_type, count))
 
     def gen_ip_hist(self):
         '''
@@ -65,155 +341,143 @@ class ReportBuilder:
         it to the output folder.
 
         '''
-        report = self.report_header
-        report += "# IP Histogram of Found Features\n\n"
 
-        ip_list = self.db_controller.count_num_features_by_ip()
-        src_ip_list = ip_list[0]
-        dest_ip_list = ip_list[1]
+        if self.report_exists('ip_histogram.txt'):
+            return
 
-        total_list = {}
-
-        for (count, ip) in src_ip_list + dest_ip_list:
-            if ip not in total_list:
-                total_list[ip] = count
-            else:
-                total_list[ip] += count
+        with self.open_report('ip_histogram.txt') as report:
+            report.write(self.report_header)
+            report.write("# IP Histogram of Found Features\n\n")
 
-        sorted_ips = sorted(total_list.items(), key=operator.itemgetter(1), reverse=True)
+            rank = 0
+            for (ip, count) in self.db_controller.get_ip_totals():
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, ip, count))
 
-        rank = 0
-        for (ip, count) in sorted_ips:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, ip, count)
-        
-        self.save_report('ip_histogram.txt', report)
-
-    def gen_ip_report(self, ip):
+    def gen_ip_report(self, ip, stats):
         '''
         Builds a report for each individual IP address that has at least one
         associated feature.
 
+        Arguments:
+            ip - IP address string
+            stats - IpFeatureStats for the IP
+
         '''
 
         if not os.path.exists(os.path.join(self.outdir, 'ip_reports')):
             os.makedirs(os.path.join(self.outdir, 'ip_reports'))
 
-        paired_ips = self.db_controller.get_paired_ips(ip)
-        sorted_paired_ips = sorted(
-            paired_ips.items(), key=operator.itemgetter(1), reverse=True)
-
-        src_features, dest_features = self.db_controller.get_features_by_ip(ip)
-        src_ft, dest_ft = self.db_controller.get_feature_types_by_ip(ip)
-        features = src_features + dest_features
+        filename = os.path.join('ip_reports', ip + '_report.txt')
 
-        feature_counts = {}
-        src_feature_counts = {}
-        dest_feature_counts = {}
+        if self.report_exists(filename):
+            return
 
-        for feature in set(features):
-            feature_counts[feature] = features.count(feature)
+        with self.open_report(filename) as report:
+            report.write(self.report_header)
+            report.write("# {} Feature Report\n\n".format(ip))
 
-        for feature in set(src_features):
-            src_feature_counts[feature] = src_features.count(feature)
+            report.write("Unique Features Found: {}\n".format(stats.unique_features))
+            report.write("Features Found: {}\n".format(stats.features))
+            report.write("Feature Types Found: {}\n\n".format(stats.feature_types))
 
-        for feature in set(dest_features):
-            dest_feature_counts[feature] = dest_features.count(feature)
+            report.write("All Found Features Histogram\n")
+            report.write("Rank\tFeature\tCount\n")
 
-        sorted_features = sorted(
-            feature_counts.items(), key=operator.itemgetter(1), reverse=True)
-        src_sorted_features = sorted(
-            src_feature_counts.items(), key=operator.itemgetter(1), reverse=True)
-        dest_sorted_features = sorted(
-            dest_feature_counts.items(), key=operator.itemgetter(1), reverse=True)
+            rank = 0
+            for (feature, count) in stats.all_features:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, feature, count))
 
-        report = self.report_header
-        report += "# {} Feature Report\n\n".format(ip)
+            report.write("\n")
+            report.write("Src Found Features Histogram\n")
+            report.write("Rank\tFeature\tCount\n")
 
-        report += "Unique Features Found: {}\n".format(len(set(features)))
-        report += "Features Found: {}\n".format(len(src_features) + len(dest_features))
-        report += "Feature Types Found: {}\n\n".format(len(src_ft) + len(dest_ft))
+            rank = 0
+            for (feature, count) in stats.src_features:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, feature, count))
 
-        report += "All Found Features Histogram\n"
-        report += "Rank\tFeature\tCount\n"
+            report.write("\n")
+            report.write("Dest Found Features Histogram\n")
+            report.write("Rank\tFeature\tCount\n")
 
-        rank = 0
-        for (feature, count) in sorted_features:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, feature, count)
+            rank = 0
+            for (feature, count) in stats.dest_features:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, feature, count))
 
-        report += "\n"
-        report += "Src Found Features Histogram\n"
-        report += "Rank\tFeature\tCount\n"
- 
-        rank = 0
-        for (feature, count) in src_sorted_features:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, feature, count)
+            report.write("\n")
+            report.write("IP interaction histogram by number of features found\n")
+            report.write("Rank\tIP\tCount\n")
 
-        report += "\n"
-        report += "Dest Found Features Histogram\n"
-        report += "Rank\tFeature\tCount\n"
+            rank = 0
+            for (paired_ip, count) in stats.paired_ips:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, paired_ip, count))
 
-        rank = 0
-        for (feature, count) in dest_sorted_features:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, feature, count)
-
-        report += "\n"
-        report += "IP interaction histogram by number of features found\n"
-        report += "Rank\tIP\tCount\n"
-
-        rank = 0
-        for (paired_ip, count) in sorted_paired_ips:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, paired_ip, count)
-
-        self.save_report(os.path.join('ip_reports', ip + '_report.txt'), report)
-
-    def gen_tcpflow_report(self, tcpflow):
+    def gen_tcpflow_report(self, flow_fn, stats):
         '''
         Builds a report for each tcp flow with associated features and writes it
         to the output directory.
 
+        Arguments:
+            flow_fn - file name of the tcp flow
+            stats - FlowFeatureStats for the tcp flow
+
         '''
 
         if not os.path.exists(os.path.join(self.outdir, 'tcpflow_reports')):
             os.makedirs(os.path.join(self.outdir, 'tcpflow_reports'))
 
-        feature_types = self.db_controller.get_feature_types_by_flow(tcpflow.filename)
-        features = self.db_controller.get_features_by_flow(tcpflow.filename)
+        filename = os.path.join('tcpflow_reports', flow_fn + '_report.txt')
 
-        features_count = {}
-        for feature in features:
-            if feature[0] not in features_count:
-                features_count[feature[0]] = 1
-            else:
-                features_count[feature[0]] += 1
+        if self.report_exists(filename):
+            return
 
-        sorted_feature_count = sorted(
-            features_count.items(), key=operator.itemgetter(1), reverse=True)
+        with self.open_report(filename) as report:
+            report.write(self.report_header)
+            report.write("# {} TcpFlow Report\n\n".format(flow_fn))
 
-        report = self.report_header
-        report += "# {} TcpFlow Report\n\n".format(tcpflow.filename)
+            report.write("Source: {}\n".format(stats.source_ip))
+            report.write("Destination: {}\n".format(stats.dest_ip))
+            report.write("Total Features Found: {}\n".format(stats.features_found))
+            report.write("Total Feature Types Found: {}\n\n".format(stats.feature_type_count))
 
-        report += "Source: {}\n".format(tcpflow.source_ip)
-        report += "Destination: {}\n".format(tcpflow.dest_ip)
-        report += "Total Features Found: {}\n".format(len(features))
-        report += "Total Feature Types Found: {}\n\n".format(len(feature_types))
+            report.write("Feature Types Found\n")
+            for feature_type in stats.feature_types:
+                report.write("{}\n".format(feature_type))
 
-        report += "Feature Types Found\n"
-        for feature_type in feature_types:
-            report += "{}\n".format(feature_type[0])
+            report.write("\n")
+            report.write("Features Found\n")
+            rank = 0
+            for (feature, count) in stats.features:
+                rank += 1
+                report.write("{}.\t{}\t{}\n".format(rank, feature, count))
 
-        report += "\n"
-        report += "Features Found\n"
-        rank = 0
-        for (feature, count) in sorted_feature_count:
-            rank += 1
-            report += "{}.\t{}\t{}\n".format(rank, feature, count)
-        
-        self.save_report(os.path.join('tcpflow_reports', tcpflow.filename + '_report.txt'), report)
+    def open_report(self, filename):
+        '''
+        Open a ReportSink for a report with the given filename in the output
+        directory.
+
+        Arguments:
+            filename - String name of file
+
+        Returns:
+            ReportSink to be used as a context manager
+
+        '''
+
+        return ReportSink(os.path.join(self.outdir, filename))
+
+    def report_exists(self, filename):
+        '''
+        Returns whether a report can be skipped because skip_existing is set and
+        it already exists in the output directory.
+
+        '''
+
+        return self.skip_existing and os.path.exists(os.path.join(self.outdir, filename))
 
     def save_report(self, filename, report):
         '''
@@ -224,9 +488,23 @@ class ReportBuilder:
             report - report string to save into file
 
         '''
-            
-        path = os.path.join(self.outdir, filename)
-        with open(path, 'w') as f:
-            f.write(report)
 
+        with self.open_report(filename) as sink:
+            sink.write(report)
+
+def _init_report_worker(db_path, pragmas, outdir, skip_existing=False):
+    '''
+    Give a report worker process its own read only database connection.
+
+    '''
+
+    global _worker_report_builder
+    db_controller = DatabaseController(db_path, pragmas=pragmas, read_only=True)
+    _worker_report_builder = ReportBuilder(None, db_controller, outdir)
+    _worker_report_builder.skip_existing = skip_existing
+
+def _gen_ip_reports(task):
+    return _worker_report_builder.gen_ip_reports(*task)
 
+def _gen_tcpflow_reports(task):
+    _worker_report_builder.gen_tcpflow_reports(*task)
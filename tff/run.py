@@ -1,15 +1,29 @@
 import argparse
+import collections
 import configparser
+import cProfile
+import functools
+import hashlib
 import os
+import pstats
 import shutil
 import sys
 
 
 from yapsy.PluginManager import PluginManager
 
-from .tcp_flow import TcpFlow
-from .database_builder import DatabaseController, TcpFlowDb
+from .tcp_flow import FlowCatalog, count_tcp_flows, iter_tcp_flows
+from .pcap import iter_pcap_flows
+from .export import FlowExporter
+from .cache import FeatureCache, hash_file
+from .scanner import FeatureScanner, scan_flows
+from .matcher import TOKEN_DELIMITERS
+from .patterns import endpoint_indicator, feature_key, pattern_name
+from .endpoints import Endpoint
+from .database_builder import DatabaseController
 from .report_builder import ReportBuilder
+from .run_stats import RunStats
+from .progress import Progress
 from .helpers import get_list_from_config
 
 class Driver:
@@ -23,14 +37,49 @@ class Driver:
     Driver provides methods for constructing tcpflow objects based for files, as
     well as executes the plugins against each tcp flow object.
 
+    In incremental mode the existing output database is reused.  Only new or
+    changed flows are scanned for every feature, while flows that were already
+    scanned are only scanned for features added since the last run.
+
+    Instead of a tcpflow output directory, a pcap or pcapng capture can be given.
+    Its TCP flows are reassembled in memory and scanned as soon as each one is
+    complete, and only flows with features are written to disk.
+
+    The time spent in each phase of a run, per plugin where possible, is recorded
+    in stats and written to run_stats.json in the output directory.
+
+    Each tcp flow is recorded in the output database along with a hash of the
+    feature sets it was scanned with once it has been completely scanned, in the
+    same transaction as its features.  A resumed run reuses the database like an
+    incremental run, so flows already scanned with the current feature sets are
+    skipped, and keeps reports and copied flows written before it was interrupted
+    as long as the database has not changed since.
+
     '''
 
-    def __init__(self, db_path, ff_dir, tcpout_dir, output_dir):
+    def __init__(self, db_path, ff_dir, tcpout_dir, output_dir, workers=1,
+            report_workers=None, incremental=False, pcap_path=None, resume=False,
+            export_mode='copy'):
 
+        self.stats = RunStats()
         self.output_dir = os.path.abspath(output_dir)
         self.db_path = os.path.join(self.output_dir, db_path)
         self.ff_dir = os.path.abspath(ff_dir)
         self.tcpout_dir = os.path.abspath(tcpout_dir)
+        self.workers = workers
+        self.report_workers = workers if report_workers is None else report_workers
+        self.incremental = incremental
+        self.resume = resume
+        self.pcap_path = pcap_path and os.path.abspath(pcap_path)
+        self.unchanged_flows = FlowCatalog()
+        self.scan_hash = None
+        self.changed = False
+
+        if self.pcap_path and self.incremental:
+            raise ValueError("Incremental runs are not supported when reading a pcap.")
+
+        if self.pcap_path and self.resume:
+            raise ValueError("Resumed runs are not supported when reading a pcap.")
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
@@ -46,36 +95,162 @@ class Driver:
         self.plugin_manager.setPluginPlaces(["plugins"])
         self.plugin_manager.collectPlugins()
 
-        self.db_controller = DatabaseController(self.db_path)
+        self.db_controller = self.build_db_controller()
         self.plugins = self.get_active_plugins()
-        self.tcp_flows = self.build_tcp_flows()
-        self.report_builder = ReportBuilder(self.config, self.db_controller, self.output_dir, self.tcp_flows)
+        self.engine = self.config.get('scan', 'engine', fallback='aho_corasick')
+        self.scan_mode = self.config.get('scan', 'mode', fallback='combined')
+        self.read_mode = self.config.get('scan', 'read_mode', fallback='mmap')
+        self.recursive = self.config.getboolean('scan', 'recursive', fallback=False)
+        self.context_bytes = self.config.getint('scan', 'context_bytes', fallback=0)
+        self.store_context = self.config.getboolean('scan', 'store_context', fallback=False)
+        self.token_delimiters = self.config.get('scan', 'token_delimiters',
+                                    fallback=TOKEN_DELIMITERS)
+        self.engines = self.get_plugin_engines()
+        self.endpoint_only = []
+        if self.config.has_option('endpoints', 'endpoint_only'):
+            self.endpoint_only = get_list_from_config(self.config, 'endpoints', 'endpoint_only')
+        self.payload_search = []
+        if self.config.has_option('endpoints', 'payload_search'):
+            self.payload_search = get_list_from_config(self.config, 'endpoints', 'payload_search')
+        self.progress = self.build_progress()
+        self.cache = self.build_cache()
+        self.exporter = FlowExporter(export_mode,
+                            self.config.getint('export', 'threads', fallback=4))
+
+        # the capture is only read once, so all plugins share one scanner
+        if self.pcap_path and self.scan_mode != 'combined':
+            print("[-] Scan mode '{}' ignored, pcaps are always scanned in combined mode".format(
+                    self.scan_mode))
+            self.scan_mode = 'combined'
+
+        self.report_builder = ReportBuilder(self.config, self.db_controller, self.output_dir,
+                                self.report_workers)
+
+
+    def build_db_controller(self):
+        '''
+        Creates the DatabaseController using the [database] section of config.ini.
 
+        Every option in the section other than batch_size is passed on as an
+        SQLite pragma.
 
-    def build_tcp_flows(self):
+        Returns:
+            DatabaseController object
         '''
-        Constructs TcpFlow objects for each tcp flow in tcp_out directory.
 
-        This method will parse the tcpflow output directory and build an
-        object per tcpflow file.  Additionally, each tcp flow will be committed
-        to the designated output database.
+        pragmas = {}
+        batch_size = 10000
 
+        if self.config.has_section('database'):
+            pragmas = dict(self.config.items('database'))
+            batch_size = int(pragmas.pop('batch_size', batch_size))
+
+        return DatabaseController(self.db_path, batch_size, pragmas,
+                    reuse=self.incremental or self.resume)
+
+    def build_progress(self):
+        '''
+        Creates the Progress reporter using the [progress] section of config.ini.
+
+        Returns:
+            Progress object
+        '''
+
+        status_path = None
+
+        if self.config.getboolean('progress', 'status_file', fallback=False):
+            status_path = os.path.join(self.output_dir, 'status.json')
+
+        return Progress(self.config.getboolean('progress', 'display', fallback=True),
+                    self.config.getfloat('progress', 'interval', fallback=1.0),
+                    status_path,
+                    self.config.getfloat('progress', 'status_interval', fallback=10.0))
+
+    def build_cache(self):
+        '''
+        Creates the FeatureCache using the [cache] section of config.ini.
+
+        Returns:
+            FeatureCache object, or None if caching is disabled or the cache
+                directory cannot be trusted
+        '''
+
+        if not self.config.getboolean('cache', 'enabled', fallback=True):
+            return None
+
+        try:
+            return FeatureCache(self.config.get('cache', 'directory', fallback=None),
+                        self.config.getint('cache', 'max_size', fallback=1 << 30))
+        except ValueError as e:
+            print('[-] Feature cache disabled: {}'.format(e))
+            return None
+
+    def discover_tcp_flows(self, keep_unchanged=False):
+        '''
+        Lazily constructs TcpFlow objects for each tcp flow in the tcp_out directory.
+
+        Flows are yielded as they are found, so scanning starts right away and
+        only a bounded number of flows is held in memory.  Subdirectories are
+        searched too if recursive is set in the [scan] section of config.ini.
+
+        When the database is reused, flows whose size and modification time match
+        those recorded in the database are not yielded.  Those that were already
+        scanned with the current feature sets are skipped altogether, the others
+        are kept in the unchanged_flows catalog if keep_unchanged is set, or
+        otherwise recorded as scanned.  Changed flows, and flows that no longer
+        exist, are removed from the database along with their features.
+
+        Arguments:
+            keep_unchanged - record the unchanged flows, for searching
+                them for newly added features
+
+        Returns:
+            generator of TcpFlow objects to scan for every feature
         '''
-        
-        tcp_flows = []
 
-        for direntry in os.scandir(self.tcpout_dir):
-            if 'report.xml' in direntry.name or not direntry.is_file():
+        fingerprints = {}
+
+        if self.incremental or self.resume:
+            fingerprints = self.db_controller.get_flow_fingerprints()
+
+        for tcp_flow in iter_tcp_flows(self.tcpout_dir, self.recursive):
+            fingerprint = fingerprints.pop(tcp_flow.filename, None)
+
+            if fingerprint is not None and fingerprint[:2] == (tcp_flow.size, tcp_flow.mtime):
+                if fingerprint[2] != self.scan_hash:
+                    if keep_unchanged:
+                        self.mark_changed()
+                        self.unchanged_flows.append(tcp_flow)
+                    else:
+                        self.db_controller.add_scanned_flow_to_batch(tcp_flow.filename,
+                            self.scan_hash)
+
+                self.progress.update(tcp_flow.size, skipped=True)
                 continue
 
-            tcp_flow = TcpFlow(direntry.path)
-            self.db_controller.add_tcp_flow_to_session(tcp_flow)
-            tcp_flows.append(tcp_flow)
+            self.mark_changed()
 
-        self.db_controller.commit_session()
+            if fingerprint is not None:
+                self.db_controller.delete_flows([tcp_flow.filename])
 
-        return tcp_flows
-        
+            yield tcp_flow
+
+        # whatever is left was recorded by an earlier run but has since been removed
+        if fingerprints:
+            self.mark_changed()
+            self.db_controller.delete_flows(fingerprints)
+
+    def mark_changed(self):
+        '''
+        Record that this run changes the found features, so reports written by an
+        earlier run can no longer be kept.  The state is cleared in the database
+        right away, so that it is still cleared if the run is interrupted.
+
+        '''
+
+        if not self.changed:
+            self.changed = True
+            self.db_controller.set_run_state('reports', None)
 
     def get_active_plugins(self):
         '''
@@ -95,55 +270,615 @@ class Driver:
 
         return active_plugins
 
-    def run(self):
+    def get_plugin_engines(self):
         '''
-        Runs Tcp Feature Finder.
-
-        First, each plugin will assemble its features, look for them in each tcp flow,
-        and filter any that are found.  It will then commit the found features to the
-        output database.  Then any custom plugin reports will be generated, then all
-        standard reports.  Finally, flows with features present will be moved into the
-        output folder along with generated reports.
+        Reads the matching engine of the active plugins that have one set in the
+        [plugin_engines] section of config.ini.
 
+        Returns:
+            dictionary of the form { feature_type : engine }
         '''
 
-        # for each plugin, build its features list and find them in each tcpflow
+        engines = {}
+
         for plugin in self.plugins:
-            plugin = plugin.plugin_object   
+            engine = self.config.get('plugin_engines', plugin.name, fallback=None)
+
+            if engine:
+                engines[plugin.plugin_object.feature_name] = engine
+
+        return engines
+
+    def match_mode(self, feature_type):
+        '''
+        Returns the read mode a feature type is scanned with, along with the
+        token delimiters if it is matched with the token engine.  Found
+        features are only kept between runs with the same match mode, as the
+        token engine only finds whole tokens.
+
+        '''
+
+        if self.engines.get(feature_type) == 'token':
+            return '{} token {}'.format(self.read_mode, self.token_delimiters)
+
+        return self.read_mode
+
+    def load_features(self, plugin):
+        '''
+        Has a plugin gather its features, or loads them from the cache if the
+        files the plugin reads them from have not changed since they were cached.
+
+        Duplicate and empty features are dropped.
+
+        Arguments:
+            plugin - plugin object
+        '''
+
+        sources = None
+
+        if self.cache is not None:
+            sources = plugin.feature_sources(self.ff_dir)
+
+        if sources is None:
             plugin.get_features(self.ff_dir)
+            return
 
-            # search for the features in each tcp flow using plugin gathered lists
-            # filter out the features based on plugin logic
+        key = self.cache.key('features', type(plugin).__module__, type(plugin).__name__,
+                    plugin.feature_name, *[hash_file(path) for path in sources])
+        features = self.cache.get(key)
 
-            feature_type = plugin.feature_name
+        if features is None:
+            plugin.get_features(self.ff_dir)
+            features = list(collections.OrderedDict.fromkeys(filter(None, plugin.features)))
+            self.cache.put(key, features)
 
-            for tcp_flow in self.tcp_flows:
-                tcp_flow.find_features(feature_type, plugin.features)
-                found_features = tcp_flow.get_found_features()[feature_type]
-                filtered_features = plugin.filter_features(tcp_flow.path, found_features)
+        plugin.features = features
 
-                for feature, locations in filtered_features.items():
-                    for location in locations:
-                        self.db_controller.add_feature_to_session(
-                            tcp_flow.filename, feature_type, feature, location)
+    def get_feature_sets(self):
+        '''
+        Gathers the features of each active plugin.  Plugins listed under
+        endpoint_only in the [endpoints] section of config.ini only keep their
+        Endpoints, so flows are not searched for their other features.  Plugins
+        listed under payload_search also have the data of each flow searched
+        for the text of their IP address Endpoints.
+
+        Returns:
+            ordered dictionary of the form { feature_type : [features] }
+        '''
 
-                self.db_controller.commit_session()
+        feature_sets = collections.OrderedDict()
+
+        for plugin in self.plugins:
+            features = plugin.plugin_object.features
+
+            if plugin.name in self.endpoint_only:
+                features = [feature for feature in features if isinstance(feature, Endpoint)]
+            elif plugin.name in self.payload_search:
+                addresses = [str(feature) for feature in features if isinstance(feature, Endpoint)
+                                and feature.kind == 'ip' and feature.first == feature.last]
+                features = list(collections.OrderedDict.fromkeys(features + addresses))
+
+            feature_sets[plugin.plugin_object.feature_name] = features
+
+        return feature_sets
+
+    def diff_feature_sets(self, feature_sets):
+        '''
+        Compares each feature set with the one recorded by the last run.
+
+        Found features that are no longer in a feature set are deleted from the
+        database.  If the read mode has changed, every found feature of the
+        feature type is deleted and the whole feature set counts as added.
+
+        Features of flows that have already been scanned with the current feature
+        sets, by an interrupted run, are kept.  Added features that an
+        interrupted run found in other flows are deleted, as those flows will be
+        scanned for them again.
+
+        Arguments:
+            feature_sets - ordered dictionary of the form { feature_type : [features] }
+
+        Returns:
+            ordered dictionary of the form { feature_type : [added features] },
+                holding only feature types with added features
+        '''
+
+        added_sets = collections.OrderedDict()
+
+        for feature_type, features in feature_sets.items():
+            feature_set = self.db_controller.get_feature_set(feature_type)
+
+            if feature_set is None:
+                scanned = set()
+            elif feature_set.ReadMode != self.match_mode(feature_type):
+                if self.db_controller.delete_features(feature_type, None, self.scan_hash):
+                    self.mark_changed()
+                scanned = set()
+            elif feature_set.Hash == hash_feature_set(features):
+                continue
+            else:
+                scanned = self.db_controller.get_scanned_features(feature_type)
+                removed = scanned.difference(feature_key(feature) for feature in features)
+
+                if removed and self.delete_features(feature_type, removed):
+                    self.mark_changed()
+
+            added = [feature for feature in features
+                        if feature and feature_key(feature) not in scanned]
+
+            if added:
+                added_sets[feature_type] = added
+
+                if self.delete_features(feature_type, map(feature_key, added), self.scan_hash):
+                    self.mark_changed()
+
+        return added_sets
+
+    def delete_features(self, feature_type, keys, keep_hash=None):
+        '''
+        Deletes the found features of a feature type, given as the keys
+        returned by tff.patterns.feature_key, so that patterns delete every hit
+        of the pattern and endpoints only their own hits.
+
+        Returns:
+            number of features deleted
+        '''
+
+        literals = []
+        patterns = []
+        endpoints = []
+
+        for key in keys:
+            name = pattern_name(key)
+            indicator = endpoint_indicator(key)
+
+            if name is not None:
+                patterns.append(name)
+            elif indicator is not None:
+                endpoints.append(indicator)
+            else:
+                literals.append(key)
+
+        return self.db_controller.delete_features(feature_type, literals, keep_hash, patterns,
+                    endpoints)
+
+    def build_scanners(self, feature_sets):
+        '''
+        Builds the FeatureScanners used to search the tcp flows.
+
+        In combined scan mode a single scanner searches for the features of every
+        active plugin, so each tcp flow is only read once.  In per_plugin mode
+        there is one scanner per plugin, and each flow is read once per plugin.
+
+        Arguments:
+            feature_sets - ordered dictionary of the form { feature_type : [features] }
+
+        Returns:
+            List of FeatureScanner objects
+        '''
+
+        if self.read_mode not in ('mmap', 'text'):
+            raise ValueError("Unknown read mode '{}'.  Choose mmap or text.".format(
+                                self.read_mode))
+
+        binary = self.read_mode == 'mmap'
+
+        if self.scan_mode == 'combined':
+            return [FeatureScanner(feature_sets, self.engine, binary, self.cache,
+                        self.context_bytes, self.engines, self.token_delimiters)]
+
+        if self.scan_mode == 'per_plugin':
+            return [FeatureScanner({feature_type: features}, self.engine, binary, self.cache,
+                        self.context_bytes, self.engines, self.token_delimiters)
+                        for feature_type, features in feature_sets.items()]
+
+        raise ValueError("Unknown scan mode '{}'.  Choose combined or per_plugin.".format(
+                            self.scan_mode))
+
+    def iter_pcap_flows(self):
+        '''
+        Reassembles the TCP flows of the pcap, using the [pcap] section of
+        config.ini for the reassembly memory limits.
+
+        Returns:
+            generator of MemoryTcpFlow objects
+        '''
+
+        limits = {}
+
+        if self.config.has_section('pcap'):
+            for option in ('max_buffered_bytes', 'max_open_flows'):
+                if self.config.has_option('pcap', option):
+                    limits[option] = self.config.getint('pcap', option)
+
+            if self.config.has_option('pcap', 'linger'):
+                limits['linger'] = self.config.getfloat('pcap', 'linger')
+
+        return iter_pcap_flows(self.pcap_path, **limits)
+
+    def scan_tcp_flows(self, feature_sets, tcp_flows, label='scan', total=None, recorded=False,
+            count=None):
+        '''
+        Searches tcp flows for features, filters the found features with the
+        plugin that supplied them and adds them to the database batch.
+
+        tcp_flows is only iterated once.  When there is more than one scanner,
+        the flows are kept in a FlowCatalog so the later scanners can reopen them.
+        Each flow is recorded as scanned once the last scanner is done with it.
+
+        Arguments:
+            feature_sets - ordered dictionary of the form { feature_type : [features] }
+            tcp_flows - iterable of TcpFlow objects to search
+            label - name of the scan shown in progress reports
+            total - (number of flows, combined size) tuple of tcp_flows, if
+                known, for progress reports
+            recorded - the flows are already in the database, so only their
+                scan hash is updated
+            count - function returning the total, counted in the background
+                while the first scanner runs, if total is not known
+        '''
+
+        if not feature_sets:
+            # still drain a discovery generator so its flows are recorded
+            for tcp_flow in tcp_flows:
+                self.record_scanned_flow(tcp_flow, recorded)
+            return
+
+        with self.stats.phase('build_scanners'):
+            scanners = self.build_scanners(feature_sets)
+        catalog = FlowCatalog()
+
+        for (index, scanner) in enumerate(scanners):
+            if index:
+                tcp_flows = catalog.iter_flows()
+                total = (len(catalog), catalog.total_size())
+
+            if len(scanners) > 1:
+                self.progress.start('{} {}/{}'.format(label, index + 1, len(scanners)),
+                    *(total or ()))
+            else:
+                self.progress.start(label, *(total or ()))
+
+            if total is None and count is not None:
+                self.progress.count_total(count)
+
+            # feature types whose features are searched for in the data of flows
+            read_types = [feature_type for (feature_types, tags, matcher) in scanner.groups
+                            for feature_type in feature_types]
+
+            for tcp_flow in scan_flows(scanner, tcp_flows, self.workers):
+                self.stats.count('scan', 'flows')
+                self.stats.count('scan', 'bytes', tcp_flow.size)
+
+                for feature_type in scanner.feature_types:
+                    self.stats.count('scan', 'flows', 1, feature_type)
+
+                for feature_type in read_types:
+                    self.stats.count('scan', 'bytes', tcp_flow.size, feature_type)
+
+                if tcp_flow.in_memory:
+                    count = self.save_memory_flow(scanner, tcp_flow)
+                else:
+                    count = self.save_found_features(scanner, tcp_flow)
+
+                if index == len(scanners) - 1:
+                    self.record_scanned_flow(tcp_flow, recorded)
+                elif not index:
+                    catalog.append(tcp_flow)
+
+                self.progress.update(tcp_flow.size, count)
+
+            self.progress.finish()
+
+    def record_scanned_flow(self, tcp_flow, recorded=False):
+        '''
+        Adds a completely scanned tcp flow to the database batch, or updates its
+        scan hash if it is already recorded.  Its features are always batched
+        first, so they are committed no later than the flow.
+
+        '''
+
+        if recorded:
+            self.db_controller.add_scanned_flow_to_batch(tcp_flow.filename, self.scan_hash)
+        else:
+            self.db_controller.add_tcp_flow_to_batch(tcp_flow, self.scan_hash)
+
+    def save_found_features(self, scanner, tcp_flow):
+        '''
+        Filters the features found in a scanned tcp flow with the plugin that
+        supplied them, and adds them to the database batch.
+
+        Returns:
+            number of features added
+        '''
+
+        count = 0
 
         for plugin in self.plugins:
             plugin = plugin.plugin_object
-            plugin_report = plugin.generate_report(self.db_controller)
+            feature_type = plugin.feature_name
+
+            if feature_type not in scanner.feature_types:
+                continue
+
+            found_features = tcp_flow.get_found_features()[feature_type]
 
-            if plugin_report is not None:
-                self.report_builder.save_report(plugin.feature_type + '_report.txt', plugin_report)
+            if any(isinstance(feature, Endpoint) for feature in found_features):
+                count += self.save_endpoint_hits(tcp_flow, feature_type, found_features)
+                found_features = {feature: locations
+                                    for (feature, locations) in found_features.items()
+                                    if not isinstance(feature, Endpoint)}
 
-        self.report_builder.generate_reports()
+            # nothing to filter, so spare the plugin from opening the flow
+            if not found_features:
+                continue
+
+            hits = sum(len(locations) for locations in found_features.values())
+            kept = 0
+            self.stats.count('scan', 'hits', hits)
+            self.stats.count('scan', 'hits', hits, feature_type)
+
+            with self.stats.phase('filter_features', feature_type) as stats:
+                filtered_features = plugin.filter_features(tcp_flow.path, found_features)
+
+            for feature, locations in filtered_features.items():
+                pattern = getattr(feature, 'pattern', None)
+
+                for location in locations:
+                    context = getattr(location, 'context', None) if self.store_context else None
+                    self.db_controller.add_feature_to_batch(
+                        tcp_flow.filename, feature_type, str(feature), location, context,
+                        pattern.name if pattern is not None else None)
+                    kept += 1
+
+            stats['hits'] = stats.get('hits', 0) + hits
+            stats['kept'] = stats.get('kept', 0) + kept
+            count += kept
+
+        tcp_flow.clear_found_features()
+
+        return count
+
+    def save_endpoint_hits(self, tcp_flow, feature_type, found_features):
+        '''
+        Adds the hits of Endpoints among the found features of a feature type
+        to the database batch.  They are not filtered by the plugin, as they
+        were found in the name of the flow rather than in its data.
+
+        Returns:
+            number of hits added
+        '''
+
+        count = 0
+
+        for (feature, fields) in found_features.items():
+            if not isinstance(feature, Endpoint):
+                continue
+
+            for field in fields:
+                self.db_controller.add_feature_to_batch(
+                    tcp_flow.filename, feature_type, str(feature), field)
+                count += 1
+
+        self.stats.count('scan', 'endpoint_hits', count)
+        self.stats.count('scan', 'endpoint_hits', count, feature_type)
+
+        return count
+
+    def save_memory_flow(self, scanner, tcp_flow):
+        '''
+        Adds the features of a scanned in memory tcp flow to the database batch.
+
+        Flows with found features are written to the tcpflows output directory
+        before they are filtered, so plugins can read them like any other flow.
+        The file is removed again if the plugins filter out every feature.
+
+        Returns:
+            number of features added
+        '''
+
+        found = any(tcp_flow.get_found_features().values())
+
+        if found:
+            tcp_flow.save(self.tcpflow_outdir)
+
+        count = self.save_found_features(scanner, tcp_flow)
+
+        if not count and found:
+            os.remove(tcp_flow.path)
+            tcp_flow.path = None
+
+        return count
+
+    def run(self):
+        '''
+        Runs Tcp Feature Finder.
 
-        for tcpflow in self.tcp_flows:
-            if self.db_controller.get_feature_count_by_flow(tcpflow.filename) > 0:
-                shutil.copyfile(tcpflow.path, os.path.join(self.tcpflow_outdir, tcpflow.filename))
+        First, each plugin will assemble its features, which are looked for in each
+        tcp flow, and each plugin filters any of its features that are found.  The
+        found features are then bulk inserted into the output database.  Then any
+        custom plugin reports will be generated, then all standard reports.
+        Finally, flows with features present will be exported into the output
+        folder along with generated reports.
+
+        '''
+
+        with self.stats.phase('get_features'):
+            for plugin in self.plugins:
+                plugin = plugin.plugin_object
+
+                with self.stats.phase('get_features', plugin.feature_name):
+                    self.load_features(plugin)
+
+            feature_sets = self.get_feature_sets()
+
+        for feature_type, features in feature_sets.items():
+            self.stats.count('get_features', 'features', len(features), feature_type)
+
+        self.scan_hash = hash_scan(feature_sets, self.read_mode,
+                            {feature_type: self.match_mode(feature_type)
+                                for feature_type in feature_sets})
+
+        # only a resumed run may keep the output of an earlier run
+        if not self.resume:
+            self.mark_changed()
+
+        with self.stats.phase('diff_feature_sets'):
+            if self.incremental or self.resume:
+                # features of flows an interrupted run never finished
+                if self.db_controller.delete_orphan_features():
+                    self.mark_changed()
+
+            added_sets = self.diff_feature_sets(feature_sets)
+
+        # search for the features in each tcp flow using plugin gathered lists
+        # filter out the features based on plugin logic
+        with self.stats.phase('scan'):
+            if self.pcap_path:
+                self.scan_tcp_flows(feature_sets, self.iter_pcap_flows())
+            else:
+                count = None
+
+                # counting the flows walks the whole directory, so the scan
+                # does not wait for it
+                if self.progress.display or self.progress.status_path:
+                    count = functools.partial(count_tcp_flows, self.tcpout_dir, self.recursive)
+
+                self.scan_tcp_flows(feature_sets, self.discover_tcp_flows(bool(added_sets)),
+                    'scan', count=count)
+                if len(self.unchanged_flows):
+                    self.scan_tcp_flows(added_sets, self.unchanged_flows.iter_flows(),
+                        'scan for added features', (len(self.unchanged_flows),
+                        self.unchanged_flows.total_size()), True)
+
+            self.db_controller.flush_batches()
+
+        with self.stats.phase('save_feature_sets'):
+            for feature_type, features in feature_sets.items():
+                self.db_controller.save_feature_set(feature_type, hash_feature_set(features),
+                    self.match_mode(feature_type), {feature_key(feature) for feature in features if feature})
+
+        self.stats.add('database_insert', self.db_controller.insert_time,
+            self.db_controller.insert_cpu, rows=sum(self.db_controller.rows_inserted.values()),
+            **self.db_controller.rows_inserted)
+
+        for feature_type, rows in self.db_controller.feature_rows_inserted.items():
+            self.stats.count('database_insert', 'rows', rows, feature_type)
+
+        with self.stats.phase('create_indexes'):
+            self.db_controller.create_indexes()
+
+        # reports and copied flows of a run that was interrupted after the
+        # database was last changed are complete, so they are kept
+        reports_state = self.db_controller.get_run_state('reports')
+
+        if reports_state is None and (self.incremental or self.resume):
+            with self.stats.phase('remove_stale_output'):
+                self.remove_stale_output()
+
+        self.db_controller.set_run_state('reports', 'started')
+        self.report_builder.skip_existing = reports_state is not None
+
+        with self.stats.phase('plugin_reports'):
+            for plugin in self.plugins:
+                plugin = plugin.plugin_object
+                filename = plugin.feature_name + '_report.txt'
+
+                if self.report_builder.report_exists(filename):
+                    continue
+
+                with self.stats.phase('report', plugin.feature_name), \
+                        self.report_builder.open_report(filename) as report:
+                    plugin.write_report(self.db_controller, report)
+
+        with self.stats.phase('reports'):
+            self.report_builder.generate_reports()
+
+        with self.stats.phase('export_flows') as stats:
+            flows = []
+
+            for (flow_fn, flow_path) in self.db_controller.get_flow_paths_with_features():
+                out_path = os.path.join(self.tcpflow_outdir, flow_fn)
+
+                # flows reassembled from a pcap were already written out
+                if os.path.abspath(flow_path) != os.path.abspath(out_path):
+                    flows.append((flow_path, out_path))
+
+            stats['flows'] = len(flows)
+            stats.update(self.exporter.export_flows(flows))
+
+        self.db_controller.set_run_state('reports', 'done')
+
+        if self.cache is not None:
+            self.stats.count('cache', 'hits', self.cache.hits)
+            self.stats.count('cache', 'misses', self.cache.misses)
+
+        self.stats.save(os.path.join(self.output_dir, 'run_stats.json'))
+        self.progress.close()
+
+    def remove_stale_output(self):
+        '''
+        Removes output left by an earlier run that may no longer be accurate.
+
+        The IP and tcp flow reports are removed, as they are regenerated from the
+        database, as are copied flows that no longer contain any features.
+
+        '''
+
+        for report_dir in ('ip_reports', 'tcpflow_reports'):
+            report_dir = os.path.join(self.output_dir, report_dir)
+
+            if os.path.exists(report_dir):
+                shutil.rmtree(report_dir)
+
+        flows_with_features = set(self.db_controller.get_flows_with_features())
+
+        for direntry in os.scandir(self.tcpflow_outdir):
+            if direntry.name not in flows_with_features:
+                os.remove(direntry.path)
+
+def hash_scan(feature_sets, read_mode, match_modes=None):
+    '''
+    Returns a hash identifying the feature sets of every feature type and the
+    read mode a tcp flow was scanned with.
+
+    Arguments:
+        match_modes - optional dictionary of the form { feature_type : mode },
+            see Driver.match_mode.  Feature types matched in the read mode
+            itself hash as if it was not given.
+
+    '''
+
+    digest = hashlib.sha1(read_mode.encode('utf-8'))
+
+    for feature_type in sorted(feature_sets):
+        line = '\n{}\t{}'.format(feature_type, hash_feature_set(feature_sets[feature_type]))
+        match_mode = (match_modes or {}).get(feature_type, read_mode)
+
+        if match_mode != read_mode:
+            line += '\t' + match_mode
+
+        digest.update(line.encode('utf-8', 'surrogateescape'))
+
+    return digest.hexdigest()
+
+def hash_feature_set(features):
+    '''
+    Returns a hash identifying a set of features, independent of their order.
+
+    '''
+
+    digest = hashlib.sha1()
+
+    for key in sorted({feature_key(feature) for feature in features if feature}):
+        digest.update(key.encode('utf-8', 'surrogateescape'))
+        digest.update(b'\n')
+
+    return digest.hexdigest()
 
 def main(db_path='../tff.db', ff_dir='../features', tcpout_dir='../tcpflow_out',
-        output_dir='../tff_out'):
+        output_dir='../tff_out', workers=1, report_workers=None, incremental=False,
+        pcap_path=None, profile=False, resume=False, export_mode='copy'):
 
     '''
     Main function to execute tff
@@ -153,10 +888,34 @@ def main(db_path='../tff.db', ff_dir='../features', tcpout_dir='../tcpflow_out',
         ff_dir - path to feature file base directory
         tcpout_dir - path to output folder for tcpflow
         output_dir - path to direcory in which to store tff output data
+        workers - number of processes used to scan tcp flows
+        report_workers - number of processes used to render reports, defaults
+            to workers
+        incremental - reuse the database at db_path and only scan what changed
+            since the last run
+        pcap_path - path to a pcap or pcapng file to read flows from instead of
+            tcpout_dir
+        profile - run under cProfile, and save the profile to tff.prof and a
+            summary to profile.txt in output_dir
+        resume - reuse the database at db_path and continue an interrupted run,
+            keeping the reports and copied flows it already wrote
+        export_mode - how flows with features are exported to output_dir, see
+            tff.export.EXPORT_MODES
         
     '''
 
-    driver = Driver(db_path, ff_dir, tcpout_dir, output_dir)
-    driver.run()
+    driver = Driver(db_path, ff_dir, tcpout_dir, output_dir, workers, report_workers,
+                incremental, pcap_path, resume, export_mode)
+
+    if not profile:
+        driver.run()
+        return
+
+    profiler = cProfile.Profile()
+    profiler.runcall(driver.run)
+    profiler.dump_stats(os.path.join(driver.output_dir, 'tff.prof'))
+
+    with open(os.path.join(driver.output_dir, 'profile.txt'), 'w') as f:
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(50)
 
 
@@ -0,0 +1,123 @@
+import collections
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+
+# counters that are also reported per second of wall time
+RATES = ('flows', 'bytes', 'hits', 'rows')
+
+class RunStats:
+    '''
+    Records where the time of a run goes.
+
+    Time is recorded per named phase, and optionally per plugin, as wall time and
+    CPU time of the main process.  Scanning done by worker processes therefore
+    shows up as wall time only.  Phases may nest, in which case the time of the
+    inner phase is also counted in the outer one.  Counters such as the number
+    of flows or bytes scanned can be added to any phase.
+
+    '''
+
+    def __init__(self):
+        self.started = datetime.datetime.now()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.phases = collections.OrderedDict()
+        self.plugins = collections.OrderedDict()
+
+    def entry(self, name, plugin=None):
+        '''
+        Returns the dictionary of timings and counters of a phase.
+
+        '''
+
+        if plugin is None:
+            phases = self.phases
+        else:
+            phases = self.plugins.setdefault(plugin, collections.OrderedDict())
+
+        if name not in phases:
+            phases[name] = collections.OrderedDict([('wall', 0.0), ('cpu', 0.0), ('calls', 0)])
+
+        return phases[name]
+
+    @contextlib.contextmanager
+    def phase(self, name, plugin=None):
+        '''
+        Context manager timing a phase, optionally of a single plugin.
+
+        '''
+
+        entry = self.entry(name, plugin)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield entry
+        finally:
+            entry['wall'] += time.perf_counter() - wall
+            entry['cpu'] += time.process_time() - cpu
+            entry['calls'] += 1
+
+    def add(self, name, wall, cpu, plugin=None, **counters):
+        '''
+        Add time measured elsewhere, and any counters, to a phase.
+
+        '''
+
+        entry = self.entry(name, plugin)
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['calls'] += 1
+
+        for counter, amount in counters.items():
+            entry[counter] = entry.get(counter, 0) + amount
+
+    def count(self, name, counter, amount=1, plugin=None):
+        '''
+        Add amount to a counter of a phase.
+
+        '''
+
+        entry = self.entry(name, plugin)
+        entry[counter] = entry.get(counter, 0) + amount
+
+    def to_dict(self):
+        '''
+        Returns the recorded stats, with per second rates for the counters in
+        RATES, as a dictionary ready to be serialized to JSON.
+
+        '''
+
+        def with_rates(entry):
+            entry = collections.OrderedDict(entry)
+
+            for counter in RATES:
+                if counter in entry:
+                    entry[counter + '_per_s'] = entry[counter] / entry['wall'] if entry['wall'] else None
+
+            return entry
+
+        return collections.OrderedDict([
+            ('started', self.started.isoformat()),
+            ('wall', time.perf_counter() - self.start_wall),
+            ('cpu', time.process_time() - self.start_cpu),
+            ('phases', collections.OrderedDict(
+                (name, with_rates(entry)) for name, entry in self.phases.items())),
+            ('plugins', collections.OrderedDict(
+                (plugin, collections.OrderedDict(
+                    (name, with_rates(entry)) for name, entry in phases.items()))
+                for plugin, phases in self.plugins.items())),
+        ])
+
+    def save(self, path):
+        '''
+        Write the recorded stats to a JSON file.
+
+        '''
+
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
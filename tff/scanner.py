@@ -0,0 +1,221 @@
+import collections
+import hashlib
+import multiprocessing
+import os
+import sys
+
+from .endpoints import Endpoint, EndpointMatcher
+from .matcher import TOKEN_DELIMITERS, MatcherGroup, build_matcher
+from .patterns import Pattern, PatternMatcher
+
+# scanner shared by every task run in a scanning worker process
+_worker_scanner = None
+
+class FeatureScanner:
+    '''
+    Searches tcp flows for the features of one or more feature types at once.
+
+    The features of every feature type are merged into a single matcher, with
+    each feature tagged by the feature types that supplied it.  A flow is
+    therefore read once no matter how many feature types are being searched for,
+    and the hits are split back out per feature type afterwards.  Features that
+    are tff.patterns.Pattern objects are likewise combined into a single
+    PatternMatcher, searched after the literal features.  It reports every
+    match of each pattern, even where the match of another pattern overlaps
+    it, so the hits of a feature type are the same whichever other feature
+    types are scanned with it.
+
+    Feature types can be given their own matching engine with engines.  The
+    feature types of each engine share a matcher, and flows are read once per
+    engine.
+
+    Features that are tff.endpoints.Endpoint objects are matched against the
+    endpoints in the name of each flow, before any data is read.  Flows are
+    not opened at all for feature types without any other features.
+
+    Arguments:
+        feature_sets - ordered mapping of { feature_type : [features] }, where
+            each feature is a string or a Pattern
+        engine - name of the matching engine, see tff.matcher.ENGINES
+        binary - search the raw bytes of memory mapped flows and record exact
+            byte offsets, rather than reading flows line by line as text
+        cache - FeatureCache to load the compiled matcher from, and save it to
+            when it has to be built, or None to always build it
+        context_bytes - if not 0, capture up to this many bytes on either side
+            of each hit, see tff.tcp_flow.Hit
+        engines - dictionary of the form { feature_type : engine } for feature
+            types matched with an engine other than engine
+        delimiters - token delimiters of the token engine, see
+            tff.matcher.TokenMatcher
+
+    '''
+
+    def __init__(self, feature_sets, engine='aho_corasick', binary=True, cache=None,
+            context_bytes=0, engines=None, delimiters=TOKEN_DELIMITERS):
+        self.feature_types = list(feature_sets)
+        self.context_bytes = context_bytes
+        self.delimiters = delimiters
+        self.groups = []
+        self.endpoint_tags = collections.OrderedDict()
+
+        engine_sets = collections.OrderedDict()
+
+        for feature_type, features in feature_sets.items():
+            type_engine = (engines or {}).get(feature_type, engine)
+            engine_sets.setdefault(type_engine, collections.OrderedDict())[feature_type] = features
+
+        for type_engine, type_sets in engine_sets.items():
+            tags = collections.OrderedDict()
+
+            for feature_type, features in type_sets.items():
+                for feature in features:
+                    if not feature:
+                        continue
+
+                    if isinstance(feature, Endpoint):
+                        feature_tags = self.endpoint_tags.setdefault(feature, [])
+                    else:
+                        feature_tags = tags.setdefault(feature, [])
+
+                    if feature_type not in feature_tags:
+                        feature_tags.append(feature_type)
+
+            if tags:
+                matcher = self.__build_matcher(tags, type_engine, binary, cache)
+                self.groups.append((list(type_sets), tags, matcher))
+
+        self.endpoints = EndpointMatcher(self.endpoint_tags) if self.endpoint_tags else None
+
+    def __build_matcher(self, tags, engine, binary, cache):
+        literals = [feature for feature in tags if not isinstance(feature, Pattern)]
+        patterns = [feature for feature in tags if isinstance(feature, Pattern)]
+
+        # an empty literal matcher would still walk every byte of every flow
+        if not literals:
+            return PatternMatcher(patterns, binary)
+
+        matcher = self.__build_literal_matcher(literals, engine, binary, cache)
+
+        # patterns compile quickly, so only the literal matcher is worth caching
+        if patterns:
+            matcher = MatcherGroup([matcher, PatternMatcher(patterns, binary)])
+
+        return matcher
+
+    def __build_literal_matcher(self, literals, engine, binary, cache):
+        options = {}
+
+        if engine == 'token':
+            options['delimiters'] = self.delimiters
+
+        if cache is None:
+            return build_matcher(literals, engine, binary, **options)
+
+        digest = hashlib.sha1('\n'.join(literals).encode('utf-8', 'surrogateescape'))
+        key = cache.key('matcher', engine, binary, digest.hexdigest(),
+                    *sorted(options.items()))
+        matcher = cache.get(key)
+
+        if matcher is None:
+            matcher = build_matcher(literals, engine, binary, **options)
+            cache.put(key, matcher)
+
+        return matcher
+
+    def scan(self, tcp_flow):
+        '''
+        Search a tcp flow for all features and store the hits per feature type.
+
+        After scanning, tcp_flow.get_found_features() holds an entry for every
+        feature type of the scanner, even if nothing was found.
+
+        Arguments:
+            tcp_flow - TcpFlow object to search
+
+        '''
+
+        found_features = tcp_flow.get_found_features()
+
+        for feature_type in self.feature_types:
+            found_features[feature_type] = {}
+
+        for (feature_types, tags, matcher) in self.groups:
+            tcp_flow.find_tagged_features(feature_types, tags, matcher, self.context_bytes)
+
+        if self.endpoints is not None:
+            # hits of an Endpoint are positioned at the fields it matched
+            for (endpoint, fields) in self.endpoints.match(tcp_flow).items():
+                for feature_type in self.endpoint_tags[endpoint]:
+                    found_features[feature_type][endpoint] = list(fields)
+
+def _init_worker(scanner):
+    '''
+    Store the scanner handed to a worker process when the pool starts, so that
+    its matcher is transferred once per worker instead of once per task.
+
+    '''
+
+    global _worker_scanner
+    _worker_scanner = scanner
+
+def _scan_batch(tcp_flows):
+    for tcp_flow in tcp_flows:
+        _worker_scanner.scan(tcp_flow)
+
+    return tcp_flows
+
+def scan_flows(scanner, tcp_flows, workers=1, batch_size=16):
+    '''
+    Scan tcp flows, yielding each flow once its found features are available.
+
+    With more than one worker, batches of flows are scanned by a pool of worker
+    processes and the scanned flows are yielded back in their original order.
+    Only a bounded number of batches is in flight at any time, so tcp_flows may be
+    a lazy iterable.
+
+    Arguments:
+        scanner - FeatureScanner to search the flows with
+        tcp_flows - iterable of TcpFlow objects
+        workers - number of worker processes to scan with
+        batch_size - number of flows sent to a worker per task
+
+    Returns:
+        generator of scanned TcpFlow objects.  With workers the yielded objects
+            are copies of the ones passed in.
+
+    '''
+
+    if workers <= 1:
+        for tcp_flow in tcp_flows:
+            scanner.scan(tcp_flow)
+            yield tcp_flow
+        return
+
+    pool = multiprocessing.Pool(workers, _init_worker, (scanner,))
+
+    try:
+        pending = collections.deque()
+        batch = []
+
+        for tcp_flow in tcp_flows:
+            batch.append(tcp_flow)
+
+            if len(batch) >= batch_size:
+                pending.append(pool.apply_async(_scan_batch, (batch,)))
+                batch = []
+
+            while len(pending) >= workers * 2:
+                for scanned_flow in pending.popleft().get():
+                    yield scanned_flow
+
+        if batch:
+            pending.append(pool.apply_async(_scan_batch, (batch,)))
+
+        while pending:
+            for scanned_flow in pending.popleft().get():
+                yield scanned_flow
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
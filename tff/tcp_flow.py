@@ -1,6 +1,139 @@
+import array
+import calendar
+import collections
+import contextlib
+import datetime
+import ipaddress
+import mmap
 import os
+import re
 import sys
 
+from .matcher import build_matcher
+
+# tcpflow names its output [<timestamp>]<src ip>.<src port>-<dst ip>.<dst port>
+# followed by --<vlan> when the flow is VLAN tagged, and c<n> for the nth reuse of
+# the same addresses and ports.  The timestamp is <unix time>T with -Ft, or an
+# ISO 8601 time such as 2013-03-11T01:14:00Z with -FT.  IPv4 addresses are zero
+# padded, IPv6 addresses are written with colons.  IPv6 addresses are rare and
+# too loose to validate with a regular expression, so parse_flow_name checks
+# them with ipaddress.
+_IPV4_OCTET = r'(?:25[0-5]|2[0-4]\d|[01]?\d?\d)'
+_ADDRESS = r'((?:{0}\.){{3}}{0}|[0-9a-fA-F:.]*:[0-9a-fA-F:.]*)'.format(_IPV4_OCTET)
+_FLOW_NAME = re.compile(r'''
+    (?:(\d+)T|(\d{{4}}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d))?
+    {0}\.(\d{{1,5}})
+    -
+    {0}\.(\d{{1,5}})
+    (?:--(\d+))?
+    (?:c(\d+))?
+    \Z'''.format(_ADDRESS), re.VERBOSE)
+
+FlowName = collections.namedtuple('FlowName', ['source_ip', 'source_port', 'dest_ip',
+                'dest_port', 'vlan', 'connection_number', 'timestamp'])
+
+def parse_flow_name(filename):
+    '''
+    Parse a tcpflow output file name.
+
+    Arguments:
+        filename - base name of a tcpflow output file
+
+    Returns:
+        FlowName tuple.  Ports and connection number are integers, vlan and
+            timestamp are integers or None when not part of the name.
+
+    Raises:
+        ValueError if filename is not a tcpflow file name
+
+    '''
+
+    match = _FLOW_NAME.match(filename)
+
+    if match is None:
+        raise ValueError("Invalid tcp flow file name '{}'".format(filename))
+
+    (timestamp, iso_time, utc_offset, source_ip, source_port, dest_ip, dest_port, vlan,
+        connection_number) = match.groups()
+
+    source_port = int(source_port)
+    dest_port = int(dest_port)
+
+    if (source_port > 65535 or dest_port > 65535
+            or not (_valid_ipv6(source_ip) and _valid_ipv6(dest_ip))):
+        raise ValueError("Invalid tcp flow file name '{}'".format(filename))
+
+    if timestamp is not None:
+        timestamp = int(timestamp)
+    elif iso_time is not None:
+        timestamp = _parse_iso_time(filename, iso_time, utc_offset)
+
+    return FlowName(sys.intern(source_ip), source_port, sys.intern(dest_ip), dest_port,
+                None if vlan is None else int(vlan),
+                0 if connection_number is None else int(connection_number),
+                timestamp)
+
+def _parse_iso_time(filename, iso_time, utc_offset):
+    '''
+    Returns the unix time of the ISO 8601 timestamp of a flow name matched by
+    _FLOW_NAME, in whole seconds.
+
+    '''
+
+    try:
+        when = datetime.datetime.strptime(iso_time, '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        raise ValueError("Invalid tcp flow file name '{}'".format(filename))
+
+    seconds = calendar.timegm(when.utctimetuple())
+
+    if utc_offset != 'Z':
+        offset = int(utc_offset[1:3]) * 3600 + int(utc_offset[-2:]) * 60
+        seconds -= offset if utc_offset[0] == '+' else -offset
+
+    return seconds
+
+def _valid_ipv6(address):
+    '''
+    Returns whether an address matched by _FLOW_NAME is valid, which only
+    needs checking for IPv6 addresses.
+
+    '''
+
+    if ':' not in address:
+        return True
+
+    try:
+        ipaddress.IPv6Address(address)
+    except ValueError:
+        return False
+
+    return True
+
+class Hit(int):
+    '''
+    Offset of a found feature that carries the bytes of the flow around it.
+
+    A Hit behaves exactly like the int offset it stands for, so plugins that do
+    not look at the context need not know about it.
+
+    Attributes:
+        context - bytes from up to context_bytes before the feature to up to
+            context_bytes after it.  In text read mode a feature has one Hit per
+            line, positioned at the start of the line like any other text read
+            mode position, and the window is taken from around the first
+            occurrence of the feature on the line.
+
+    '''
+
+    def __new__(cls, offset, context):
+        hit = int.__new__(cls, offset)
+        hit.context = context
+        return hit
+
+    def __reduce__(self):
+        return (Hit, (int(self), self.context))
+
 class TcpFlow:
     '''
     Object to search a given tcp flow for a list of features.
@@ -8,14 +141,39 @@ class TcpFlow:
     Stores information about the flow as well as searches for features and stores
     any found features with 
 
+    Flows are created by the million, so attributes are kept in __slots__, IPs
+    are interned and ports, VLAN, timestamp and connection number are integers.
+
     '''
 
-    def __init__(self, path):
+    __slots__ = ('path', 'filename', 'source_ip', 'source_port', 'dest_ip',
+                 'dest_port', 'vlan', 'timestamp', 'connection_number', 'size',
+                 'mtime', 'found_features')
+
+    # flows held in memory rather than read from a tcpflow file, see tff.pcap
+    in_memory = False
+
+    def __init__(self, path, size=None, mtime=None):
+        '''
+        Arguments:
+            path - path to the tcp flow file
+            size, mtime - size and modification time of the file, if already
+                known.  Otherwise the file is stat()ed.
+
+        '''
+
         self.path = path
-        self.search_features = []
         self.found_features = {}
         self.__parse_file_name()
 
+        if size is None or mtime is None:
+            stat = os.stat(path)
+            size = stat.st_size
+            mtime = stat.st_mtime
+
+        self.size = size
+        self.mtime = mtime
+
     def __parse_file_name(self):
         '''
         Parse the filename for information about the tcp flow
@@ -23,67 +181,307 @@ class TcpFlow:
         '''
 
         self.filename = os.path.basename(self.path)
-        working = self.filename
-
-        # Extract timestamp, if present
-        if "T" in working:
-            split = working.split("T")
-            self.timestamp = split[0]
-            working = split[1]
-        else:
-            self.timestamp = None
-
-        # Extract connection number, if present
-        if "c" in working:
-            split = working.split("c")
-            self.connection_number = split[1] 
-            working = split[0]
-        else:
-            self.connection_number = 0
-
-        # Extract VLAN if present
-        if "--" in working:
-            split = working.split("--")
-            self.vlan = split[1]
-            working = split[0]
-        else:
-            self.vlan = None
-            
-        splits = working.split('-')
-        source = splits[0].rsplit('.', 1)
-        dest = splits[1].rsplit('.', 1)
-
-        self.source_ip = source[0]
-        self.source_port = source[1]
-        self.dest_ip = dest[0]
-        self.dest_port = dest[1]
-
-    def find_features(self, feature_type, search_features):
+
+        (self.source_ip, self.source_port, self.dest_ip, self.dest_port, self.vlan,
+            self.connection_number, self.timestamp) = parse_flow_name(self.filename)
+
+    def find_features(self, feature_type, search_features, matcher=None, context_bytes=0):
         '''
         Search for designated features within the tcp flow file and save the 
         position of the line containg that feature in found_features
 
+        If a binary matcher is given, the byte offset of each occurrence of a
+        feature is saved instead of the position of its line.
+
+        Arguments:
+            feature_type - name the found features are stored under
+            search_features - list of feature strings to search for
+            matcher - optional prebuilt Matcher for search_features.  Building
+                the matcher once and passing it in avoids rebuilding it for
+                every flow.
+            context_bytes - if not 0, save each position as a Hit holding up to
+                this many bytes of context on either side of the feature
+
+        '''
+
+        if matcher is None:
+            matcher = build_matcher(search_features)
+
+        self.found_features[feature_type] = self.__search(matcher, context_bytes)
+
+    def find_tagged_features(self, feature_types, tags, matcher, context_bytes=0):
         '''
+        Search for the features of several feature types in one read of the tcp
+        flow file and save the found features per feature type.
+
+        Arguments:
+            feature_types - list of feature types being searched for
+            tags - dictionary of the form { feature : [feature_type] }, where a
+                feature is a string or a tff.patterns.Pattern
+            matcher - prebuilt Matcher for every feature in tags
+            context_bytes - if not 0, save each position as a Hit holding up to
+                this many bytes of context on either side of the feature
+
+        '''
+
+        for feature_type in feature_types:
+            self.found_features[feature_type] = {}
+
+        for feature, positions in self.__search(matcher, context_bytes).items():
+            # hits of a pattern are tagged through the pattern that matched
+            for feature_type in tags[getattr(feature, 'pattern', feature)]:
+                self.found_features[feature_type][feature] = list(positions)
+
+    def __search(self, matcher, context_bytes=0):
+        '''
+        Read the tcp flow file once and record where each feature was found.
+
+        Binary matchers search the raw bytes of the memory mapped file and record
+        the byte offset of every occurrence of a feature.  Other matchers search
+        the file line by line and record the position of each line that contains
+        a feature.  The context of each hit is captured while the data is at
+        hand, so filtering on it later needs no further reads.
+
+        Returns:
+            dictionary of the form { feature : [file_offset] }, where the
+                offsets are Hits if context_bytes is not 0
+
+        '''
+
+        if matcher.binary:
+            return self.__search_bytes(matcher, context_bytes)
+
+        return self.__search_lines(matcher, context_bytes)
+
+    def __search_bytes(self, matcher, context_bytes):
+        found = {}
+        lengths = {}
+
+        with self.open_bytes() as data:
+            for (feature, position) in matcher.find_offsets(data):
+                if feature not in found:
+                    found[feature] = []
+
+                if context_bytes:
+                    if feature not in lengths:
+                        lengths[feature] = len(feature.encode('utf-8', 'surrogateescape'))
+
+                    position = Hit(position, bytes(data[max(0, position - context_bytes):
+                                    position + lengths[feature] + context_bytes]))
+
+                found[feature].append(position)
 
+        return found
+
+    def __search_lines(self, matcher, context_bytes):
         found = {}
+        position = 0
+
+        with self.open_text() as f:
+            for line in f:
+                text = line.decode('utf-8', 'surrogateescape')
 
-        with open(self.path, 'r') as f:
-            while(True):
-                try:
-                    position = f.tell()
-                    line = f.readline()
-                except UnicodeDecodeError as e:
-                    continue
-                if not line:
-                    break
-
-                for feature in search_features:
-                    if feature in line:
+                if not context_bytes:
+                    for feature in matcher.search(text):
                         if feature not in found:
                             found[feature] = []
+
                         found[feature].append(position)
+                else:
+                    seen = set()
+
+                    for (feature, index) in matcher.find_offsets(text):
+                        # a line is recorded once per feature, as without context
+                        if feature in seen:
+                            continue
+
+                        seen.add(feature)
+
+                        if feature not in found:
+                            found[feature] = []
+
+                        # the window is cut from the raw bytes of the line
+                        start = len(text[:index].encode('utf-8', 'surrogateescape'))
+                        end = start + len(feature.encode('utf-8', 'surrogateescape'))
+                        found[feature].append(Hit(position,
+                            line[max(0, start - context_bytes):end + context_bytes]))
+
+                position += len(line)
+
+        return found
+
+    @contextlib.contextmanager
+    def open_bytes(self):
+        '''
+        Context manager giving the contents of the tcp flow as a bytes-like
+        object.  The tcp flow file is memory mapped rather than read.
+
+        '''
+
+        with open(self.path, 'rb') as f:
+            # empty files cannot be memory mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b''
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    def open_text(self):
+        '''
+        Open the tcp flow to be read line by line.
 
-        self.found_features[feature_type] = found
+        The flow is opened in binary mode, so the position of each line is the
+        sum of the lengths of the lines before it, whatever the flow holds.
+        Lines are decoded for searching with undecodable bytes kept as
+        surrogates, so binary content does not stop the read.
+
+        Returns:
+            binary file object
+        '''
+
+        return open(self.path, 'rb')
 
     def get_found_features(self):
         return self.found_features
+
+    def clear_found_features(self):
+        '''
+        Drop the found features once they have been saved to the database.
+
+        '''
+
+        self.found_features = {}
+
+class FlowCatalog:
+    '''
+    Columnar store of tcp flow metadata.
+
+    Keeps flows that have to be revisited later in the run without keeping a
+    TcpFlow object per flow.  Sizes and modification times are held in arrays
+    rather than as a Python object per value.
+
+    '''
+
+    def __init__(self):
+        self.paths = []
+        self.sizes = array.array('q')
+        self.mtimes = array.array('d')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def append(self, tcp_flow):
+        self.paths.append(tcp_flow.path)
+        self.sizes.append(tcp_flow.size)
+        self.mtimes.append(tcp_flow.mtime)
+
+    def total_size(self):
+        '''
+        Returns the combined size in bytes of the flows in the catalog.
+
+        '''
+
+        return sum(self.sizes)
+
+    def iter_flows(self):
+        '''
+        Recreate the flows in the catalog one at a time, without stat()ing them
+        again.
+
+        Returns:
+            generator of TcpFlow objects
+
+        '''
+
+        for (path, size, mtime) in zip(self.paths, self.sizes, self.mtimes):
+            yield TcpFlow(path, size, mtime)
+
+def iter_tcp_flows(directory, recursive=False):
+    '''
+    Lazily find the tcp flows in a tcpflow output directory.
+
+    Arguments:
+        directory - path to the tcpflow output directory
+        recursive - also search subdirectories.  Symbolic links to directories
+            are not followed.
+
+    Returns:
+        generator of TcpFlow objects
+
+    Raises:
+        ValueError if flows in different subdirectories have the same file
+            name.  Flows are identified by their file name in the database,
+            the exported flows and the reports, so they would overwrite each
+            other.
+    '''
+
+    # a single directory cannot hold two files with the same name
+    names = set() if recursive else None
+
+    for direntry in _iter_flow_files(directory, recursive):
+        try:
+            # the DirEntry caches its stat, and already holds it if is_file()
+            # had to stat the file, so flows are never stat()ed twice
+            stat = direntry.stat()
+            tcp_flow = TcpFlow(direntry.path, stat.st_size, stat.st_mtime)
+        except ValueError as e:
+            print('[-] Skipping {}: {}'.format(direntry.path, e))
+            continue
+
+        if names is not None:
+            if tcp_flow.filename in names:
+                raise ValueError("Tcp flow {} has the same file name as a flow in another "
+                                 "subdirectory.  Flows are identified by file name, so "
+                                 "merged tcpflow output directories must not share flow "
+                                 "names.".format(direntry.path))
+
+            names.add(tcp_flow.filename)
+
+        yield tcp_flow
+
+def count_tcp_flows(directory, recursive=False):
+    '''
+    Count the tcp flows iter_tcp_flows would find and their combined size.
+
+    Flows are only parsed from their names, not opened, so this is cheaper
+    than finding the flows, but still stat()s every flow for its size.
+
+    Returns:
+        (number of tcp flows, combined size in bytes) tuple
+
+    '''
+
+    count = 0
+    size = 0
+
+    for direntry in _iter_flow_files(directory, recursive):
+        try:
+            parse_flow_name(direntry.name)
+            size += direntry.stat().st_size
+        except (ValueError, FileNotFoundError):
+            continue
+
+        count += 1
+
+    return (count, size)
+
+def _iter_flow_files(directory, recursive):
+    '''
+    Yields the DirEntry of every file in directory that may be a tcp flow.
+
+    '''
+
+    directories = [directory]
+
+    while directories:
+        for direntry in os.scandir(directories.pop()):
+            if direntry.is_dir(follow_symlinks=False):
+                if recursive:
+                    directories.append(direntry.path)
+                continue
+
+            if 'report.xml' in direntry.name or not direntry.is_file():
+                continue
+
+            yield direntry